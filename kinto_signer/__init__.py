@@ -29,16 +29,27 @@ def get_exposed_resources(resource_dict, review_settings):
 
 
 def on_review_approved(event):
-    statsd_client = event.request.registry.statsd
-    if statsd_client is not None:
+    metrics = event.request.registry.signer_metrics
+    if metrics is not None:
         count = event.changes_count
         bid = event.resource["destination"]["bucket"]
         cid = event.resource["destination"]["collection"]
-        # Report into a global counter.
-        statsd_client.count("plugins.signer.approved_changes", count)
-        # Report for this collection.
-        # TODO: when using Datadog, we could annotate the above with tags instead.
-        statsd_client.count(f"plugins.signer.approved_changes.{bid}.{cid}", count)
+        # Report into a global counter (annotated with the collection if supported).
+        metrics.count("approved_changes", count, tags={"bucket": bid, "collection": cid})
+        if not metrics.tagged:
+            # Report for this collection.
+            metrics.count(f"approved_changes.{bid}.{cid}", count)
+
+
+def timed_listener(statsd_client, key, listener):
+    """If StatsD is enabled, monitor execution time of listener."""
+    if not statsd_client:
+        return listener
+    # Due to https://github.com/jsocol/pystatsd/issues/85
+    for attr in ("__module__", "__name__"):
+        origin = getattr(listener.func, attr)
+        setattr(listener, attr, origin)
+    return statsd_client.timer(key)(listener)
 
 
 def includeme(config):
@@ -48,9 +59,14 @@ def includeme(config):
     from kinto.core.events import ACTIONS, ResourceChanged
     from pyramid.exceptions import ConfigurationError
     from pyramid.events import NewRequest
-    from pyramid.settings import asbool
+    from pyramid.tweens import INGRESS
+    from pyramid.settings import asbool, aslist
 
     from kinto_signer.signer import heartbeat
+    from kinto_signer import metrics
+    from kinto_signer import profiling
+    from kinto_signer import serializer
+    from kinto_signer import singleflight
     from kinto_signer import utils
     from kinto_signer import listeners
 
@@ -66,6 +82,37 @@ def includeme(config):
         raise ConfigurationError(error_msg)
     resources = utils.parse_resources(raw_resources)
 
+    # Metrics of the review transitions, with tags if supported by the StatsD server.
+    config.registry.signer_metrics = metrics.load_from_settings(settings, config.registry.statsd)
+
+    # Last signer operations, exposed to the specified principals for debugging.
+    operations_size = int(
+        settings.get("signer.recent_operations_size", metrics.DEFAULT_RECENT_OPERATIONS_SIZE)
+    )
+    config.registry.signer_operations = metrics.RecentOperations(operations_size)
+    config.registry.signer_operations_principals = set(
+        aslist(settings.get("signer.operations_principals", ""))
+    )
+    config.scan("kinto_signer.views")
+
+    # Profiles of the review transitions (disabled if no directory is set).
+    config.registry.signer_profiler = profiling.load_from_settings(settings)
+
+    # Size of the cache of serialized records (0 to disable).
+    cache_size = int(settings.get("signer.serializer_cache_size", serializer.DEFAULT_CACHE_SIZE))
+    config.registry.signer_records_cache = serializer.RecordsCache(cache_size)
+
+    # Coalesce concurrent signatures of the same content, within the process and
+    # across processes using the cache backend.
+    single_flight = None
+    if asbool(settings.get("signer.single_flight_enabled", False)):
+        lease_seconds = int(
+            settings.get("signer.single_flight_lease_seconds", singleflight.DEFAULT_LEASE_SECONDS)
+        )
+        single_flight = singleflight.SingleFlight(
+            cache=config.registry.cache, lease_seconds=lease_seconds
+        )
+
     # Expand the resources with the ones that come from per-bucket resources
     # and have specific settings.
     # For example, consider the case where resource is ``/buckets/dev -> /buckets/prod``
@@ -164,6 +211,10 @@ def includeme(config):
             else:
                 resource.pop(setting, None)
 
+    # Index the resources and their signers, so that listeners can resolve the
+    # resource of any collection with a dictionary lookup.
+    resources = utils.ResourcesIndex(resources, config.registry.signers)
+
     # Expose the capabilities in the root endpoint.
     exposed_resources = get_exposed_resources(resources, listeners.REVIEW_SETTINGS)
     message = "Digital signatures for integrity and authenticity of records."
@@ -177,32 +228,51 @@ def includeme(config):
         **global_settings,
     )
 
+    def timed(func, **kwargs):
+        listener = functools.partial(func, **kwargs)
+        key = f"plugins.signer.listeners.{func.__name__}"
+        return timed_listener(config.registry.statsd, key, listener)
+
     config.add_subscriber(on_review_approved, ReviewApproved)
 
+    # Do not rewrite the work-in-progress status of collections edited by the same user
+    # during this amount of seconds (0 to disable).
+    debounce_seconds = int(settings.get("signer.work_in_progress_debounce_seconds", 0))
     config.add_subscriber(
-        functools.partial(listeners.set_work_in_progress_status, resources=resources),
+        timed(
+            listeners.set_work_in_progress_status,
+            resources=resources,
+            debounce_seconds=debounce_seconds,
+        ),
         ResourceChanged,
         for_resources=("record",),
     )
 
+    allow_floats = asbool(settings.get("signer.allow_floats", False))
+
     config.add_subscriber(
-        functools.partial(
-            listeners.check_collection_status, resources=resources, **global_settings
-        ),
+        timed(listeners.end_bulk_import, resources=resources, check_floats=not allow_floats),
+        ResourceChanged,
+        for_actions=(ACTIONS.UPDATE,),
+        for_resources=("collection",),
+    )
+
+    config.add_subscriber(
+        timed(listeners.check_collection_status, resources=resources, **global_settings),
         ResourceChanged,
         for_actions=(ACTIONS.CREATE, ACTIONS.UPDATE),
         for_resources=("collection",),
     )
 
     config.add_subscriber(
-        functools.partial(listeners.check_collection_tracking, resources=resources),
+        timed(listeners.check_collection_tracking, resources=resources),
         ResourceChanged,
         for_actions=(ACTIONS.CREATE, ACTIONS.UPDATE),
         for_resources=("collection",),
     )
 
     config.add_subscriber(
-        functools.partial(
+        timed(
             listeners.create_editors_reviewers_groups,
             resources=resources,
             editors_group=global_settings["editors_group"],
@@ -214,41 +284,45 @@ def includeme(config):
     )
 
     config.add_subscriber(
-        functools.partial(listeners.cleanup_preview_destination, resources=resources),
+        timed(listeners.cleanup_preview_destination, resources=resources),
         ResourceChanged,
         for_actions=(ACTIONS.DELETE,),
         for_resources=("collection",),
     )
 
     config.add_subscriber(
-        functools.partial(listeners.prevent_collection_delete, resources=resources),
+        timed(listeners.prevent_collection_delete, resources=resources),
         ResourceChanged,
         for_actions=(ACTIONS.DELETE,),
         for_resources=("collection",),
     )
 
-    if not asbool(settings.get("signer.allow_floats", False)):
+    if not allow_floats:
         config.add_subscriber(
-            functools.partial(listeners.prevent_float_value, resources=resources),
+            timed(
+                listeners.prevent_float_value,
+                resources=resources,
+                raw_body_check=asbool(settings.get("signer.float_check_raw_body", False)),
+            ),
             ResourceChanged,
             for_actions=(ACTIONS.CREATE, ACTIONS.UPDATE),
             for_resources=("record",),
         )
 
-    sign_data_listener = functools.partial(
-        listeners.sign_collection_data, resources=resources, **global_settings
-    )
-
-    # If StatsD is enabled, monitor execution time of listener.
-    if config.registry.statsd:
-        # Due to https://github.com/jsocol/pystatsd/issues/85
-        for attr in ("__module__", "__name__"):
-            origin = getattr(listeners.sign_collection_data, attr)
-            setattr(sign_data_listener, attr, origin)
+    # Compare collections page by page, with the specified page size (0 to disable).
+    streaming_page_size = int(settings.get("signer.streaming_diff_page_size", 0))
 
-        statsd_client = config.registry.statsd
-        key = "plugins.signer"
-        sign_data_listener = statsd_client.timer(key)(sign_data_listener)
+    sign_data_listener = timed_listener(
+        config.registry.statsd,
+        "plugins.signer",
+        functools.partial(
+            listeners.sign_collection_data,
+            resources=resources,
+            streaming_page_size=streaming_page_size,
+            single_flight=single_flight,
+            **global_settings,
+        ),
+    )
 
     config.add_subscriber(
         sign_data_listener,
@@ -257,6 +331,24 @@ def includeme(config):
         for_resources=("collection",),
     )
 
+    # Sign collections in background workers (disabled by default).
+    config.registry.signer_jobs = None
+    if asbool(settings.get("signer.async_enabled", False)):
+        from kinto_signer import jobs
+
+        workers = int(settings.get("signer.async_workers", jobs.DEFAULT_WORKERS))
+        requeue_seconds = float(
+            settings.get("signer.async_requeue_seconds", jobs.DEFAULT_REQUEUE_SECONDS)
+        )
+        config.registry.signer_jobs = jobs.SigningJobs(
+            config.registry,
+            resources,
+            workers,
+            requeue_seconds,
+            streaming_page_size=streaming_page_size,
+            single_flight=single_flight,
+        )
+
     def on_new_request(event):
         """Send the kinto-signer events in the before commit hook.
         This allows database operations done in subscribers to be automatically
@@ -265,7 +357,13 @@ def includeme(config):
         # Since there is one transaction per batch, ignore subrequests.
         if hasattr(event.request, "parent"):
             return
+        # Workers are started in the serving process (see ``SigningJobs.start()``).
+        if event.request.registry.signer_jobs is not None:
+            event.request.registry.signer_jobs.start()
         current = transaction.get()
         current.addBeforeCommitHook(listeners.send_signer_events, args=(event,))
 
     config.add_subscriber(on_new_request, NewRequest)
+
+    # Expose the timings of the signer operations in responses and logs.
+    config.add_tween("kinto_signer.metrics.server_timing_tween_factory", under=INGRESS)
@@ -0,0 +1,45 @@
+from kinto_signer.utils import records_equal
+
+
+def iter_records_diff(left_pages, right_range):
+    """Compare the records of two collections page by page, consuming them
+    progressively.
+
+    Each page of left records is compared with the right records of the same
+    range of ids. Since ranges are delimited by the storage backend, the
+    comparison does not depend on how ids are ordered (eg. database collation
+    that differs from Python ordering).
+
+    Yields a ``(left_record, right_record)`` tuple for every record that is
+    only in left (``right_record`` is ``None``), only in right (``left_record``
+    is ``None``), or that differs between both sides.
+
+    :param left_pages: iterable of the pages of left records, sorted by id
+        by the storage backend.
+    :param right_range: function that returns an iterable of the pages of
+        right records whose id is after ``after`` and up to ``up_to`` (in the
+        storage order, ``None`` meaning unbounded).
+    """
+    after = None
+    left_pages = iter(left_pages)
+    page = next(left_pages, [])
+    while page is not None:
+        next_page = next(left_pages, None)
+        # The last page covers all the remaining ids.
+        up_to = page[-1]["id"] if page and next_page is not None else None
+
+        left_by_id = {r["id"]: r for r in page}
+        for right_page in right_range(after, up_to):
+            for right_record in right_page:
+                left_record = left_by_id.pop(right_record["id"], None)
+                if left_record is None:
+                    # In right, but not in left.
+                    yield None, right_record
+                elif not records_equal(left_record, right_record):
+                    yield left_record, right_record
+        for left_record in left_by_id.values():
+            # In left, but not in right.
+            yield left_record, None
+
+        after = up_to
+        page = next_page
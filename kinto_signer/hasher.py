@@ -7,3 +7,15 @@ def compute_hash(string):
     h.update(string.encode("utf-8"))
     b64hash = base64.b64encode(h.digest())
     return b64hash.decode("utf-8")
+
+
+def compute_digest(chunks):
+    """Compute the SHA-384 digest of the specified bytes chunks, without
+    concatenating them in memory.
+
+    :rtype: bytes
+    """
+    h = hashlib.new("sha384")
+    for chunk in chunks:
+        h.update(chunk)
+    return h.digest()
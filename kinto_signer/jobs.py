@@ -0,0 +1,306 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+
+import transaction
+from kinto.core.events import ACTIONS
+from kinto.core.storage.exceptions import ObjectNotFoundError
+from kinto.core.utils import instance_uri
+from pyramid.events import NewRequest
+from pyramid.request import Request, apply_request_extensions
+
+from kinto_signer import events as signer_events
+from kinto_signer import listeners
+from kinto_signer.updater import LocalUpdater
+from kinto_signer.utils import STATUS
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Storage resource name of the pending signing jobs.
+JOB_RESOURCE_NAME = "signer-job"
+
+#: Source collections metadata field where signing failures are recorded.
+ERROR_FIELD = "last_signing_error"
+
+DEFAULT_WORKERS = 1
+
+DEFAULT_REQUEUE_SECONDS = 60
+
+
+class SigningJobs(object):
+    """Queue of signing jobs, applied by a pool of worker threads.
+
+    Jobs are stored in the Kinto storage backend within the transaction of the
+    request that created them, and handed to the workers once it is committed.
+    Jobs that are still pending in the storage (eg. lost by a process that
+    died, or after a restart) are picked up again when the workers start, and
+    then periodically.
+
+    A job is claimed by deleting it from the storage, in the same transaction as
+    the signature, so that it is applied only once if several processes share
+    the storage backend.
+
+    :param registry: the application registry.
+    :param resources: the configured resources (see :class:`kinto_signer.utils.ResourcesIndex`).
+    :param int workers: number of worker threads.
+    :param float requeue_seconds: interval between the pick-ups of pending jobs.
+    :param int streaming_page_size: page size of the records comparisons (see
+        :class:`kinto_signer.updater.LocalUpdater`).
+    :param single_flight: coalesce the concurrent signatures of the same content (see
+        :class:`kinto_signer.singleflight.SingleFlight`).
+    """
+
+    def __init__(
+        self,
+        registry,
+        resources,
+        workers=DEFAULT_WORKERS,
+        requeue_seconds=DEFAULT_REQUEUE_SECONDS,
+        streaming_page_size=0,
+        single_flight=None,
+    ):
+        self.registry = registry
+        self.resources = resources
+        self.workers = workers
+        self.requeue_seconds = requeue_seconds
+        self.streaming_page_size = streaming_page_size
+        self.single_flight = single_flight
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def start(self):
+        """Start the workers, unless they were already started in the current process.
+
+        Threads are not inherited by forked processes (eg. servers that load the
+        application before forking), hence workers are started lazily, from the
+        process that serves the requests.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._threads = []
+            for i in range(self.workers):
+                # The first worker periodically picks up the pending jobs.
+                thread = threading.Thread(target=self._work, args=(i == 0,), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(None)  # Pick up the pending jobs.
+
+    def join(self):
+        """Block until all queued jobs are applied."""
+        self._queue.join()
+
+    def enqueue(self, request, bucket_id, collection_id, status, previous_status):
+        """Store a signing job, applied once the current transaction is committed.
+
+        :param str status: the requested status (``to-sign`` or ``to-resign``).
+        :param str previous_status: the status before the request, restored on failure.
+        """
+        job = self.registry.storage.create(
+            resource_name=JOB_RESOURCE_NAME,
+            parent_id="",
+            obj={
+                "bucket_id": bucket_id,
+                "collection_id": collection_id,
+                "status": status,
+                "previous_status": previous_status,
+                "user_id": request.prefixed_userid,
+            },
+        )
+        current = transaction.get()
+        current.addAfterCommitHook(self._on_commit, args=(job["id"],))
+        return job
+
+    def _on_commit(self, success, job_id):
+        if success:
+            self.start()
+            self._queue.put(job_id)
+
+    def _work(self, requeue=False):
+        while True:
+            try:
+                job_id = self._queue.get(timeout=self.requeue_seconds if requeue else None)
+            except queue.Empty:
+                self._queue.put(None)  # Pick up the pending jobs.
+                continue
+            try:
+                if job_id is None:
+                    self._queue_pending()
+                else:
+                    self.run(job_id)
+            except Exception:
+                logger.exception(f"Signing job {job_id} failed")
+            finally:
+                self._queue.task_done()
+
+    def _queue_pending(self):
+        with transaction.manager:
+            pending = self.registry.storage.list_all(resource_name=JOB_RESOURCE_NAME, parent_id="")
+        for job in pending:
+            self._queue.put(job["id"])
+
+    def _build_request(self, user_id):
+        """Build a request on behalf of the user who requested the signature."""
+        request = Request.blank(path=f"/{self.registry.route_prefix}/")
+        request.registry = self.registry
+        apply_request_extensions(request)
+        request.prefixed_userid = user_id
+        return request
+
+    def run(self, job_id):
+        """Apply the specified job, or record its failure in the collection metadata."""
+        with transaction.manager:
+            try:
+                job = self.registry.storage.get(
+                    resource_name=JOB_RESOURCE_NAME, parent_id="", object_id=job_id
+                )
+            except ObjectNotFoundError:
+                # Already applied by another worker.
+                return
+        try:
+            self._in_transaction(self._sign, job)
+        except Exception as e:
+            logger.exception(f"Could not sign {job['bucket_id']}/{job['collection_id']}")
+            self._in_transaction(self._fail, job, e)
+
+    def _in_transaction(self, func, job, *args):
+        """Run ``func`` in a transaction, and send the events like at the end of
+        requests (see ``includeme()``)."""
+        request = self._build_request(job["user_id"])
+        with transaction.manager:
+            func(request, job, *args)
+            transaction.get().addBeforeCommitHook(
+                listeners.send_signer_events, args=(NewRequest(request),)
+            )
+            for event in request.get_resource_events():
+                self.registry.notify(event)
+
+        for event in request.get_resource_events(after_commit=True):
+            try:
+                self.registry.notify(event)
+            except Exception:
+                logger.error("Unable to notify", exc_info=True)
+
+    def _claim(self, job):
+        try:
+            self.registry.storage.delete(
+                resource_name=JOB_RESOURCE_NAME, parent_id="", object_id=job["id"]
+            )
+        except ObjectNotFoundError:
+            return False
+        return True
+
+    def _get_collection(self, job):
+        return self.registry.storage.get(
+            resource_name="collection",
+            parent_id=f"/buckets/{job['bucket_id']}",
+            object_id=job["collection_id"],
+        )
+
+    def _updater(self, request, job):
+        resource, signer = listeners.pick_resource_and_signer(
+            request, self.resources, bucket_id=job["bucket_id"], collection_id=job["collection_id"]
+        )
+        if resource is None:
+            return None, None, None
+        updater = LocalUpdater(
+            signer=signer,
+            storage=self.registry.storage,
+            permission=self.registry.permission,
+            source=resource["source"],
+            destination=resource["destination"],
+            streaming_page_size=self.streaming_page_size,
+            single_flight=self.single_flight,
+            records_cache=self.registry.signer_records_cache,
+        )
+        return resource, signer, updater
+
+    def _sign(self, request, job):
+        if not self._claim(job):
+            # Already applied by another worker.
+            return
+        resource, signer, updater = self._updater(request, job)
+        if resource is None:
+            # Resource was removed from settings.
+            return
+        collection = self._get_collection(job)
+        if collection.get("status") != STATUS.SIGNING:
+            # Status was changed since the job was created.
+            return
+        if ERROR_FIELD in collection:
+            # Clear the previous failure, along with the signature.
+            ignored = (ERROR_FIELD, "last_modified")
+            cleared = {k: v for k, v in collection.items() if k not in ignored}
+            collection = self.registry.storage.update(
+                resource_name="collection",
+                parent_id=f"/buckets/{job['bucket_id']}",
+                object_id=job["collection_id"],
+                obj=cleared,
+            )
+
+        destinations = [resource["destination"]]
+        if "preview" in resource:
+            destinations.insert(0, resource["preview"])
+
+        if job["status"] == STATUS.TO_SIGN:
+            changes_counts = updater.sign_and_update_destinations(
+                request,
+                destinations,
+                source_attributes=collection,
+                previous_source_status=job["previous_status"],
+            )
+            uri = instance_uri(
+                request, "collection", bucket_id=job["bucket_id"], id=job["collection_id"]
+            )
+            payload = {
+                "action": ACTIONS.UPDATE.value,
+                "resource_name": "collection",
+                "uri": uri,
+                "bucket_id": job["bucket_id"],
+                "collection_id": job["collection_id"],
+                "user_id": job["user_id"],
+                "timestamp": collection["last_modified"],
+            }
+            review_event = signer_events.ReviewApproved(
+                request=request,
+                payload=payload,
+                impacted_objects=[{"old": collection, "new": collection}],
+                resource=resource,
+                original_event=None,
+                changes_count=changes_counts[-1],
+            )
+            request.bound_data.setdefault("kinto_signer.events", []).append(review_event)
+        else:
+            # Restore the status of the collection before the request.
+            next_status = job["previous_status"] or STATUS.SIGNED.value
+            updater.refresh_signatures(request, destinations, next_source_status=next_status)
+
+        listeners.report_operation(
+            request, updater, signer, job["bucket_id"], job["collection_id"], job["status"]
+        )
+
+    def _fail(self, request, job, error):
+        """Record the error and restore the previous status of the source collection,
+        unless the job was applied or the status was changed in the meantime."""
+        if not self._claim(job):
+            # Already applied by another worker.
+            return
+        _, _, updater = self._updater(request, job)
+        if updater is None:
+            return
+        if self._get_collection(job).get("status") != STATUS.SIGNING:
+            return
+        current_date = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        attrs = {
+            "status": job["previous_status"] or STATUS.WORK_IN_PROGRESS.value,
+            ERROR_FIELD: {"date": current_date, "message": str(error)},
+        }
+        updater._update_source_attributes(request, **attrs)
@@ -1,4 +1,4 @@
-import copy
+import datetime
 
 from kinto.core import errors
 from kinto.core.events import ACTIONS
@@ -10,11 +10,22 @@ from pyramid.interfaces import IAuthorizationPolicy
 
 from kinto_signer.updater import LocalUpdater, TRACKING_FIELDS
 from kinto_signer import events as signer_events
-from kinto_signer.utils import STATUS, PLUGIN_USERID, ensure_resource_exists
+from kinto_signer.metrics import TIMINGS_KEY, report_phases
+from kinto_signer.utils import (
+    STATUS,
+    PLUGIN_USERID,
+    ResourcesIndex,
+    ensure_resource_exists,
+    find_float_paths,
+    may_contain_float,
+)
 
 
 REVIEW_SETTINGS = ("reviewers_group", "editors_group", "to_review_enabled", "group_check_enabled")
 
+#: Source collections metadata flag, set by editors during large imports.
+BULK_IMPORT_FIELD = "bulk_import"
+
 
 def raise_invalid(**kwargs):
     kwargs.update(errno=ERRORS.INVALID_POSTED_DATA)
@@ -27,31 +38,9 @@ def raise_forbidden(**kwargs):
 
 
 def pick_resource_and_signer(request, resources, bucket_id, collection_id):
-    bucket_key = instance_uri(request, "bucket", id=bucket_id)
-    collection_key = instance_uri(request, "collection", bucket_id=bucket_id, id=collection_id)
-
-    resource = signer = None
-
-    # Review might have been configured explictly for this collection,
-    if collection_key in resources:
-        resource = resources[collection_key]
-    elif bucket_key in resources:
-        # Or via its bucket.
-        resource = copy.deepcopy(resources[bucket_key])
-        # Since it was configured per bucket, we want to make this
-        # resource look as if it was configured explicitly for this
-        # collection.
-        resource["source"]["collection"] = collection_id
-        resource["destination"]["collection"] = collection_id
-        if "preview" in resource:
-            resource["preview"]["collection"] = collection_id
-
-    if collection_key in request.registry.signers:
-        signer = request.registry.signers[collection_key]
-    elif bucket_key in request.registry.signers:
-        signer = request.registry.signers[bucket_key]
-
-    return resource, signer
+    if not isinstance(resources, ResourcesIndex):
+        resources = ResourcesIndex(resources, request.registry.signers)
+    return resources.resolve(bucket_id, collection_id)
 
 
 def resource_group(resource, name, default):
@@ -61,7 +50,7 @@ def resource_group(resource, name, default):
     return group.format(collection_id=resource["source"]["collection"])
 
 
-def sign_collection_data(event, resources, **kwargs):
+def sign_collection_data(event, resources, streaming_page_size=0, single_flight=None, **kwargs):
     """
     Listen to resource change events, to check if a new signature is
     requested.
@@ -102,6 +91,9 @@ def sign_collection_data(event, resources, **kwargs):
             permission=event.request.registry.permission,
             source=resource["source"],
             destination=resource["destination"],
+            streaming_page_size=streaming_page_size,
+            single_flight=single_flight,
+            records_cache=event.request.registry.signer_records_cache,
         )
 
         uri = instance_uri(
@@ -129,84 +121,110 @@ def sign_collection_data(event, resources, **kwargs):
         # Autorize kinto-attachment metadata write access. #190
         event.request._attachment_auto_save = True
 
-        if is_new_collection:
-            if has_preview_collection:
-                updater.destination = resource["preview"]
-                updater.sign_and_update_destination(
+        # Preview and destination are signed together (eg. in one Autograph request).
+        destinations = [resource["destination"]]
+        if has_preview_collection:
+            destinations.insert(0, resource["preview"])
+
+        # Sign in a background worker if enabled (see ``signer.async_enabled`` setting).
+        signing_jobs = event.request.registry.signer_jobs
+
+        # Profile the transition if enabled (see ``signer.profiling_*`` settings).
+        profiler = event.request.registry.signer_profiler
+        profiling = None
+
+        transition = "create" if is_new_collection else new_status
+        try:
+            if profiler is not None and (is_new_collection or old_status != new_status):
+                profiling = profiler.start(event.request)
+
+            if is_new_collection:
+                updater.sign_and_update_destinations(
                     event.request,
+                    destinations,
                     source_attributes=new_collection,
-                    next_source_status=None,  # Do not update source attributes (done below).
+                    previous_source_status=STATUS.SIGNED,  # Prevents last_review_date to be set.
+                    next_source_status=STATUS.SIGNED,  # Signed by default.
                 )
-            updater.destination = resource["destination"]
-            updater.sign_and_update_destination(
-                event.request,
-                source_attributes=new_collection,
-                previous_source_status=STATUS.SIGNED,  # Prevents last_review_date to be set.
-                next_source_status=STATUS.SIGNED,  # Signed by default.
-            )
 
-        elif old_status == new_status:
-            continue
+            elif old_status == new_status:
+                continue
 
-        elif new_status == STATUS.TO_SIGN:
-            # Run signature process (will set `last_reviewer` field).
-            if has_preview_collection:
-                updater.destination = resource["preview"]
-                updater.sign_and_update_destination(
+            elif signing_jobs is not None and new_status in (STATUS.TO_SIGN, STATUS.TO_REFRESH):
+                updater.update_source_status(STATUS.SIGNING, event.request)
+                signing_jobs.enqueue(
                     event.request,
-                    source_attributes=new_collection,
-                    previous_source_status=old_status,
+                    payload["bucket_id"],
+                    new_collection["id"],
+                    new_status,
+                    old_status,
                 )
+                transition = "enqueue"
 
-            updater.destination = resource["destination"]
-            review_event_cls = signer_events.ReviewApproved
-            changes_count = updater.sign_and_update_destination(
-                event.request, source_attributes=new_collection, previous_source_status=old_status
-            )
-            review_event_kw["changes_count"] = changes_count
-
-        elif new_status == STATUS.TO_REVIEW:
-            if has_preview_collection:
-                # If preview collection: update and sign preview collection
-                updater.destination = resource["preview"]
-                changes_count = updater.sign_and_update_destination(
+            elif new_status == STATUS.TO_SIGN:
+                # Run signature process (will set `last_reviewer` field).
+                review_event_cls = signer_events.ReviewApproved
+                changes_counts = updater.sign_and_update_destinations(
                     event.request,
+                    destinations,
                     source_attributes=new_collection,
-                    next_source_status=STATUS.TO_REVIEW,
+                    previous_source_status=old_status,
                 )
-            else:
-                # If no preview collection: just track `last_editor`
-                updater.update_source_review_request_by(event.request)
-                changes_count = None
-            review_event_cls = signer_events.ReviewRequested
-            review_event_kw["changes_count"] = changes_count
-            review_event_kw["comment"] = new_collection.get("last_editor_comment", "")
-
-        elif old_status == STATUS.TO_REVIEW and new_status == STATUS.WORK_IN_PROGRESS:
-            review_event_cls = signer_events.ReviewRejected
-            review_event_kw["comment"] = new_collection.get("last_reviewer_comment", "")
+                # Report the changes that were published in the destination.
+                review_event_kw["changes_count"] = changes_counts[-1]
+
+            elif new_status == STATUS.TO_REVIEW:
+                if has_preview_collection:
+                    # If preview collection: update and sign preview collection
+                    updater.destination = resource["preview"]
+                    changes_count = updater.sign_and_update_destination(
+                        event.request,
+                        source_attributes=new_collection,
+                        next_source_status=STATUS.TO_REVIEW,
+                    )
+                else:
+                    # If no preview collection: just track `last_editor`
+                    updater.update_source_review_request_by(event.request)
+                    changes_count = None
+                review_event_cls = signer_events.ReviewRequested
+                review_event_kw["changes_count"] = changes_count
+                review_event_kw["comment"] = new_collection.get("last_editor_comment", "")
 
-        elif new_status == STATUS.TO_REFRESH:
-            updater.refresh_signature(event.request, next_source_status=old_status)
-            if has_preview_collection:
-                updater.destination = resource["preview"]
-                updater.refresh_signature(event.request, next_source_status=old_status)
+            elif old_status == STATUS.TO_REVIEW and new_status == STATUS.WORK_IN_PROGRESS:
+                review_event_cls = signer_events.ReviewRejected
+                review_event_kw["comment"] = new_collection.get("last_reviewer_comment", "")
 
-        elif new_status == STATUS.TO_ROLLBACK:
-            # Reset source with destination content, and set status to SIGNED.
-            changes_count = updater.rollback_changes(event.request)
-            if has_preview_collection:
-                # Reset preview with destination content.
-                updater.source = resource["preview"]
-                changes_count += updater.rollback_changes(event.request, refresh_last_edit=False)
-                # Refresh signature for this new preview collection content.
-                updater.destination = resource["preview"]
-                # Without refreshing the source attributes.
-                updater.refresh_signature(event.request, next_source_status=None)
-            # If some changes were effectively rolledback, send an event.
-            if changes_count > 0:
-                review_event_cls = signer_events.ReviewCanceled
-                review_event_kw["changes_count"] = changes_count
+            elif new_status == STATUS.TO_REFRESH:
+                updater.refresh_signatures(
+                    event.request, destinations, next_source_status=old_status
+                )
+
+            elif new_status == STATUS.TO_ROLLBACK:
+                # Reset source with destination content, and set status to SIGNED.
+                changes_count = updater.rollback_changes(event.request)
+                if has_preview_collection:
+                    # Reset preview with destination content.
+                    updater.source = resource["preview"]
+                    changes_count += updater.rollback_changes(
+                        event.request, refresh_last_edit=False
+                    )
+                    # Refresh signature for this new preview collection content.
+                    updater.destination = resource["preview"]
+                    # Without refreshing the source attributes.
+                    updater.refresh_signature(event.request, next_source_status=None)
+                # If some changes were effectively rolledback, send an event.
+                if changes_count > 0:
+                    review_event_cls = signer_events.ReviewCanceled
+                    review_event_kw["changes_count"] = changes_count
+        finally:
+            # Always stop profiling, and keep the profile of failed transitions too.
+            if profiling is not None:
+                profiler.stop(profiling, payload["bucket_id"], new_collection["id"], transition)
+
+        # Report the time spent in each phase of the transition.
+        report_operation(
+            event.request, updater, signer, payload["bucket_id"], new_collection["id"], transition
+        )
 
         # Notify request of review.
         if review_event_cls:
@@ -214,6 +232,34 @@ def sign_collection_data(event, resources, **kwargs):
             event.request.bound_data.setdefault("kinto_signer.events", []).append(review_event)
 
 
+def report_operation(request, updater, signer, bucket_id, collection_id, transition):
+    """Report the time spent in each phase of the specified transition."""
+    uri = instance_uri(request, "collection", bucket_id=bucket_id, id=collection_id)
+    signer_backend = signer.__class__.__module__.rsplit(".", 1)[-1]
+    report_phases(
+        request.registry.signer_metrics,
+        updater.phases,
+        transition,
+        bucket=bucket_id,
+        collection=collection_id,
+        signer=signer_backend,
+    )
+    # Expose them in the response (see metrics.server_timing_tween_factory).
+    timings = request.bound_data.setdefault(TIMINGS_KEY, [])
+    timings.append({"uri": uri, "transition": transition, "phases": updater.phases})
+    # Keep track of the last operations (see views.signer_operations).
+    request.registry.signer_operations.append(
+        {
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "uri": uri,
+            "transition": transition,
+            "signer": signer_backend,
+            "refs": updater.signature_refs,
+            **updater.phases.summary(),
+        }
+    )
+
+
 def send_signer_events(event):
     """Send accumulated review events for this request. This listener is bound to the
     ``AfterResourceChanged`` event so that review events are sent only if the transaction
@@ -270,6 +316,19 @@ def check_collection_status(
             # When collection is created old_status == new_status == None.
             continue
 
+        # Status is set back by the worker once the collection is signed (async mode).
+        # Changes can still be rolled back, eg. if the signing job is stuck.
+        async_enabled = event.request.registry.signer_jobs is not None
+        if async_enabled and old_status == STATUS.SIGNING and new_status != STATUS.TO_ROLLBACK:
+            raise_invalid(message="Collection is being signed")
+
+        # Review waits for the end of the bulk import.
+        if new_collection.get(BULK_IMPORT_FIELD) and new_status in (
+            STATUS.TO_REVIEW,
+            STATUS.TO_SIGN,
+        ):
+            raise_invalid(message="Collection is in bulk import mode")
+
         # 0. Nobody can remove the status
         if new_status is None:
             raise_invalid(message="Cannot remove status")
@@ -342,7 +401,7 @@ def signer_impacts_resource(signer, bid, cid):
     return False
 
 
-def prevent_float_value(event, resources):
+def prevent_float_value(event, resources, raw_body_check=False):
     """This ResourceChanged event listener will reject records that
     contain float values.
 
@@ -355,34 +414,43 @@ def prevent_float_value(event, resources):
     is the simplest approach. Floats can be published as strings if needed.
 
     [0] https://github.com/gibson042/canonicaljson-spec
+
+    If ``raw_body_check`` is enabled, records created or replaced individually
+    are not scanned if their request body cannot contain any float.
     """
 
-    def scan(d, path=""):
-        for k, v in d.items():
-            path = f"{path}.{k}" if path else k
-            if isinstance(v, float):
-                raise ValueError(
-                    f"'{path}' field contains float value (tip: use integer or string)"
-                )
-            elif isinstance(v, dict):
-                scan(v, path)
+    bucket_id = event.payload["bucket_id"]
+    collection_id = event.payload["collection_id"]
+    # Records are checked at once at the end of bulk imports (see end_bulk_import).
+    if in_bulk_import(event.request, bucket_id, collection_id):
+        return
 
     # Only raise in configured resources.
     resource, _ = pick_resource_and_signer(
-        event.request,
-        resources,
-        bucket_id=event.payload["bucket_id"],
-        collection_id=event.payload["collection_id"],
+        event.request, resources, bucket_id=bucket_id, collection_id=collection_id
     )
     if resource is None:
         return
 
-    # Check each created/updated record in the batch.
-    for impacted in event.impacted_objects:
-        try:
-            scan(impacted["new"])
-        except ValueError as e:
-            raise_invalid(message=str(e))
+    # The raw body of a single record creation or replacement contains all its values.
+    if raw_body_check and len(event.impacted_objects) == 1:
+        request = event.request
+        if request.method in ("POST", "PUT") and not may_contain_float(request.body):
+            return
+
+    # Check all created/updated records in the batch.
+    floats = [
+        {"id": impacted["new"]["id"], "path": path}
+        for impacted in event.impacted_objects
+        for path in find_float_paths(impacted["new"])
+    ]
+    if floats:
+        paths = ", ".join(f"'{f['path']}'" for f in floats)
+        if len(floats) > 1:
+            message = f"{paths} fields contain float values (tip: use integer or string)"
+        else:
+            message = f"{paths} field contains float value (tip: use integer or string)"
+        raise_invalid(message=message, details=floats)
 
 
 def prevent_collection_delete(event, resources):
@@ -506,18 +574,103 @@ def check_collection_tracking(event, resources):
                 raise_invalid(message="Cannot change %r" % field)
 
 
-def set_work_in_progress_status(event, resources):
-    """Put the status in work-in-progress if was signed."""
+def in_bulk_import(request, bucket_id, collection_id):
+    """Return ``True`` if the specified collection has the bulk import flag.
+
+    The collection metadata is taken from the ones fetched by the records views
+    in the current request (or batch), so that this check costs nothing.
+    """
+    collection_uri = f"/buckets/{bucket_id}/collections/{collection_id}"
+    collection = request.bound_data.get("collections", {}).get(collection_uri)
+    return collection is not None and bool(collection.get(BULK_IMPORT_FIELD))
+
+
+def end_bulk_import(event, resources, check_floats):
+    """When the bulk import flag is removed from a source collection, do the
+    bookkeeping that was skipped on each record change: check the records
+    for float values, put the status in work-in-progress if there are
+    changes to review, and report the number of changes once.
+    """
+    payload = event.payload
+    for impacted in event.impacted_objects:
+        old_collection = impacted.get("old", {})
+        new_collection = impacted["new"]
+        if not old_collection.get(BULK_IMPORT_FIELD) or new_collection.get(BULK_IMPORT_FIELD):
+            continue
+
+        resource, signer = pick_resource_and_signer(
+            event.request,
+            resources,
+            bucket_id=payload["bucket_id"],
+            collection_id=new_collection["id"],
+        )
+        if resource is None:
+            continue
+
+        updater = LocalUpdater(
+            signer=signer,
+            storage=event.request.registry.storage,
+            permission=event.request.registry.permission,
+            source=resource["source"],
+            destination=resource["destination"],
+        )
+        source_records, _ = updater.get_source_records(empty_none=False)
+
+        if check_floats:
+            floats = [
+                {"id": record["id"], "path": path}
+                for record in source_records
+                for path in find_float_paths(record)
+            ]
+            if floats:
+                raise_invalid(
+                    message="Cannot end bulk import: records contain float values",
+                    details=floats,
+                )
+
+        dest_records, _ = updater.get_destination_records(empty_none=False)
+        changes_count = len(updater.records_diff(source_records, dest_records))
+        updater.phases.gauge("changes", changes_count)
+
+        old_status = old_collection.get("status")
+        new_status = new_collection.get("status")
+        # Leave the status if it was changed explicitly, or is already in work-in-progress.
+        if changes_count > 0 and old_status == new_status != STATUS.WORK_IN_PROGRESS:
+            updater.update_source_status(STATUS.WORK_IN_PROGRESS, event.request)
+
+        bucket_id, collection_id = payload["bucket_id"], new_collection["id"]
+        report_operation(event.request, updater, signer, bucket_id, collection_id, "bulk-import")
+
+
+def set_work_in_progress_status(event, resources, debounce_seconds=0):
+    """Put the status in work-in-progress if was signed.
+
+    If ``debounce_seconds`` is set, the source collection metadata is left
+    untouched if it is already in work-in-progress and was last edited by the
+    same user during this amount of seconds.
+    """
+    bucket_id = event.payload["bucket_id"]
+    collection_id = event.payload["collection_id"]
+    # Skip during bulk imports (see end_bulk_import).
+    if in_bulk_import(event.request, bucket_id, collection_id):
+        return
+
     resource, signer = pick_resource_and_signer(
-        event.request,
-        resources,
-        bucket_id=event.payload["bucket_id"],
-        collection_id=event.payload["collection_id"],
+        event.request, resources, bucket_id=bucket_id, collection_id=collection_id
     )
     # Skip if resource is not configured.
     if resource is None:
         return
 
+    async_enabled = event.request.registry.signer_jobs is not None
+    if async_enabled or debounce_seconds > 0:
+        collection = _get_source_collection(event.request, resource)
+        # Records cannot be changed while they are signed in background (async mode).
+        if async_enabled and collection.get("status") == STATUS.SIGNING:
+            raise_invalid(message="Collection is being signed")
+        if debounce_seconds > 0 and _is_recent_edit(event.request, collection, debounce_seconds):
+            return
+
     updater = LocalUpdater(
         signer=signer,
         storage=event.request.registry.storage,
@@ -525,7 +678,46 @@ def set_work_in_progress_status(event, resources):
         source=resource["source"],
         destination=resource["destination"],
     )
-    updater.update_source_status(STATUS.WORK_IN_PROGRESS, event.request)
+    updated = updater.update_source_status(STATUS.WORK_IN_PROGRESS, event.request)
+    # Keep the metadata of the current request (or batch) up to date.
+    collections = event.request.bound_data.setdefault("collections", {})
+    collections[updater.source_collection_uri] = updated
+
+
+def _get_source_collection(request, resource):
+    """Return the source collection metadata fetched by the records views in
+    the current request (or batch), or from the storage if not fetched yet.
+    """
+    bucket_id = resource["source"]["bucket"]
+    collection_id = resource["source"]["collection"]
+    collection_uri = f"/buckets/{bucket_id}/collections/{collection_id}"
+    collections = request.bound_data.setdefault("collections", {})
+    if collection_uri not in collections:
+        try:
+            collections[collection_uri] = request.registry.storage.get(
+                resource_name="collection",
+                parent_id=f"/buckets/{bucket_id}",
+                object_id=collection_id,
+            )
+        except ObjectNotFoundError:
+            return {}
+    return collections[collection_uri]
+
+
+def _is_recent_edit(request, collection, seconds):
+    if collection.get("status") != STATUS.WORK_IN_PROGRESS.value:
+        return False
+    if collection.get(TRACKING_FIELDS.LAST_EDIT_BY.value) != request.prefixed_userid:
+        return False
+    try:
+        last_edit = datetime.datetime.fromisoformat(
+            collection[TRACKING_FIELDS.LAST_EDIT_DATE.value]
+        )
+        elapsed = datetime.datetime.now(datetime.timezone.utc) - last_edit
+    except (KeyError, TypeError, ValueError):
+        # Missing or unexpected date format.
+        return False
+    return elapsed.total_seconds() < seconds
 
 
 def create_editors_reviewers_groups(event, resources, editors_group, reviewers_group):
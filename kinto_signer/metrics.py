@@ -0,0 +1,241 @@
+import contextlib
+import json
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+from pyramid.exceptions import ConfigurationError
+
+
+try:
+    import statsd as statsd_module
+except ImportError:  # pragma: no cover
+    statsd_module = None
+
+logger = logging.getLogger(__name__)
+
+
+PREFIX = "plugins.signer"
+
+# Request bound data where the phases of the signer operations are collected.
+TIMINGS_KEY = "kinto_signer.timings"
+
+TAGS_FORMATS = ("", "dogstatsd")
+
+DEFAULT_RECENT_OPERATIONS_SIZE = 100
+
+
+class PhasesTimer(object):
+    """Accumulate the time spent in each phase of a signer operation (eg.
+    listing, diff, signature...), along with some gauges (eg. number of changes).
+
+    Phases are not nested: the durations of an operation are meant to be
+    summed up.
+    """
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.gauges = OrderedDict()
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def gauge(self, name, value):
+        self.gauges[name] = self.gauges.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        before = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - before)
+
+    def summary(self):
+        """Return the durations (in milliseconds) and the gauges, JSON serializable."""
+        durations = OrderedDict(
+            (name, round(seconds * 1000, 3)) for name, seconds in self.durations.items()
+        )
+        return {"durations": durations, **self.gauges}
+
+    def timed_chunks(self, name, chunks):
+        """Wrap an iterator of bytes chunks, and time its iteration as ``name``.
+
+        The size of the chunks is added to the ``payload_bytes`` gauge.
+        """
+        chunks = iter(chunks)
+        while True:
+            before = time.perf_counter()
+            chunk = next(chunks, None)
+            self.add(name, time.perf_counter() - before)
+            if chunk is None:
+                return
+            self.gauge("payload_bytes", len(chunk))
+            yield chunk
+
+
+class StatsdMetrics(object):
+    """Send the signer metrics using StatsD.
+
+    Counters are sent with the StatsD client of Kinto. Since it only exposes
+    timers and counters, timings and gauges are sent with a dedicated client,
+    configured with the same server and prefix.
+
+    Plain StatsD has no tags: the ``tags`` of metrics are ignored, and callers
+    are expected to put the relevant ones in the metric keys (see ``tagged``).
+    """
+
+    tagged = False
+
+    def __init__(self, statsd_client, host, port, prefix=""):
+        self.statsd = statsd_client
+        self._client = statsd_module.StatsClient(host, port, prefix=prefix)
+
+    def count(self, key, value=1, tags=None):
+        self.statsd.count(f"{PREFIX}.{key}", value)
+
+    def timing(self, key, milliseconds, tags=None):
+        self._client.timing(f"{PREFIX}.{key}", milliseconds)
+
+    def gauge(self, key, value, tags=None):
+        self._client.gauge(f"{PREFIX}.{key}", value)
+
+
+class DogStatsdMetrics(object):
+    """Send the signer metrics with their tags, using the DogStatsD protocol
+    (eg. ``plugins.signer.approved_changes:3|c|#bucket:main,collection:cid``).
+
+    Tags become labels of a same metric series, instead of distinct metric names.
+    """
+
+    tagged = True
+
+    def __init__(self, host, port, prefix=""):
+        self.prefix = f"{prefix}.{PREFIX}" if prefix else PREFIX
+        self._address = (host, port)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, key, value, metric_type, tags):
+        data = f"{self.prefix}.{key}:{value}|{metric_type}"
+        if tags:
+            data += "|#" + ",".join(f"{k}:{v}" for k, v in tags.items())
+        try:
+            self._socket.sendto(data.encode("utf-8"), self._address)
+        except OSError:
+            # Metrics must never break requests.
+            pass
+
+    def count(self, key, value=1, tags=None):
+        self._send(key, value, "c", tags)
+
+    def timing(self, key, milliseconds, tags=None):
+        self._send(key, f"{milliseconds:0.6f}", "ms", tags)
+
+    def gauge(self, key, value, tags=None):
+        self._send(key, value, "g", tags)
+
+
+class RecentOperations(object):
+    """Bounded buffer of the last signer operations of this process, for debugging.
+
+    :param int size: maximum number of operations to keep (``0`` disables it).
+    """
+
+    def __init__(self, size=DEFAULT_RECENT_OPERATIONS_SIZE):
+        self._lock = threading.Lock()
+        self._operations = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._operations)
+
+    def append(self, operation):
+        if self._operations.maxlen == 0:
+            return
+        with self._lock:
+            self._operations.append(operation)
+
+    def list(self):
+        """Return the operations, most recent first."""
+        with self._lock:
+            return list(reversed(self._operations))
+
+
+def load_from_settings(settings, statsd_client):
+    """Instantiate the signer metrics backend, using the ``signer.statsd_tags_format``
+    setting (``None`` if StatsD is not configured).
+    """
+    tags_format = settings.get("signer.statsd_tags_format", "")
+    if tags_format not in TAGS_FORMATS:
+        raise ConfigurationError(f"Unknown StatsD tags format {tags_format!r}")
+    if not statsd_client:
+        return None
+    # Same server and prefix as the StatsD client of Kinto.
+    uri = urlparse(settings["statsd_url"])
+    prefix = settings.get("project_name") or settings.get("statsd_prefix", "")
+    if tags_format == "dogstatsd":
+        return DogStatsdMetrics(uri.hostname, uri.port, prefix=prefix)
+    return StatsdMetrics(statsd_client, uri.hostname, uri.port, prefix=prefix)
+
+
+def report_phases(metrics, phases, transition, **tags):
+    """Send the durations and gauges of the specified phases.
+
+    With plain StatsD, they are sent as ``plugins.signer.{transition}.{name}``.
+    With tags, they are sent as ``plugins.signer.{name}``, and the transition is
+    a tag along with the specified ones (eg. bucket and collection).
+
+    :param metrics: the signer metrics backend (``None`` if not configured).
+    :param PhasesTimer phases: the phases of the operation.
+    :param str transition: the review transition (eg. ``to-sign``).
+    """
+    if metrics is None:
+        return
+    tags = {"transition": transition, **tags}
+    for name, seconds in phases.durations.items():
+        key = name if metrics.tagged else f"{transition}.{name}"
+        metrics.timing(key, seconds * 1000, tags=tags)
+    for name, value in phases.gauges.items():
+        key = name if metrics.tagged else f"{transition}.{name}"
+        metrics.gauge(key, value, tags=tags)
+
+
+def server_timing_tween_factory(handler, registry):
+    """Expose the time spent in each phase of the signer operations of the
+    request in a ``Server-Timing`` response header, and log them along with
+    the records counts and payload sizes as a JSON line.
+    """
+
+    def server_timing_tween(request):
+        response = handler(request)
+        # Subrequests of batches are reported with their parent request.
+        if hasattr(request, "parent"):
+            return response
+
+        operations = request.bound_data.pop(TIMINGS_KEY, [])
+        if len(operations) == 0:
+            return response
+
+        totals = OrderedDict()
+        summary = []
+        for operation in operations:
+            phases = operation["phases"]
+            for name, seconds in phases.durations.items():
+                totals[name] = totals.get(name, 0) + seconds
+            summary.append(
+                {
+                    "uri": operation["uri"],
+                    "transition": operation["transition"],
+                    **phases.summary(),
+                }
+            )
+
+        response.headers["Server-Timing"] = ", ".join(
+            f"signer-{name};dur={seconds * 1000:0.3f}" for name, seconds in totals.items()
+        )
+        logger.info(json.dumps({"path": request.path, "operations": summary}))
+        return response
+
+    return server_timing_tween
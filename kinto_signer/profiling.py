@@ -0,0 +1,101 @@
+import cProfile
+import datetime
+import logging
+import os
+import random
+import time
+from collections import namedtuple
+
+from pyramid.settings import aslist
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Request header to profile the transitions of a request (see ``signer.profiling_principals``).
+PROFILE_HEADER = "X-Signer-Profile"
+
+
+Session = namedtuple("Session", ("profile", "started", "forced"))
+
+
+class TransitionsProfiler(object):
+    """Profile the review transitions with :mod:`cProfile`, and write the
+    profiles in the specified directory.
+
+    Transitions are profiled if they are sampled, or if the request has the
+    :data:`PROFILE_HEADER` header and comes from one of the allowed principals.
+    Profiles of sampled transitions are only kept if they last longer than the
+    threshold.
+
+    :param str directory: folder where profiles are written.
+    :param float sample_rate: ratio of transitions to profile (between 0 and 1).
+    :param float threshold_seconds: minimum duration of sampled transitions.
+    :param list principals: principals allowed to use the profiling header.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, threshold_seconds=0.0, principals=()):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.threshold_seconds = threshold_seconds
+        self.principals = set(principals)
+
+    def _is_forced(self, request):
+        if not request.headers.get(PROFILE_HEADER):
+            return False
+        return bool(self.principals.intersection(request.prefixed_principals))
+
+    def start(self, request):
+        """Start profiling the current transition, if selected.
+
+        :returns: the profiling session to pass to :meth:`stop`, or ``None``.
+        """
+        forced = self._is_forced(request)
+        if not forced and random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        session = Session(profile, time.perf_counter(), forced)
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Eg. another profiler is already active (Python 3.12+).
+            logger.warning(f"Could not profile transition: {e}")
+            return None
+        return session
+
+    def stop(self, session, bucket_id, collection_id, transition):
+        """Stop profiling and write the profile of the transition.
+
+        :returns: the path of the profile file, or ``None`` if it was not kept.
+        """
+        session.profile.disable()
+        elapsed = time.perf_counter() - session.started
+        if not session.forced and elapsed < self.threshold_seconds:
+            return None
+
+        timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+        filename = f"{bucket_id}-{collection_id}-{transition}-{timestamp}.prof"
+        path = os.path.join(self.directory, filename)
+        try:
+            session.profile.dump_stats(path)
+        except OSError:
+            logger.exception(f"Could not write profile of {transition} to {path}")
+            return None
+        logger.info(f"Profile of {transition} on {bucket_id}/{collection_id} written to {path}")
+        return path
+
+
+def load_from_settings(settings):
+    """Instantiate the transitions profiler from the ``signer.profiling_*`` settings
+    (``None`` if ``signer.profiling_dir`` is not set).
+    """
+    directory = settings.get("signer.profiling_dir")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return TransitionsProfiler(
+        directory,
+        sample_rate=float(settings.get("signer.profiling_sample_rate", 0)),
+        threshold_seconds=float(settings.get("signer.profiling_threshold_seconds", 0)),
+        principals=aslist(settings.get("signer.profiling_principals", "")),
+    )
@@ -1,14 +1,101 @@
 import operator
+import threading
+from collections import OrderedDict
 
 import canonicaljson
 
 
-def canonical_json(records, last_modified):
+DEFAULT_CACHE_SIZE = 10000
+
+
+class RecordsCache(object):
+    """LRU-bounded cache of canonical JSON fragments of records.
+
+    Fragments are indexed by collection URI, record id and record
+    timestamp. Since timestamps are bumped on every record change, a
+    cached fragment never has to be invalidated explicitly: outdated
+    entries are simply evicted when the cache is full.
+
+    The memory used is roughly the size of the canonical JSON of the cached
+    records (eg. 10MB for 10000 records of 1KB), plus about 200 bytes per entry.
+    Collections with more records than ``max_size`` are not cached at all (see
+    :func:`canonical_json_chunks`): the size should be at least the number of
+    records of the largest signed collection.
+
+    :param int max_size: maximum number of fragments to keep (``0`` disables
+        the cache).
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._fragments.move_to_end(key)
+            except KeyError:
+                return None
+            return self._fragments[key]
+
+    def set(self, key, fragment):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            if len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+
+
+def _serialize_record(record, cache, namespace):
+    last_modified = record.get("last_modified")
+    if cache is None or last_modified is None:
+        return canonicaljson.dumps(record).encode("utf-8")
+
+    key = (namespace, record["id"], last_modified)
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = canonicaljson.dumps(record).encode("utf-8")
+        cache.set(key, fragment)
+    return fragment
+
+
+def canonical_json_chunks(records, last_modified, cache=None, namespace=None):
+    """Yield the canonical JSON of the specified records as bytes chunks.
+
+    The concatenation of the chunks is strictly equal to :func:`canonical_json`,
+    but the whole payload is never held in memory at once: each record is
+    serialized and yielded individually, so that consumers (e.g. hashers or
+    signers) can process it incrementally.
+
+    :param cache: optional :class:`RecordsCache` where the serialized
+        records are looked up and stored (ignored if the records do not fit).
+    :param str namespace: the URI of the collection of the records, used to
+        index them in the cache.
+    """
     records = (r for r in records if not r.get("deleted", False))
     records = sorted(records, key=operator.itemgetter("id"))
+    if cache is not None and len(records) > cache.max_size:
+        # Records are always serialized in the same order: the LRU would evict every
+        # fragment before it is reused.
+        cache = None
 
-    payload = {"data": records, "last_modified": "%s" % last_modified}
+    # Keys of the payload are sorted: ``data`` comes before ``last_modified``.
+    yield b'{"data":['
+    for i, record in enumerate(records):
+        if i > 0:
+            yield b","
+        yield _serialize_record(record, cache, namespace)
+    yield b'],"last_modified":'
+    yield canonicaljson.dumps("%s" % last_modified).encode("utf-8")
+    yield b"}"
 
-    dump = canonicaljson.dumps(payload)
 
-    return dump
+def canonical_json(records, last_modified, cache=None, namespace=None):
+    chunks = canonical_json_chunks(records, last_modified, cache=cache, namespace=namespace)
+    return b"".join(chunks).decode("utf-8")
@@ -1,34 +1,114 @@
 import base64
+import itertools
+import random
+import time
 from urllib.parse import urljoin
 import warnings
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests_hawk import HawkAuth
 from kinto import logger
+from pyramid.settings import asbool
 
-from .base import SignerBase
+from .base import SIGN_PREFIX, SignerBase, payload_chunks
+from ..hasher import compute_digest
 from ..utils import get_first_matching_setting
 
 
 SIGNATURE_FIELDS = ["signature", "x5u"]
 EXTRA_SIGNATURE_FIELDS = ["mode", "public_key", "type", "signer_id", "ref"]
 
+# Responses for which the request is retried.
+RETRY_STATUS_CODES = (429, 503)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+
 
 class AutographSigner(SignerBase):
-    def __init__(self, server_url, hawk_id, hawk_secret):
+    """Sign payloads using a remote Autograph server.
+
+    HTTP connections to the server are pooled and kept alive between
+    signatures. Requests that are throttled (``429``) or that hit an
+    unavailable server (``503``) are retried with an exponential backoff
+    and random jitter.
+
+    With ``hash_mode``, the prefixed SHA-384 hash of the payload is computed
+    locally and sent to the ``/sign/hash`` endpoint, instead of uploading the
+    whole payload to ``/sign/data``.
+    """
+
+    def __init__(
+        self,
+        server_url,
+        hawk_id,
+        hawk_secret,
+        pool_size=DEFAULT_POOL_SIZE,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        max_retries=DEFAULT_MAX_RETRIES,
+        retry_backoff=DEFAULT_RETRY_BACKOFF,
+        hash_mode=False,
+    ):
         self.server_url = server_url
+        self.hash_mode = hash_mode
         self.auth = HawkAuth(id=hawk_id, key=hawk_secret)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
 
-    def sign(self, payload):
-        if isinstance(payload, str):  # pragma: nocover
-            payload = payload.encode("utf-8")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-        b64_payload = base64.b64encode(payload)
-        url = urljoin(self.server_url, "/sign/data")
-        resp = requests.post(url, auth=self.auth, json=[{"input": b64_payload.decode("utf-8")}])
+    def _post(self, path, body):
+        url = urljoin(self.server_url, path)
+        for attempt in range(self.max_retries + 1):
+            resp = self.session.post(url, auth=self.auth, json=body, timeout=self.timeout)
+            if resp.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                break
+            delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+            logger.warning(
+                "Autograph responded with %s, retrying in %.2fs" % (resp.status_code, delay)
+            )
+            time.sleep(delay)
         resp.raise_for_status()
-        signature_bundle = resp.json()[0]
+        return resp
 
+    def sign(self, payload):
+        return self.sign_many([payload])[0]
+
+    def sign_stream(self, chunks):
+        return self.sign_many([chunks])[0]
+
+    def sign_many(self, payloads):
+        """Sign all the specified payloads with a single request to Autograph."""
+        if self.hash_mode:
+            path = "/sign/hash"
+            inputs = [
+                compute_digest(itertools.chain([SIGN_PREFIX], payload_chunks(payload)))
+                for payload in payloads
+            ]
+        else:
+            path = "/sign/data"
+            inputs = [b"".join(payload_chunks(payload)) for payload in payloads]
+
+        body = [{"input": base64.b64encode(value).decode("utf-8")} for value in inputs]
+        resp = self._post(path, body)
+        signature_bundles = resp.json()
+        if len(signature_bundles) != len(inputs):
+            raise ValueError(
+                "Autograph returned %s signatures for %s inputs"
+                % (len(signature_bundles), len(inputs))
+            )
+        return [self._signature_infos(resp, bundle) for bundle in signature_bundles]
+
+    def _signature_infos(self, resp, signature_bundle):
         # Critical fields must be present, will raise if missing.
         infos = {field: signature_bundle[field] for field in SIGNATURE_FIELDS}
         # Other fields are returned and will be stored as part of the signature.
@@ -57,8 +137,17 @@ def load_from_settings(settings, prefix="", *, prefixes=None):
         )
         warnings.warn(message, DeprecationWarning)
 
+    def setting(name, default=None):
+        return get_first_matching_setting(f"autograph.{name}", settings, prefixes, default)
+
     return AutographSigner(
-        server_url=get_first_matching_setting("autograph.server_url", settings, prefixes),
-        hawk_id=get_first_matching_setting("autograph.hawk_id", settings, prefixes),
-        hawk_secret=get_first_matching_setting("autograph.hawk_secret", settings, prefixes),
+        server_url=setting("server_url"),
+        hawk_id=setting("hawk_id"),
+        hawk_secret=setting("hawk_secret"),
+        pool_size=int(setting("pool_size", DEFAULT_POOL_SIZE)),
+        connect_timeout=float(setting("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(setting("read_timeout", DEFAULT_READ_TIMEOUT)),
+        max_retries=int(setting("max_retries", DEFAULT_MAX_RETRIES)),
+        retry_backoff=float(setting("retry_backoff", DEFAULT_RETRY_BACKOFF)),
+        hash_mode=asbool(setting("hash_mode", False)),
     )
@@ -1,3 +1,17 @@
+# Autograph uses this prefix prior to signing.
+SIGN_PREFIX = b"Content-Signature:\x00"
+
+
+def payload_chunks(payload):
+    """Return the specified payload (``str``, ``bytes`` or iterable of bytes
+    chunks) as an iterable of bytes chunks."""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if isinstance(payload, bytes):
+        return [payload]
+    return payload
+
+
 class SignerBase(object):
     def sign(self, payload):
         """
@@ -8,3 +22,34 @@ class SignerBase(object):
         :rtype: dict
         """
         raise NotImplementedError
+
+    def sign_stream(self, chunks):
+        """
+        Signs the payload obtained by concatenating the specified bytes `chunks`.
+
+        Signers that are able to hash the payload incrementally should
+        override this method, in order to avoid building the whole payload
+        in memory.
+
+        :returns: A mapping with every attributes about the signature.
+        :rtype: dict
+        """
+        return self.sign(b"".join(chunks))
+
+    def sign_many(self, payloads):
+        """
+        Signs each of the specified `payloads`. A payload can be given as
+        bytes, or as an iterable of bytes chunks (see :meth:`sign_stream`).
+
+        Signers that are able to sign several payloads in one operation
+        (eg. one HTTP request) should override this method.
+
+        :returns: The list of signature metadata, in the same order as `payloads`.
+        :rtype: list
+        """
+        return [self._sign_payload(payload) for payload in payloads]
+
+    def _sign_payload(self, payload):
+        if isinstance(payload, (bytes, str)):
+            return self.sign(payload)
+        return self.sign_stream(payload)
@@ -1,17 +1,60 @@
 import base64
+import itertools
+import os
+import threading
 import warnings
 
 import ecdsa
 import hashlib
-from ecdsa import NIST384p, SigningKey, VerifyingKey
+from ecdsa import NIST384p, SigningKey, VerifyingKey, ellipticcurve
 
-from .base import SignerBase
+from .base import SIGN_PREFIX, SignerBase
 from .exceptions import BadSignatureError
+from ..hasher import compute_digest
 from ..utils import get_first_matching_setting
 
 
-# Autograph uses this prefix prior to signing.
-SIGN_PREFIX = b"Content-Signature:\x00"
+def _parse_private_key(pem):
+    private_key = SigningKey.from_pem(pem)
+    # Speed up future verifications with this key.
+    private_key.get_verifying_key().precompute()
+    return private_key
+
+
+def _parse_public_key(pem):
+    public_key = VerifyingKey.from_pem(pem)
+    # Points decoded from PEM don't carry the curve order, which is required
+    # to precompute the multiplication tables.
+    curve = public_key.curve
+    point = public_key.pubkey.point
+    point = ellipticcurve.Point(curve.curve, point.x(), point.y(), curve.order)
+    public_key = VerifyingKey.from_public_point(point, curve=curve)
+    public_key.precompute()
+    return public_key
+
+
+class KeyManager(object):
+    """Keep the parsed keys in memory, and reload them only when their
+    file changes on disk (e.g. on key rotation).
+
+    :param parse: the function that builds the key from the file content.
+    """
+
+    def __init__(self, parse):
+        self._parse = parse
+        self._lock = threading.Lock()
+        self._keys = {}
+
+    def load(self, location):
+        stat = os.stat(location)
+        version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            cached_version, key = self._keys.get(location, (None, None))
+            if cached_version != version:
+                with open(location, "rb") as key_file:
+                    key = self._parse(key_file.read())
+                self._keys[location] = (version, key)
+            return key
 
 
 class ECDSASigner(SignerBase):
@@ -21,6 +64,8 @@ class ECDSASigner(SignerBase):
             raise ValueError(msg)
         self.private_key = private_key
         self.public_key = public_key
+        self._private_keys = KeyManager(_parse_private_key)
+        self._public_keys = KeyManager(_parse_public_key)
 
     @classmethod
     def generate_keypair(cls):
@@ -33,8 +78,7 @@ class ECDSASigner(SignerBase):
             msg = "Please, specify the private_key location."
             raise ValueError(msg)
 
-        with open(self.private_key, "rb") as key_file:
-            return SigningKey.from_pem(key_file.read())
+        return self._private_keys.load(self.private_key)
 
     def load_public_key(self):
         # Check settings validity
@@ -42,8 +86,7 @@ class ECDSASigner(SignerBase):
             private_key = self.load_private_key()
             return private_key.get_verifying_key()
         elif self.public_key:
-            with open(self.public_key, "rb") as key_file:
-                return VerifyingKey.from_pem(key_file.read())
+            return self._public_keys.load(self.public_key)
 
     def sign(self, payload):
         if isinstance(payload, str):  # pragma: nocover
@@ -54,6 +97,15 @@ class ECDSASigner(SignerBase):
         signature = private_key.sign(
             payload, hashfunc=hashlib.sha384, sigencode=ecdsa.util.sigencode_string
         )
+        return self._signature_bundle(signature)
+
+    def sign_stream(self, chunks):
+        digest = compute_digest(itertools.chain([SIGN_PREFIX], chunks))
+        private_key = self.load_private_key()
+        signature = private_key.sign_digest(digest, sigencode=ecdsa.util.sigencode_string)
+        return self._signature_bundle(signature)
+
+    def _signature_bundle(self, signature):
         x5u = ""
         enc_signature = base64.urlsafe_b64encode(signature).decode("utf-8")
         return {"signature": enc_signature, "x5u": x5u, "mode": "p384ecdsa"}
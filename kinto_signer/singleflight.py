@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_LEASE_SECONDS = 60
+
+CACHE_PREFIX = "signer.single_flight"
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run a function only once for concurrent callers of the same key: later
+    callers wait for the result of the call in flight instead of repeating it.
+
+    Within the process, callers wait on the thread of the call in flight. Across
+    processes, the call in flight holds a lease in the Kinto cache backend, and
+    its result is stored there for the other processes, which poll the lease
+    until it is released or expires. Since the cache has no atomic operation,
+    two processes may still both run the function if they start at the exact
+    same moment.
+
+    :param cache: optional Kinto cache backend shared by the processes.
+    :param int lease_seconds: maximum time to wait for the call in flight of
+        another process, and duration during which its result is kept.
+    :param float poll_interval: seconds between checks of the cache.
+    """
+
+    def __init__(self, cache=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=0.1):
+        self.cache = cache
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Return the result of ``func()``, shared with the concurrent callers of ``key``.
+
+        The result must be JSON serializable if a cache backend is used.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            in_flight = call is not None
+            if not in_flight:
+                call = self._calls[key] = _Call()
+
+        if in_flight:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, func)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key)
+            call.done.set()
+        return call.result
+
+    def _do_shared(self, key, func):
+        if self.cache is None:
+            return func()
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        lease_key = f"{CACHE_PREFIX}.lease.{digest}"
+        result_key = f"{CACHE_PREFIX}.result.{digest}"
+
+        # Only wait for the result if a call is in flight: later calls with the same
+        # key are run again (eg. deliberate signature refresh).
+        waited = False
+        deadline = time.monotonic() + self.lease_seconds
+        while self.cache.get(lease_key) is not None:
+            if time.monotonic() > deadline:
+                logger.warning(f"Lease of {key!r} was not released, ignore it")
+                break
+            waited = True
+            time.sleep(self.poll_interval)
+        else:
+            result = self.cache.get(result_key) if waited else None
+            if result is not None:
+                return result
+
+        self.cache.set(lease_key, True, self.lease_seconds)
+        try:
+            result = func()
+            self.cache.set(result_key, result, self.lease_seconds)
+        finally:
+            self.cache.delete(lease_key)
+        return result
@@ -1,13 +1,24 @@
 import datetime
 import logging
+import time
 from enum import Enum
 
 from kinto.core.events import ACTIONS
-from kinto.core.storage.exceptions import RecordNotFoundError
+from kinto.core.storage import Filter, Sort
+from kinto.core.utils import COMPARISON
 from pyramid.security import Everyone
 
-from kinto_signer.serializer import canonical_json
-from kinto_signer.utils import STATUS, ensure_resource_exists, notify_resource_event, records_diff
+from kinto_signer import diff
+from kinto_signer.metrics import PhasesTimer
+from kinto_signer.serializer import canonical_json_chunks
+from kinto_signer.utils import (
+    STATUS,
+    ensure_resource_exists,
+    notify_resource_event,
+    notify_resource_events,
+    records_diff,
+    records_equal,
+)
 
 try:
     import boto3
@@ -21,6 +32,8 @@ FIELD_ID = "id"
 FIELD_LAST_MODIFIED = "last_modified"
 # Source collection fields to be copied to destination.
 PUBLISHED_COLLECTION_FIELDS = ("schema", "sort", "displayFields", "attachment")
+# Destination collection field where the source timestamp of the last publication is stored.
+WATERMARK_FIELD = "signer_watermark"
 
 
 class TRACKING_FIELDS(Enum):
@@ -62,9 +75,31 @@ class LocalUpdater(object):
     :param storage:
         The instance of kinto.core.storage that will be used to retrieve
         records from the source and add new items to the destination.
+
+    :param streaming_page_size:
+        Number of records per page when comparing the source and destination
+        page by page, instead of listing them entirely (``0`` to disable).
+
+    :param single_flight:
+        Coalesce the concurrent signatures of the same destinations content, with a
+        :class:`kinto_signer.singleflight.SingleFlight` (see ``signer.single_flight_enabled``).
+
+    :param records_cache:
+        The :class:`kinto_signer.serializer.RecordsCache` of the serialized records
+        (see ``signer.serializer_cache_size``).
     """
 
-    def __init__(self, source, destination, signer, storage, permission):
+    def __init__(
+        self,
+        source,
+        destination,
+        signer,
+        storage,
+        permission,
+        streaming_page_size=0,
+        single_flight=None,
+        records_cache=None,
+    ):
         self._source = None
         self._destination = None
 
@@ -73,6 +108,17 @@ class LocalUpdater(object):
         self.signer = signer
         self.storage = storage
         self.permission = permission
+        self.streaming_page_size = streaming_page_size
+        self.single_flight = single_flight
+        self.records_cache = records_cache
+        # Publication watermarks, saved in the destinations metadata on signature.
+        self._watermarks = {}
+        # Records of the collections listed during this transition, by URI and timestamp.
+        self._snapshots = {}
+        # Time spent in each phase (listing, diff, signature...) of this transition.
+        self.phases = PhasesTimer()
+        # References of the signatures returned by the signer (eg. Autograph ``ref``).
+        self.signature_refs = []
 
     @property
     def source(self):
@@ -117,31 +163,69 @@ class LocalUpdater(object):
         4. Ask the signer for a signature
         5. Send the signature to the destination.
         """
-        changes_count = 0
+        (changes_count,) = self.sign_and_update_destinations(
+            request,
+            [self.destination],
+            source_attributes=source_attributes,
+            next_source_status=next_source_status,
+            previous_source_status=previous_source_status,
+            push_records=push_records,
+        )
+        return changes_count
+
+    def sign_and_update_destinations(
+        self,
+        request,
+        destinations,
+        source_attributes,
+        next_source_status=STATUS.SIGNED,
+        previous_source_status=None,
+        push_records=True,
+    ):
+        """Same as :meth:`sign_and_update_destination` for several destinations
+        (eg. preview and destination).
 
-        self.create_destination(request)
+        Records are pushed to each destination, and then the signer is asked
+        for all signatures at once (eg. in one Autograph request).
 
-        if push_records:
-            changes_count = self.push_records_to_destination(request)
+        :returns: the number of changes pushed to each destination.
+        :rtype: list
+        """
+        changes_counts = []
+        pushed = []
+        for destination in destinations:
+            self.destination = destination
+            self.create_destination(request)
+
+            changes_count = 0
+            records = timestamp = None
+            if push_records:
+                changes_count, records, timestamp = self.push_records_to_destination(request)
+            changes_counts.append(changes_count)
+            pushed.append((records, timestamp))
+
+        signatures = self._sign_destinations(destinations, pushed)
 
-        records, timestamp = self.get_destination_records(empty_none=False)
-        serialized_records = canonical_json(records, timestamp)
-        logger.debug(f"{self.source_collection_uri}:\t'{serialized_records}'")
-        signature = self.signer.sign(serialized_records)
+        for destination, signature in zip(destinations, signatures):
+            self.destination = destination
+            self.set_destination_signature(signature, source_attributes, request)
 
-        self.set_destination_signature(signature, source_attributes, request)
         if next_source_status is not None:
             self.update_source_status(next_source_status, request, previous_source_status)
 
-        return changes_count
+        return changes_counts
 
     def refresh_signature(self, request, next_source_status=None):
         """Refresh the signature without moving records."""
-        records, timestamp = self.get_destination_records(empty_none=False)
-        serialized_records = canonical_json(records, timestamp)
-        logger.debug(f"{self.source_collection_uri}:\t'{serialized_records}'")
-        signature = self.signer.sign(serialized_records)
-        self.set_destination_signature(signature, request=request, source_attributes={})
+        self.refresh_signatures(request, [self.destination], next_source_status)
+
+    def refresh_signatures(self, request, destinations, next_source_status=None):
+        """Refresh the signatures of several destinations, using one call to the signer."""
+        signatures = self._sign_destinations(destinations)
+
+        for destination, signature in zip(destinations, signatures):
+            self.destination = destination
+            self.set_destination_signature(signature, request=request, source_attributes={})
 
         if next_source_status is not None:
             current_userid = request.prefixed_userid
@@ -151,76 +235,85 @@ class LocalUpdater(object):
             attrs[TRACKING_FIELDS.LAST_SIGNATURE_DATE.value] = current_date
             self._update_source_attributes(request, **attrs)
 
+    def _sign_destinations(self, destinations, pushed=None):
+        """Sign the records of the specified destinations.
+
+        Concurrent signatures of the same destinations content are coalesced
+        (see :attr:`single_flight`): the destinations are only listed, serialized
+        and signed once.
+
+        :param list pushed: the records and timestamp of each destination, if
+            known (eg. obtained when pushing the source changes).
+        """
+        if pushed is None:
+            pushed = [(None, None)] * len(destinations)
+
+        def sign():
+            payloads = []
+            for destination, (records, timestamp) in zip(destinations, pushed):
+                self.destination = destination
+                if records is None:
+                    records, timestamp = self.get_destination_records(empty_none=False)
+                payloads.append(self.serialize_records(records, timestamp))
+            return self._sign_many(payloads)
+
+        if self.single_flight is None:
+            return sign()
+
+        contents = []
+        for destination in destinations:
+            self.destination = destination
+            timestamp = self.storage.resource_timestamp(
+                parent_id=self.destination_collection_uri, resource_name="record"
+            )
+            contents.append(f"{self.destination_collection_uri}@{timestamp}")
+        return self.single_flight.do(",".join(contents), sign)
+
+    def _sign_many(self, payloads):
+        serialization = self.phases.durations.get("serialization", 0)
+        before = time.perf_counter()
+        signatures = self.signer.sign_many(payloads)
+        elapsed = time.perf_counter() - before
+        # Payloads are serialized while they are streamed to the signer.
+        serialization = self.phases.durations.get("serialization", 0) - serialization
+        self.phases.add("signer", elapsed - serialization)
+        # Only some signers (eg. Autograph) return a reference along the signature.
+        self.signature_refs.extend(
+            s["ref"] for s in signatures if isinstance(s, dict) and "ref" in s
+        )
+        return signatures
+
+    def serialize_records(self, records, timestamp):
+        """Serialize the specified records of the current destination.
+
+        The canonical JSON payload is returned as an iterator of chunks, so
+        that it can be streamed to the signer and is never built entirely in
+        memory. Records that were already serialized with the same timestamp
+        are obtained from the cache.
+        """
+        logger.debug(f"{self.destination_collection_uri}:\t{len(records)} records at {timestamp}")
+        chunks = canonical_json_chunks(
+            records, timestamp, cache=self.records_cache, namespace=self.destination_collection_uri
+        )
+        return self.phases.timed_chunks("serialization", chunks)
+
     def rollback_changes(self, request, refresh_last_edit=True, refresh_signature=False):
         """Restore the contents of *destination* to *source* (delete extras, recreate deleted,
         and restore changes) (eg. destination -> preview, or preview -> source).
         """
-        dest_records, _ = self.get_destination_records(empty_none=False)
-        dest_by_id = {r["id"]: r for r in dest_records}
-        source_records, _ = self.get_source_records()
-
-        changes_since_approval = records_diff(source_records, dest_records)
-
-        storage_kwargs = {"parent_id": self.source_collection_uri, "resource_name": "record"}
+        if self.streaming_page_size > 0:
+            changed_count = self._rollback_streamed_records(request)
+        else:
+            dest_records, _ = self.get_destination_records(empty_none=False)
+            dest_by_id = {r["id"]: r for r in dest_records}
+            source_records, _ = self.get_source_records()
 
-        changed_count = 0
-        for record in changes_since_approval:
-            action = None
-            record_before = None
-            impacted = None
-
-            dest_record = dest_by_id.get(record[FIELD_ID])
-            if dest_record is None:
-                # In source, but not in destination. Must be deleted.
-                if not record.get("deleted"):
-                    tombstone = self.storage.delete(
-                        object_id=record[FIELD_ID],
-                        last_modified=record[FIELD_LAST_MODIFIED],
-                        **storage_kwargs,
-                    )
-                    action = ACTIONS.DELETE
-                    record_before = record
-                    impacted = tombstone
-
-            # In dest_records, but not in source_records. Must be re-created.
-            elif record.get("deleted"):
-                self.storage.create(obj=dest_record, **storage_kwargs)
-                action = ACTIONS.CREATE
-                record_before = None
-                impacted = dest_record
-
-            # Differ, restore attributes of dest_record in source.
-            else:
-                self.storage.update(object_id=record[FIELD_ID], obj=dest_record, **storage_kwargs)
-                action = ACTIONS.UPDATE
-                record_before = record
-                impacted = dest_record
-
-            if action is not None:
-                changed_count += 1
-                # Notify resource event, in order to leave a trace in the history.
-                matchdict = {
-                    "bucket_id": self.destination["bucket"],
-                    "collection_id": self.destination["collection"],
-                    FIELD_ID: record[FIELD_ID],
-                }
-                record_uri = (
-                    "/buckets/{bucket_id}/collections/{collection_id}/records/{id}"
-                ).format(**matchdict)
-
-                notify_resource_event(
-                    request,
-                    {
-                        "method": "DELETE" if action == ACTIONS.DELETE else "PUT",
-                        "path": record_uri,
-                    },
-                    matchdict=matchdict,
-                    resource_name="record",
-                    parent_id=self.source_collection_uri,
-                    obj=impacted,
-                    action=action,
-                    old=record_before,
-                )
+            changes_since_approval = self.records_diff(source_records, dest_records)
+            pairs = [
+                (None if r.get("deleted") else r, dest_by_id.get(r[FIELD_ID]))
+                for r in changes_since_approval
+            ]
+            changed_count = self._rollback_records(request, pairs)
 
         if refresh_last_edit:
             current_userid = request.prefixed_userid
@@ -236,6 +329,122 @@ class LocalUpdater(object):
 
         return changed_count
 
+    def _rollback_records(self, request, pairs):
+        """Restore the destination version of the specified records in the source.
+
+        :param list pairs: the ``(source_record, dest_record)`` tuples of the records
+            that differ (``None`` if missing on one side).
+        :returns: the number of restored records.
+        :rtype: int
+        """
+        storage_kwargs = {"parent_id": self.source_collection_uri, "resource_name": "record"}
+
+        changes = []
+        to_delete = []
+        with self.phases.phase("push"):
+            for record, dest_record in pairs:
+                if dest_record is None:
+                    # In source, but not in destination. Must be deleted.
+                    # Deletions are grouped in a single storage call (see below).
+                    to_delete.append(record[FIELD_ID])
+                    changes.append((ACTIONS.DELETE, record[FIELD_ID], None, record))
+
+                # In dest_records, but not in source_records. Must be re-created.
+                elif record is None:
+                    self.storage.create(obj=dest_record, **storage_kwargs)
+                    changes.append((ACTIONS.CREATE, dest_record[FIELD_ID], dest_record, None))
+
+                # Differ, restore attributes of dest_record in source.
+                else:
+                    self.storage.update(
+                        object_id=record[FIELD_ID], obj=dest_record, **storage_kwargs
+                    )
+                    changes.append((ACTIONS.UPDATE, record[FIELD_ID], dest_record, record))
+
+            tombstones = self._delete_records(self.source_collection_uri, to_delete)
+
+        # Notify resource events, in order to leave a trace in the history.
+        changed_count = self._notify_records_events(
+            request, self.source_collection_uri, changes, tombstones
+        )
+        self.phases.gauge("changes", changed_count)
+        return changed_count
+
+    def _rollback_streamed_records(self, request):
+        """Same as :meth:`_rollback_records`, comparing the source and destination
+        page by page.
+
+        :returns: the number of restored records.
+        """
+        changed_count = 0
+        for pairs in self._iter_records_diff():
+            changed_count += self._rollback_records(request, pairs)
+        return changed_count
+
+    def _iter_pages(self, parent_id, until, after=None, up_to=None):
+        """Iterate the records of the collection sorted by id, page by page.
+
+        Only the records modified before the ``until`` timestamp are returned,
+        so that the records written during the iteration are ignored.
+        The ``after`` and ``up_to`` ids optionally restrict the range of ids,
+        as compared by the storage backend.
+        """
+        filters = [Filter(FIELD_LAST_MODIFIED, until, COMPARISON.MAX)]
+        if after is not None:
+            filters.append(Filter(FIELD_ID, after, COMPARISON.GT))
+        if up_to is not None:
+            filters.append(Filter(FIELD_ID, up_to, COMPARISON.MAX))
+        sorting = [Sort(FIELD_ID, 1)]
+        pagination_rules = None
+        if parent_id == self.source_collection_uri:
+            phase = "source_listing"
+        else:
+            phase = "destination_listing"
+        while True:
+            with self.phases.phase(phase):
+                page = self.storage.list_all(
+                    parent_id=parent_id,
+                    resource_name="record",
+                    filters=filters,
+                    sorting=sorting,
+                    pagination_rules=pagination_rules,
+                    limit=self.streaming_page_size,
+                )
+            if page:
+                yield page
+            if len(page) < self.streaming_page_size:
+                return
+            pagination_rules = [[Filter(FIELD_ID, page[-1][FIELD_ID], COMPARISON.GT)]]
+
+    def _iter_records_diff(self):
+        """Compare the source and destination page by page (see :func:`diff.iter_records_diff`).
+
+        :returns: an iterator of lists of ``(source_record, dest_record)`` tuples.
+        """
+        source_timestamp = self.storage.resource_timestamp(
+            parent_id=self.source_collection_uri, resource_name="record"
+        )
+        dest_timestamp = self.storage.resource_timestamp(
+            parent_id=self.destination_collection_uri, resource_name="record"
+        )
+
+        def dest_range(after, up_to):
+            return self._iter_pages(
+                self.destination_collection_uri, until=dest_timestamp, after=after, up_to=up_to
+            )
+
+        pairs = diff.iter_records_diff(
+            self._iter_pages(self.source_collection_uri, until=source_timestamp), dest_range
+        )
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) >= self.streaming_page_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     def create_destination(self, request):
         """Create the destination bucket/collection if they don't already exist."""
         # With the current implementation, the destination is not writable by
@@ -266,135 +475,329 @@ class LocalUpdater(object):
             matchdict={"bucket_id": bucket_name, "id": collection_name},
         )
 
-    def _get_records(self, resource, empty_none=True):
+    def records_diff(self, source_records, dest_records):
+        """Compare the source and destination records (see :func:`utils.records_diff`)."""
+        with self.phases.phase("diff"):
+            return records_diff(source_records, dest_records)
+
+    def _get_records(self, resource, kind, empty_none=True):
         bid = resource["bucket"]
         cid = resource["collection"]
         parent_id = f"/buckets/{bid}/collections/{cid}"
 
-        records = self.storage.list_all(parent_id=parent_id, resource_name="record")
+        collection_timestamp = self.storage.resource_timestamp(
+            parent_id=parent_id, resource_name="record"
+        )
+        # Collections are listed once per timestamp, eg. the source is shared
+        # by the preview and destination passes of the same transition.
+        records = self._snapshots.get((parent_id, collection_timestamp))
+        if records is None:
+            with self.phases.phase(f"{kind}_listing"):
+                records = self.storage.list_all(parent_id=parent_id, resource_name="record")
+            self.phases.gauge(f"{kind}_records", len(records))
+            self._snapshots[(parent_id, collection_timestamp)] = records
 
         if len(records) == 0 and empty_none:
             # When the collection empty (no records and no tombstones)
             collection_timestamp = None
-        else:
-            collection_timestamp = self.storage.resource_timestamp(
-                parent_id=parent_id, resource_name="record"
-            )
 
         return records, collection_timestamp
 
     def get_source_records(self, **kwargs):
-        return self._get_records(self.source, **kwargs)
+        return self._get_records(self.source, kind="source", **kwargs)
 
     def get_destination_records(self, **kwargs):
-        return self._get_records(self.destination, **kwargs)
+        return self._get_records(self.destination, kind="destination", **kwargs)
 
     def push_records_to_destination(self, request):
+        """Apply the changes of the source to the destination.
+
+        If the destination was not modified since the last publication, only
+        the source changes that occured since then are fetched (see
+        :meth:`_push_source_changes`). Otherwise, or if the result is not
+        consistent, all records of the source and destination are listed and
+        compared.
+
+        :returns: the number of changes pushed to the destination, and the
+            resulting destination records and timestamp. The records are ``None``
+            if the destination was not listed (ie. only the source changes were
+            fetched).
+        :rtype: tuple
+        """
+        source_timestamp = self.storage.resource_timestamp(
+            parent_id=self.source_collection_uri, resource_name="record"
+        )
+        dest_timestamp = self.storage.resource_timestamp(
+            parent_id=self.destination_collection_uri, resource_name="record"
+        )
+
+        changes_count = None
+        dest_records = None
+        watermark = self._get_destination_watermark()
+        if watermark.get("records_timestamp") == dest_timestamp:
+            changes_count = self._push_source_changes(request, since=watermark["source_timestamp"])
+        if changes_count is None:
+            if self.streaming_page_size > 0:
+                changes_count = self._push_streamed_records(request)
+            else:
+                changes_count, dest_records = self._push_all_records(request)
+
+        dest_timestamp = self.storage.resource_timestamp(
+            parent_id=self.destination_collection_uri, resource_name="record"
+        )
+        if dest_records is not None:
+            self._snapshots[(self.destination_collection_uri, dest_timestamp)] = dest_records
+        # Once published, the watermark is saved along the signature.
+        self._watermarks[self.destination_collection_uri] = {
+            "source_timestamp": source_timestamp,
+            "records_timestamp": dest_timestamp,
+        }
+        return changes_count, dest_records, dest_timestamp
+
+    def _get_destination_watermark(self):
+        """Return the watermark of the last publication, stored in the destination metadata."""
+        collection_record = self.storage.get(
+            parent_id=self.destination_bucket_uri,
+            resource_name="collection",
+            object_id=self.destination["collection"],
+        )
+        watermark = collection_record.get(WATERMARK_FIELD)
+        return watermark if isinstance(watermark, dict) else {}
+
+    def _push_all_records(self, request):
         dest_records, dest_timestamp = self.get_destination_records()
         source_records, source_timestamp = self.get_source_records()
-        new_records = records_diff(source_records, dest_records)
+        new_records = self.records_diff(source_records, dest_records)
         changes_count = len(new_records)
 
         if len(new_records) == 0:
-            return
+            return 0, dest_records
+
+        # The destination records were all just listed: use them to obtain
+        # the previous version of the changed records, instead of fetching
+        # them one by one.
+        dest_by_id = {r[FIELD_ID]: r for r in dest_records if not r.get("deleted", False)}
+
+        pushed = self._apply_changes(request, new_records, dest_by_id)
+
+        # Build the resulting destination content, instead of listing it again.
+        dest_by_id.update(pushed)
+        dest_records = [r for r in dest_by_id.values() if r is not None]
+
+        return changes_count, dest_records
+
+    def _push_streamed_records(self, request):
+        """Apply the source changes to the destination, comparing them page by page.
+
+        :returns: the number of changes.
+        """
+        changes_count = 0
+        for pairs in self._iter_records_diff():
+            new_records = []
+            dest_by_id = {}
+            for record, dest_record in pairs:
+                if record is None:
+                    record = {**dest_record, "deleted": True}
+                if dest_record is not None:
+                    dest_by_id[dest_record[FIELD_ID]] = dest_record
+                new_records.append(record)
+            self._apply_changes(request, new_records, dest_by_id)
+            changes_count += len(new_records)
+        return changes_count
+
+    def _push_source_changes(self, request, since):
+        """Apply the source changes (including deletions) that occured after the
+        ``since`` timestamp. The previous version of the changed records is
+        obtained with a single lookup in the destination.
+
+        Since tombstones may have been purged from the source, the number of
+        records in both collections is compared afterwards.
+
+        :returns: the number of changes, or ``None`` if the destination is not
+            consistent with the source.
+        """
+        with self.phases.phase("source_listing"):
+            source_changes = self.storage.list_all(
+                parent_id=self.source_collection_uri,
+                resource_name="record",
+                filters=[Filter(FIELD_LAST_MODIFIED, since, COMPARISON.GT)],
+                include_deleted=True,
+            )
+        dest_by_id = {}
+        if len(source_changes) > 0:
+            with self.phases.phase("destination_listing"):
+                dest_records = self.storage.list_all(
+                    parent_id=self.destination_collection_uri,
+                    resource_name="record",
+                    filters=[
+                        Filter(FIELD_ID, [r[FIELD_ID] for r in source_changes], COMPARISON.IN)
+                    ],
+                )
+            dest_by_id = {r[FIELD_ID]: r for r in dest_records}
+
+        new_records = []
+        with self.phases.phase("diff"):
+            for record in source_changes:
+                before = dest_by_id.get(record[FIELD_ID])
+                if record.get("deleted", False):
+                    if before is not None:
+                        new_records.append(record)
+                elif before is None or not records_equal(before, record):
+                    new_records.append(record)
+
+        self._apply_changes(request, new_records, dest_by_id)
+
+        source_count = self.storage.count_all(
+            parent_id=self.source_collection_uri, resource_name="record"
+        )
+        dest_count = self.storage.count_all(
+            parent_id=self.destination_collection_uri, resource_name="record"
+        )
+        if source_count != dest_count:
+            logger.warning(
+                f"{self.destination_collection_uri} is not consistent with "
+                f"{self.source_collection_uri}, compare all records."
+            )
+            return None
+
+        return len(new_records)
+
+    def _apply_changes(self, request, new_records, dest_by_id):
+        """Apply the changes to the destination.
+
+        :returns: the new version of the changed records by id (``None`` if deleted).
+        :rtype: dict
+        """
+        storage_kwargs = {
+            "parent_id": self.destination_collection_uri,
+            "resource_name": "record",
+        }
 
         # Update the destination collection.
-        for record in new_records:
-            storage_kwargs = {
-                "parent_id": self.destination_collection_uri,
-                "resource_name": "record",
-            }
-            try:
-                before = self.storage.get(object_id=record[FIELD_ID], **storage_kwargs)
-            except RecordNotFoundError:
-                before = None
-
-            # Timestamp should be bumped in destination.
-            record = {**record}
-            del record[FIELD_LAST_MODIFIED]
-
-            deleted = record.get("deleted", False)
-            if deleted:
-                try:
-                    pushed = self.storage.delete(
-                        object_id=record[FIELD_ID],
-                        **storage_kwargs,
-                    )
-                    action = ACTIONS.DELETE
-                except RecordNotFoundError:
-                    # If the record doesn't exists in the destination
-                    # we are good and can ignore it.
-                    continue
-            else:
-                if before is None:
+        changes = []
+        to_delete = []
+        with self.phases.phase("push"):
+            for record in new_records:
+                before = dest_by_id.get(record[FIELD_ID])
+
+                # Timestamp should be bumped in destination.
+                record = {**record}
+                del record[FIELD_LAST_MODIFIED]
+
+                if record.get("deleted", False):
+                    if before is None:
+                        # The record doesn't exist in the destination,
+                        # we are good and can ignore it.
+                        continue
+                    # Deletions are grouped in a single storage call (see below).
+                    to_delete.append(record[FIELD_ID])
+                    changes.append((ACTIONS.DELETE, record[FIELD_ID], None, before))
+                elif before is None:
                     pushed = self.storage.create(obj=record, **storage_kwargs)
-                    action = ACTIONS.CREATE
+                    changes.append((ACTIONS.CREATE, record[FIELD_ID], pushed, before))
                 else:
                     pushed = self.storage.update(
                         object_id=record[FIELD_ID], obj=record, **storage_kwargs
                     )
-                    action = ACTIONS.UPDATE
+                    changes.append((ACTIONS.UPDATE, record[FIELD_ID], pushed, before))
 
-            matchdict = {
-                "bucket_id": self.destination["bucket"],
-                "collection_id": self.destination["collection"],
-                FIELD_ID: record[FIELD_ID],
-            }
-            bid = matchdict["bucket_id"]
-            cid = matchdict["collection_id"]
-            rid = matchdict["id"]
-            record_uri = f"/buckets/{bid}/collections/{cid}/records/{rid}"
+            tombstones = self._delete_records(self.destination_collection_uri, to_delete)
 
-            notify_resource_event(
-                request,
-                {"method": "DELETE" if deleted else "PUT", "path": record_uri},
-                matchdict=matchdict,
-                resource_name="record",
-                parent_id=self.destination_collection_uri,
-                obj=pushed,
-                action=action,
-                old=before,
-            )
+        changes_count = self._notify_records_events(
+            request, self.destination_collection_uri, changes, tombstones
+        )
+        self.phases.gauge("changes", changes_count)
 
-        return changes_count
+        return {record_id: new for _, record_id, new, _ in changes}
+
+    def _delete_records(self, parent_id, record_ids):
+        """Delete the specified records using a single storage call.
+
+        :returns: the tombstones of the deleted records, by id.
+        :rtype: dict
+        """
+        if len(record_ids) == 0:
+            return {}
+        tombstones = self.storage.delete_all(
+            resource_name="record",
+            parent_id=parent_id,
+            filters=[Filter(FIELD_ID, record_ids, COMPARISON.IN)],
+        )
+        return {t[FIELD_ID]: t for t in tombstones}
+
+    def _notify_records_events(self, request, parent_id, changes, tombstones):
+        """Notify the resource events of the records changed in ``parent_id``.
+
+        :param list changes: the ``(action, record_id, new, old)`` tuples of the
+            changed records. The new version of deleted records is taken from
+            ``tombstones``.
+        :returns: the number of notified changes.
+        :rtype: int
+        """
+        bid = self.destination["bucket"]
+        cid = self.destination["collection"]
+        events = []
+        for action, record_id, new, old in changes:
+            if action == ACTIONS.DELETE:
+                new = tombstones.get(record_id)
+                if new is None:
+                    # Already deleted in the meantime.
+                    continue
+            matchdict = {"bucket_id": bid, "collection_id": cid, FIELD_ID: record_id}
+            record_uri = f"/buckets/{bid}/collections/{cid}/records/{record_id}"
+            request_options = {
+                "method": "DELETE" if action == ACTIONS.DELETE else "PUT",
+                "path": record_uri,
+            }
+            events.append((action, request_options, matchdict, new, old))
+
+        with self.phases.phase("events"):
+            notify_resource_events(request, "record", parent_id=parent_id, changes=events)
+        return len(events)
 
     def set_destination_signature(self, signature, source_attributes, request):
         # Push the new signature to the destination collection.
         parent_id = "/buckets/%s" % self.destination["bucket"]
         collection_id = "collection"
 
-        collection_record = self.storage.get(
-            parent_id=parent_id,
-            resource_name=collection_id,
-            object_id=self.destination["collection"],
-        )
-
-        # Update the collection_record
-        new_collection = dict(**collection_record)
-        new_collection.pop(FIELD_LAST_MODIFIED, None)
-        new_collection["signature"] = signature
-        for attr in PUBLISHED_COLLECTION_FIELDS:
-            if attr in source_attributes:
-                new_collection.setdefault(attr, source_attributes[attr])
+        with self.phases.phase("metadata"):
+            collection_record = self.storage.get(
+                parent_id=parent_id,
+                resource_name=collection_id,
+                object_id=self.destination["collection"],
+            )
 
-        updated = self.storage.update(
-            parent_id=parent_id,
-            resource_name=collection_id,
-            object_id=self.destination["collection"],
-            obj=new_collection,
-        )
+            # Update the collection_record
+            new_collection = dict(**collection_record)
+            new_collection.pop(FIELD_LAST_MODIFIED, None)
+            new_collection["signature"] = signature
+            watermark = self._watermarks.pop(self.destination_collection_uri, None)
+            if watermark is not None:
+                new_collection[WATERMARK_FIELD] = watermark
+            for attr in PUBLISHED_COLLECTION_FIELDS:
+                if attr in source_attributes:
+                    new_collection.setdefault(attr, source_attributes[attr])
+
+            updated = self.storage.update(
+                parent_id=parent_id,
+                resource_name=collection_id,
+                object_id=self.destination["collection"],
+                obj=new_collection,
+            )
 
         matchdict = dict(bucket_id=self.destination["bucket"], id=self.destination["collection"])
-        notify_resource_event(
-            request,
-            {"method": "PUT", "path": self.destination_collection_uri},
-            matchdict=matchdict,
-            resource_name="collection",
-            parent_id=self.destination_bucket_uri,
-            obj=updated,
-            action=ACTIONS.UPDATE,
-            old=collection_record,
-        )
+        with self.phases.phase("events"):
+            notify_resource_event(
+                request,
+                {"method": "PUT", "path": self.destination_collection_uri},
+                matchdict=matchdict,
+                resource_name="collection",
+                parent_id=self.destination_bucket_uri,
+                obj=updated,
+                action=ACTIONS.UPDATE,
+                old=collection_record,
+            )
+        return updated
 
     def update_source_review_request_by(self, request):
         current_date = datetime.datetime.now(datetime.timezone.utc).isoformat()
@@ -430,32 +833,37 @@ class LocalUpdater(object):
         parent_id = "/buckets/%s" % self.source["bucket"]
         resource_name = "collection"
 
-        collection_record = self.storage.get(
-            parent_id=parent_id, resource_name=resource_name, object_id=self.source["collection"]
-        )
+        with self.phases.phase("metadata"):
+            collection_record = self.storage.get(
+                parent_id=parent_id,
+                resource_name=resource_name,
+                object_id=self.source["collection"],
+            )
 
-        # Update the collection_record
-        new_collection = dict(**collection_record)
-        new_collection.update(**kwargs)
+            # Update the collection_record
+            new_collection = dict(**collection_record)
+            new_collection.update(**kwargs)
 
-        # Remove last_modified to be sure it's bumped.
-        new_collection.pop("last_modified", None)
+            # Remove last_modified to be sure it's bumped.
+            new_collection.pop("last_modified", None)
 
-        updated = self.storage.update(
-            parent_id=parent_id,
-            resource_name=resource_name,
-            object_id=self.source["collection"],
-            obj=new_collection,
-        )
+            updated = self.storage.update(
+                parent_id=parent_id,
+                resource_name=resource_name,
+                object_id=self.source["collection"],
+                obj=new_collection,
+            )
 
         matchdict = dict(bucket_id=self.source["bucket"], id=self.source["collection"])
-        notify_resource_event(
-            request,
-            {"method": "PUT", "path": self.source_collection_uri},
-            matchdict=matchdict,
-            resource_name="collection",
-            parent_id=self.source_bucket_uri,
-            obj=updated,
-            action=ACTIONS.UPDATE,
-            old=collection_record,
-        )
+        with self.phases.phase("events"):
+            notify_resource_event(
+                request,
+                {"method": "PUT", "path": self.source_collection_uri},
+                matchdict=matchdict,
+                resource_name="collection",
+                parent_id=self.source_bucket_uri,
+                obj=updated,
+                action=ACTIONS.UPDATE,
+                old=collection_record,
+            )
+        return updated
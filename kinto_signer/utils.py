@@ -1,3 +1,5 @@
+import copy
+import re
 from collections import OrderedDict
 
 from kinto.views import NameGenerator
@@ -20,6 +22,8 @@ class STATUS(Enum):
     TO_REVIEW = "to-review"
     TO_ROLLBACK = "to-rollback"
     SIGNED = "signed"
+    # Transitional status, while the signature is applied in background (async mode).
+    SIGNING = "signing"
 
     def __eq__(self, other):
         if not hasattr(other, "value"):
@@ -137,6 +141,65 @@ def parse_resources(raw_resources):
     return resources
 
 
+class ResourcesIndex(OrderedDict):
+    """The configured resources, indexed by source URI, with memoized lookups of
+    the resource and signer of any collection.
+
+    Per-bucket resources are expanded once per collection, as if they had been
+    configured explicitly for it.
+
+    :param dict resources: the resources, as returned by :func:`parse_resources`.
+    :param dict signers: the signers instances, indexed like ``resources``.
+    """
+
+    def __init__(self, resources, signers):
+        super().__init__(resources)
+        self.signers = signers
+        self._buckets = {r["source"]["bucket"] for r in resources.values()}
+        self._resolved = {}
+
+    def resolve(self, bucket_id, collection_id):
+        """Return the resource and signer of the specified collection
+        (``None`` if not configured).
+
+        :rtype: tuple
+        """
+        if bucket_id not in self._buckets:
+            return None, None
+
+        key = (bucket_id, collection_id)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        bucket_key = f"/buckets/{bucket_id}"
+        collection_key = f"/buckets/{bucket_id}/collections/{collection_id}"
+
+        resource = signer = None
+
+        # Review might have been configured explictly for this collection,
+        if collection_key in self:
+            resource = self[collection_key]
+        elif bucket_key in self:
+            # Or via its bucket.
+            resource = copy.deepcopy(self[bucket_key])
+            # Since it was configured per bucket, we want to make this
+            # resource look as if it was configured explicitly for this
+            # collection.
+            resource["source"]["collection"] = collection_id
+            resource["destination"]["collection"] = collection_id
+            if "preview" in resource:
+                resource["preview"]["collection"] = collection_id
+
+        if collection_key in self.signers:
+            signer = self.signers[collection_key]
+        elif bucket_key in self.signers:
+            signer = self.signers[bucket_key]
+
+        return self._resolved.setdefault(key, (resource, signer))
+
+
 def get_first_matching_setting(setting_name, settings, prefixes, default=None):
     for prefix in prefixes:
         prefixed_setting_name = prefix + setting_name
@@ -169,37 +232,111 @@ def notify_resource_event(
     request, request_options, matchdict, resource_name, parent_id, obj, action, old=None
 ):
     """Helper that triggers resource events as real requests."""
-    fakerequest = build_request(request, request_options)
-    fakerequest.matchdict = matchdict
-    fakerequest.bound_data = request.bound_data
-    fakerequest.authn_type, fakerequest.selected_userid = PLUGIN_USERID.split(":")
-    fakerequest.current_resource_name = resource_name
-
-    # When kinto-signer copies record from one place to another,
-    # it simulates a resource event. Since kinto-attachment
-    # prevents from updating attachment fields, it throws an error.
-    # The following flag will disable the kinto-attachment check.
-    # See https://github.com/Kinto/kinto-signer/issues/256
-    # and https://bugzilla.mozilla.org/show_bug.cgi?id=1470812
-    has_changed_attachment = (
-        resource_name == "record"
-        and action == ACTIONS.UPDATE
-        and "attachment" in old
-        and old["attachment"] != obj.get("attachment")
+    notify_resource_events(
+        request,
+        resource_name=resource_name,
+        parent_id=parent_id,
+        changes=[(action, request_options, matchdict, obj, old)],
     )
-    if has_changed_attachment:
-        fakerequest._attachment_auto_save = True
 
-    fakerequest.notify_resource_event(
-        parent_id=parent_id, timestamp=obj[FIELD_LAST_MODIFIED], data=obj, action=action, old=old
-    )
+
+def notify_resource_events(request, resource_name, parent_id, changes):
+    """Helper that triggers the resource events of several objects at once.
+
+    :param list changes: the ``(action, request_options, matchdict, obj, old)``
+        tuples of the changed objects.
+
+    Like in Kinto batch requests, the impacted objects of the same action are
+    aggregated into one event, and only one fake request is built per action.
+    """
+    by_action = OrderedDict()
+    for action, request_options, matchdict, obj, old in changes:
+        by_action.setdefault(action, []).append((request_options, matchdict, obj, old))
+
+    for action, action_changes in by_action.items():
+        request_options, matchdict, _, _ = action_changes[0]
+        fakerequest = build_request(request, request_options)
+        fakerequest.matchdict = matchdict
+        fakerequest.bound_data = request.bound_data
+        fakerequest.authn_type, fakerequest.selected_userid = PLUGIN_USERID.split(":")
+        fakerequest.current_resource_name = resource_name
+
+        # When kinto-signer copies record from one place to another,
+        # it simulates a resource event. Since kinto-attachment
+        # prevents from updating attachment fields, it throws an error.
+        # The following flag will disable the kinto-attachment check.
+        # See https://github.com/Kinto/kinto-signer/issues/256
+        # and https://bugzilla.mozilla.org/show_bug.cgi?id=1470812
+        has_changed_attachment = (
+            resource_name == "record"
+            and action == ACTIONS.UPDATE
+            and any(
+                "attachment" in old and old["attachment"] != obj.get("attachment")
+                for _, _, obj, old in action_changes
+            )
+        )
+        if has_changed_attachment:
+            fakerequest._attachment_auto_save = True
+
+        for _, _, obj, old in action_changes:
+            fakerequest.notify_resource_event(
+                parent_id=parent_id,
+                timestamp=obj[FIELD_LAST_MODIFIED],
+                data=obj,
+                action=action,
+                old=old,
+            )
+
+
+# A JSON number with a fraction or an exponent always has a digit followed by one of these.
+_FLOAT_TOKEN = re.compile(rb"[0-9][.eE]")
+
+
+def may_contain_float(raw_json):
+    """Return ``False`` if the specified JSON bytes cannot contain any float value.
+
+    This is a quick check on the raw document: a ``True`` result only means that
+    the decoded values have to be scanned (eg. digits followed by a dot in a string).
+    """
+    return _FLOAT_TOKEN.search(raw_json) is not None
+
+
+def find_float_paths(obj):
+    """Return the JSON paths of the float values in the specified object
+    (eg. ``["a.b", "c[0]"]``).
+
+    Nested dicts and lists are walked iteratively, and the paths are only built
+    for containers and floats.
+    """
+    paths = []
+    stack = [("", obj)]
+    while stack:
+        path, container = stack.pop()
+        if isinstance(container, dict):
+            prefix = f"{path}." if path else ""
+            children = []
+            for key, value in container.items():
+                if isinstance(value, float):
+                    paths.append(f"{prefix}{key}")
+                elif isinstance(value, (dict, list)):
+                    children.append((f"{prefix}{key}", value))
+        else:
+            children = []
+            for index, value in enumerate(container):
+                if isinstance(value, float):
+                    paths.append(f"{path}[{index}]")
+                elif isinstance(value, (dict, list)):
+                    children.append((f"{path}[{index}]", value))
+        stack.extend(children)
+    return paths
+
+
+# Fields that are not compared, overridden in copies of the records (faster than filtering).
+_IGNORED_FIELDS = {"last_modified": None, "schema": None}
 
 
 def records_equal(a, b):
-    ignore_fields = ("last_modified", "schema")
-    ac = {k: v for k, v in a.items() if k not in ignore_fields}
-    bc = {k: v for k, v in b.items() if k not in ignore_fields}
-    return ac == bc
+    return {**a, **_IGNORED_FIELDS} == {**b, **_IGNORED_FIELDS}
 
 
 def records_diff(left, right):
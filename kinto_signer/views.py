@@ -0,0 +1,24 @@
+from kinto.core import Service
+from pyramid.security import NO_PERMISSION_REQUIRED
+
+from kinto_signer.listeners import raise_forbidden
+
+
+signer_operations = Service(
+    name="signer_operations",
+    description="Last signer operations of this process",
+    path="/__signer_operations__",
+)
+
+
+@signer_operations.get(permission=NO_PERMISSION_REQUIRED)
+def get_signer_operations(request):
+    """List the last review transitions run by this process, with the duration
+    of their phases, the records counts and the signer references.
+
+    Only available to the principals of the ``signer.operations_principals`` setting.
+    """
+    allowed = request.registry.signer_operations_principals
+    if not allowed.intersection(request.prefixed_principals):
+        raise_forbidden(message="Not allowed to list signer operations")
+    return {"data": request.registry.signer_operations.list()}
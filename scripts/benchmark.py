@@ -0,0 +1,277 @@
+"""Benchmark the sign-off workflow on synthetic collections.
+
+A Kinto application is instantiated in process, with the memory storage
+backend (or a local PostgreSQL, see ``--storage-url``) and a local ECDSA
+signer. For each collection size, the source collection is seeded with
+random records, and the review workflow is driven through the API, so
+that the ``sign_collection_data`` listener and the ``LocalUpdater`` run
+exactly as they do in production.
+
+The duration of each transition (``to-review``, ``to-sign``, ``to-resign``,
+``to-rollback``) is reported, along with the time spent in each of its phases
+(listing, diff, serialization, signer...), as returned by the plugin in the
+``Server-Timing`` response header. They are compared with the baselines
+previously stored with ``--save-baseline``. The script exits with an error
+code if any phase is slower than its baseline by more than the tolerance.
+
+    $ python scripts/benchmark.py --sizes 1000 10000 --save-baseline
+    $ python scripts/benchmark.py --sizes 1000 10000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+import uuid
+
+import transaction
+import webtest
+from kinto import main as kinto_main
+from kinto.core.testing import get_user_headers
+
+from kinto_signer.generate_keypair import generate_keypair
+
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_BASELINE = "benchmark-baselines.json"
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_MIN_SECONDS = 0.01
+
+TRANSITIONS = ("to-review", "to-sign", "to-resign", "to-rollback")
+
+#: Name of the whole transition duration, along with the signer phases.
+TOTAL = "total"
+
+SOURCE_BUCKET = "bench"
+
+
+def _rand(size=10):
+    return "".join(random.choice(string.ascii_letters) for _ in range(size))
+
+
+def _random_record():
+    return {
+        "id": str(uuid.uuid4()),
+        "name": _rand(20),
+        "enabled": random.choice((True, False)),
+        "details": {"tags": [_rand(5) for _ in range(3)], "rank": random.randint(0, 1000)},
+    }
+
+
+def _get_args():
+    parser = argparse.ArgumentParser(description="Sign-off workflow benchmark")
+
+    parser.add_argument(
+        "--sizes",
+        help="Number of records in collections",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+    )
+    parser.add_argument(
+        "--storage-url",
+        help="PostgreSQL URL (eg. postgresql://postgres@localhost/bench). "
+        "Uses the memory backend if not specified.",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--changes",
+        help="Ratio of records changed before rollback",
+        type=float,
+        default=0.01,
+    )
+    parser.add_argument(
+        "--baseline", help="Baselines JSON file", type=str, default=DEFAULT_BASELINE
+    )
+    parser.add_argument(
+        "--save-baseline", help="Store results as new baselines", action="store_true"
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="Allowed slowdown ratio compared to baselines",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+    )
+    parser.add_argument(
+        "--min-seconds",
+        help="Phases shorter than this duration are not compared to baselines",
+        type=float,
+        default=DEFAULT_MIN_SECONDS,
+    )
+
+    return parser.parse_args()
+
+
+def make_app(keys_folder, storage_url=None):
+    private_key = os.path.join(keys_folder, "ecdsa.private.pem")
+    public_key = os.path.join(keys_folder, "ecdsa.public.pem")
+    generate_keypair(private_key, public_key)
+
+    settings = {
+        "kinto.userid_hmac_secret": "benchmark",
+        "multiauth.policies": "basicauth",
+        "kinto.includes": "kinto_signer",
+        "kinto.signer.resources": (
+            f"/buckets/{SOURCE_BUCKET} -> "
+            f"/buckets/{SOURCE_BUCKET}-preview -> "
+            f"/buckets/{SOURCE_BUCKET}-prod"
+        ),
+        "kinto.signer.to_review_enabled": "false",
+        "kinto.signer.group_check_enabled": "false",
+        "kinto.signer.signer_backend": "kinto_signer.signer.local_ecdsa",
+        "kinto.signer.ecdsa.private_key": private_key,
+        "kinto.signer.ecdsa.public_key": public_key,
+        "kinto.cache_backend": "kinto.core.cache.memory",
+    }
+    if storage_url:
+        settings["kinto.storage_backend"] = "kinto.core.storage.postgresql"
+        settings["kinto.storage_url"] = storage_url
+        settings["kinto.permission_backend"] = "kinto.core.permission.postgresql"
+        settings["kinto.permission_url"] = storage_url
+    else:
+        settings["kinto.storage_backend"] = "kinto.core.storage.memory"
+        settings["kinto.permission_backend"] = "kinto.core.permission.memory"
+
+    app = webtest.TestApp(kinto_main({}, **settings))
+    registry = app.app.registry
+    registry.storage.initialize_schema()
+    registry.permission.initialize_schema()
+    return app
+
+
+def seed_collection(app, headers, collection_uri, size):
+    """Create the source collection and fill it directly via the storage backend,
+    in order to leave the seeding out of the measures."""
+    app.put_json(f"/v1/buckets/{SOURCE_BUCKET}", headers=headers)
+    app.put_json(f"/v1{collection_uri}", headers=headers)
+
+    storage = app.app.registry.storage
+    records = []
+    for _ in range(size):
+        record = storage.create(
+            resource_name="record", parent_id=collection_uri, obj=_random_record()
+        )
+        records.append(record)
+    transaction.commit()
+    return records
+
+
+def change_records(app, collection_uri, records, ratio):
+    storage = app.app.registry.storage
+    count = max(1, int(len(records) * ratio))
+    for record in random.sample(records, count):
+        obj = {**record, "name": _rand(20)}
+        obj.pop("last_modified")
+        storage.update(
+            resource_name="record", parent_id=collection_uri, object_id=record["id"], obj=obj
+        )
+    transaction.commit()
+
+
+def parse_server_timing(header):
+    """Return the durations in seconds of the signer phases, by name, from the
+    ``Server-Timing`` header (see ``metrics.server_timing_tween_factory``).
+
+    >>> parse_server_timing("signer-diff;dur=12.500, signer-push;dur=3.000")
+    {'diff': 0.0125, 'push': 0.003}
+    """
+    durations = {}
+    for metric in filter(None, (m.strip() for m in header.split(","))):
+        name, *params = metric.split(";")
+        params = dict(p.strip().split("=", 1) for p in params if "=" in p)
+        prefix, _, phase = name.partition("-")
+        if prefix == "signer" and "dur" in params:
+            durations[phase] = float(params["dur"]) / 1000
+    return durations
+
+
+def run(app, headers, size, changes_ratio):
+    collection_id = f"records-{size}"
+    collection_uri = f"/buckets/{SOURCE_BUCKET}/collections/{collection_id}"
+    records = seed_collection(app, headers, collection_uri, size)
+
+    def transition(status):
+        before = time.perf_counter()
+        resp = app.patch_json(
+            f"/v1{collection_uri}", {"data": {"status": status}}, headers=headers
+        )
+        elapsed = time.perf_counter() - before
+        phases = {TOTAL: elapsed, **parse_server_timing(resp.headers.get("Server-Timing", ""))}
+        resp = app.get(f"/v1{collection_uri}", headers=headers)
+        return resp.json["data"]["status"], phases
+
+    durations = {}
+
+    _, durations["to-review"] = transition("to-review")
+    status, durations["to-sign"] = transition("to-sign")
+    assert status == "signed", f"Unexpected status {status!r} after to-sign"
+    _, durations["to-resign"] = transition("to-resign")
+
+    change_records(app, collection_uri, records, changes_ratio)
+    transition("work-in-progress")
+    status, durations["to-rollback"] = transition("to-rollback")
+    assert status == "signed", f"Unexpected status {status!r} after to-rollback"
+
+    return durations
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    args = _get_args()
+
+    backend = "postgresql" if args.storage_url else "memory"
+    headers = {**get_user_headers("benchmark"), "Content-Type": "application/json"}
+
+    keys_folder = tempfile.mkdtemp()
+    try:
+        app = make_app(keys_folder, storage_url=args.storage_url)
+
+        results = {}
+        for size in args.sizes:
+            print(f"Benchmarking {size} records on {backend}...", file=sys.stderr)
+            results[str(size)] = run(app, headers, size, args.changes)
+    finally:
+        shutil.rmtree(keys_folder)
+
+    all_baselines = load_baselines(args.baseline)
+    baselines = all_baselines.get(backend, {})
+
+    regressions = []
+    print(f"{'size':>10} {'transition':>12} {'phase':>20} {'seconds':>10} {'baseline':>10}")
+    for size, durations in results.items():
+        for transition in TRANSITIONS:
+            phases = durations[transition]
+            for phase, duration in phases.items():
+                baseline = baselines.get(size, {}).get(transition, {}).get(phase)
+                line = f"{size:>10} {transition:>12} {phase:>20} {duration:>10.3f}"
+                if baseline is not None:
+                    line += f" {baseline:>10.3f}"
+                    slowest = max(duration, baseline)
+                    if slowest >= args.min_seconds and duration > baseline * (1 + args.tolerance):
+                        line += "  REGRESSION"
+                        regressions.append((size, transition, phase))
+                print(line)
+
+    if args.save_baseline:
+        all_baselines.setdefault(backend, {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(all_baselines, f, indent=2, sort_keys=True)
+        print(f"Baselines saved to {args.baseline}", file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
+import base64
+import hashlib
+import json
 import os
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 try:
     import ConfigParser as configparser
 except ImportError:
     import configparser
 
+import ecdsa
 from kinto import main as kinto_main
 from kinto.core.testing import BaseWebTest as CoreWebTest, get_user_headers, DummyRequest
 
-__all__ = ["BaseWebTest", "DummyRequest", "get_user_headers"]
+from kinto_signer.signer.base import SIGN_PREFIX
+
+__all__ = ["BaseWebTest", "DummyRequest", "FakeAutograph", "get_user_headers"]
 
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -32,3 +41,69 @@ class BaseWebTest(CoreWebTest):
         settings["signer.group_check_enabled"] = False
         settings["signer.to_review_enabled"] = False
         return settings
+
+
+class FakeAutograph(object):
+    """Local stand-in for an Autograph server, running in a thread.
+
+    It implements the ``/sign/data`` and ``/sign/hash`` endpoints, and signs
+    with its own ECDSA key, whose public PEM is exposed in ``public_key``.
+    Received requests are recorded in ``requests`` as ``(path, headers, body)``.
+    """
+
+    def __init__(self):
+        self.signing_key = ecdsa.SigningKey.generate(curve=ecdsa.NIST384p)
+        self.public_key = self.signing_key.get_verifying_key().to_pem()
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                body = self.rfile.read(length)
+                fake.requests.append((self.path, dict(self.headers), body))
+
+                if self.path not in ("/sign/data", "/sign/hash"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                responses = []
+                for item in json.loads(body):
+                    data = base64.b64decode(item["input"])
+                    if self.path == "/sign/data":
+                        digest = hashlib.sha384(SIGN_PREFIX + data).digest()
+                    else:
+                        digest = data
+                    signature = fake.signing_key.sign_digest(
+                        digest, sigencode=ecdsa.util.sigencode_string
+                    )
+                    responses.append(
+                        {
+                            "ref": str(uuid.uuid4()),
+                            "mode": "p384ecdsa",
+                            "signature": base64.urlsafe_b64encode(signature).decode("utf-8"),
+                            "public_key": fake.public_key.decode("utf-8"),
+                            "x5u": "",
+                        }
+                    )
+                content = json.dumps(responses).encode("utf-8")
+                self.send_response(201)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%s" % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,86 @@
+import random
+
+from kinto_signer import diff
+from kinto_signer.utils import records_diff
+
+
+def random_collections(size=300):
+    left = [{"id": "r%s" % i, "n": i % 7, "last_modified": i} for i in range(size)]
+    right = [{**r, "last_modified": r["last_modified"] + size} for r in left]
+    random.shuffle(right)
+    # Deleted in left.
+    left = left[10:]
+    # Created in left.
+    right = right[:-10]
+    # Changed in left.
+    for record in random.sample(left, 20):
+        record["n"] = -1
+    return left, right
+
+
+def paginate(records, page_size, key=str, after=None, up_to=None):
+    """Paginate the records like the storage backend, using the ``key`` collation."""
+    records = sorted(records, key=lambda r: key(r["id"]))
+    if after is not None:
+        records = [r for r in records if key(r["id"]) > key(after)]
+    if up_to is not None:
+        records = [r for r in records if key(r["id"]) <= key(up_to)]
+    return [records[i:][:page_size] for i in range(0, len(records), page_size)]
+
+
+def iter_diff(left, right, page_size=10, key=str):
+    return list(
+        diff.iter_records_diff(
+            paginate(left, page_size, key),
+            lambda after, up_to: paginate(right, page_size, key, after, up_to),
+        )
+    )
+
+
+def test_iter_records_diff_gives_same_changes_as_default_diff():
+    left, right = random_collections()
+    expected = records_diff(left, right)
+
+    pairs = iter_diff(left, right)
+    results = [lr if lr is not None else {**rr, "deleted": True} for lr, rr in pairs]
+
+    def by_id(records):
+        return sorted(records, key=lambda r: r["id"])
+
+    assert by_id(results) == by_id(expected)
+
+
+def test_iter_records_diff_returns_both_versions_of_changed_records():
+    left = [{"id": "a", "n": 1}, {"id": "b", "n": 1}]
+    right = [{"id": "a", "n": 2}, {"id": "c", "n": 1}]
+    assert iter_diff(left, right, page_size=1) == [
+        ({"id": "a", "n": 1}, {"id": "a", "n": 2}),
+        (None, {"id": "c", "n": 1}),
+        ({"id": "b", "n": 1}, None),
+    ]
+
+
+def test_iter_records_diff_handles_empty_sides():
+    records = [{"id": "a"}, {"id": "b"}]
+    assert iter_diff(records, [], page_size=1) == [(r, None) for r in records]
+    assert iter_diff([], records, page_size=1) == [(None, r) for r in records]
+
+
+def test_iter_records_diff_consumes_records_progressively():
+    left = iter([[{"id": "a"}], [{"id": "b"}], [{"id": "c"}]])
+    pairs = diff.iter_records_diff(left, lambda after, up_to: [])
+    assert next(pairs) == ({"id": "a"}, None)
+    assert next(left) == [{"id": "c"}]
+
+
+def test_iter_records_diff_does_not_depend_on_python_ordering():
+    # Storage collation ignores punctuation: "ab" comes before "a_c".
+    def collation(record_id):
+        return record_id.replace("_", "")
+
+    records = [{"id": "ab"}, {"id": "a_c"}]
+    for page_size in (1, 2):
+        assert iter_diff(records, records, page_size, key=collation) == []
+        assert iter_diff(records, records[1:], page_size, key=collation) == [
+            ({"id": "ab"}, None)
+        ]
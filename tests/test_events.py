@@ -442,7 +442,8 @@ class SignoffEventsTest(BaseWebTest, unittest.TestCase):
 
     def test_event_is_not_sent_if_rolledback(self):
         patch = mock.patch(
-            "kinto_signer.signer.local_ecdsa.ECDSASigner.sign", side_effect=ValueError("boom")
+            "kinto_signer.signer.local_ecdsa.ECDSASigner.sign_stream",
+            side_effect=ValueError("boom"),
         )
         self.addCleanup(patch.stop)
         patch.start()
@@ -1,7 +1,14 @@
-from kinto_signer.hasher import compute_hash
+import hashlib
+
+from kinto_signer.hasher import compute_digest, compute_hash
 
 
 def test_compute_hash():
     assert compute_hash("un-bateau") == compute_hash("un-bateau")
     expected_hash = "YofMiNkvyRoLAc/jCwKEgC3krpYFrsC0fzbrtecT4AigzZo" "6BEoHvu2wiLpKfW81"
     assert compute_hash("sont-dans-un-bateau") == expected_hash
+
+
+def test_compute_digest_of_chunks():
+    expected = hashlib.sha384(b"sont-dans-un-bateau").digest()
+    assert compute_digest([b"sont-", b"dans-un", b"", b"-bateau"]) == expected
@@ -0,0 +1,161 @@
+import unittest
+
+import mock
+
+from kinto_signer import jobs
+
+
+class SigningJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = mock.MagicMock()
+        self.registry.storage.list_all.return_value = []
+        self.jobs = jobs.SigningJobs(self.registry, resources={}, workers=2)
+
+    def test_workers_are_started_once_per_process(self):
+        with mock.patch.object(jobs.threading, "Thread") as mocked:
+            self.jobs.start()
+            self.jobs.start()
+        assert mocked.call_count == 2
+
+    def test_workers_are_started_again_in_forked_processes(self):
+        with mock.patch.object(jobs.threading, "Thread") as mocked:
+            self.jobs.start()
+            with mock.patch.object(jobs.os, "getpid", return_value=-1):
+                self.jobs.start()
+        assert mocked.call_count == 4
+
+    def test_workers_are_started_when_jobs_are_committed(self):
+        with mock.patch.object(self.jobs, "run") as mocked:
+            self.jobs._on_commit(True, "abc")
+            self.jobs.join()
+        mocked.assert_called_with("abc")
+
+    def test_pending_jobs_are_picked_up_periodically(self):
+        signing_jobs = jobs.SigningJobs(self.registry, resources={}, requeue_seconds=0.01)
+        signing_jobs.start()
+        signing_jobs.join()
+        # Eg. job stored by a process that died before applying it.
+        pending = [[{"id": "abc"}]]
+        self.registry.storage.list_all.side_effect = lambda **kw: pending.pop() if pending else []
+
+        with mock.patch.object(signing_jobs, "run") as mocked:
+            for _ in range(100):
+                if mocked.called:
+                    break
+                signing_jobs._threads[0].join(timeout=0.01)
+        mocked.assert_called_with("abc")
+
+    def test_failed_jobs_are_logged_by_workers(self):
+        with mock.patch.object(self.jobs, "run", side_effect=ValueError):
+            with mock.patch.object(jobs.logger, "exception") as mocked:
+                self.jobs._on_commit(True, "abc")
+                self.jobs.join()
+        mocked.assert_called_with("Signing job abc failed")
+
+
+class ApplyJobTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = mock.MagicMock()
+        self.storage = self.registry.storage
+        self.storage.get.return_value = {"id": "cid", "status": "signing", "last_modified": 1}
+        self.jobs = jobs.SigningJobs(
+            self.registry,
+            resources={},
+            streaming_page_size=500,
+            single_flight=mock.sentinel.single_flight,
+        )
+        self.job = {
+            "id": "abc",
+            "bucket_id": "bid",
+            "collection_id": "cid",
+            "status": "to-sign",
+            "previous_status": "to-review",
+            "user_id": "account:alice",
+        }
+        self.request = mock.MagicMock()
+        self.resource = {
+            "source": {"bucket": "bid", "collection": "cid"},
+            "preview": {"bucket": "preview", "collection": "cid"},
+            "destination": {"bucket": "main", "collection": "cid"},
+        }
+        patch = mock.patch.object(
+            jobs.listeners, "pick_resource_and_signer", return_value=(self.resource, None)
+        )
+        self.pick_resource = patch.start()
+        self.addCleanup(patch.stop)
+        patch = mock.patch.object(jobs, "LocalUpdater")
+        self.updater_mocked = patch.start()
+        self.updater = self.updater_mocked.return_value
+        self.updater.sign_and_update_destinations.return_value = [1, 2]
+        self.addCleanup(patch.stop)
+        patch = mock.patch.object(jobs.listeners, "report_operation")
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_jobs_applied_by_another_worker_are_skipped(self):
+        self.storage.get.side_effect = jobs.ObjectNotFoundError
+        with mock.patch.object(self.jobs, "_in_transaction") as mocked:
+            self.jobs.run("abc")
+        assert not mocked.called
+
+    def test_after_commit_notification_errors_are_ignored(self):
+        request = mock.MagicMock()
+        request.get_resource_events.return_value = [mock.sentinel.event]
+        self.registry.notify.side_effect = [None, ValueError]
+        with mock.patch.object(self.jobs, "_build_request", return_value=request):
+            self.jobs._in_transaction(mock.MagicMock(), self.job)
+        assert self.registry.notify.call_count == 2
+
+    def test_preview_and_destination_are_signed(self):
+        self.jobs._sign(self.request, self.job)
+
+        args, _ = self.updater.sign_and_update_destinations.call_args
+        assert args[1] == [self.resource["preview"], self.resource["destination"]]
+
+    def test_updater_is_configured_like_the_listeners(self):
+        self.jobs._sign(self.request, self.job)
+
+        _, kwargs = self.updater_mocked.call_args
+        assert kwargs["streaming_page_size"] == 500
+        assert kwargs["single_flight"] is mock.sentinel.single_flight
+        assert kwargs["records_cache"] is self.registry.signer_records_cache
+
+    def test_previous_failure_is_cleared_when_signed(self):
+        self.storage.get.return_value = {
+            "id": "cid",
+            "status": "signing",
+            "last_modified": 1,
+            jobs.ERROR_FIELD: {"message": "Boom"},
+        }
+        self.jobs._sign(self.request, self.job)
+
+        _, kwargs = self.storage.update.call_args
+        assert kwargs["obj"] == {"id": "cid", "status": "signing"}
+
+    def test_jobs_already_claimed_are_not_signed(self):
+        self.storage.delete.side_effect = jobs.ObjectNotFoundError
+        self.jobs._sign(self.request, self.job)
+        assert not self.updater.sign_and_update_destinations.called
+
+    def test_jobs_of_removed_resources_are_ignored(self):
+        self.pick_resource.return_value = (None, None)
+        self.jobs._sign(self.request, self.job)
+        self.jobs._fail(self.request, self.job, ValueError("Boom"))
+        assert not self.storage.get.called
+
+    def test_failure_is_recorded_and_previous_status_restored(self):
+        self.jobs._fail(self.request, self.job, ValueError("Boom"))
+
+        _, kwargs = self.updater._update_source_attributes.call_args
+        assert kwargs["status"] == "to-review"
+        assert kwargs[jobs.ERROR_FIELD]["message"] == "Boom"
+
+    def test_failure_is_not_recorded_if_job_was_applied_in_the_meantime(self):
+        self.storage.delete.side_effect = jobs.ObjectNotFoundError
+        self.jobs._fail(self.request, self.job, ValueError("Boom"))
+        assert not self.updater._update_source_attributes.called
+
+    def test_failure_is_not_recorded_if_status_was_changed(self):
+        self.storage.get.return_value = {"id": "cid", "status": "signed"}
+        self.jobs._fail(self.request, self.job, ValueError("Boom"))
+        assert not self.updater._update_source_attributes.called
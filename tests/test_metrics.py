@@ -0,0 +1,176 @@
+import json
+
+import mock
+import pytest
+from pyramid.exceptions import ConfigurationError
+
+from kinto_signer import metrics
+
+
+def test_durations_of_phases_are_summed():
+    phases = metrics.PhasesTimer()
+    with mock.patch("kinto_signer.metrics.time.perf_counter", side_effect=[1, 2, 10, 13]):
+        with phases.phase("listing"):
+            pass
+        with phases.phase("listing"):
+            pass
+    assert phases.durations == {"listing": 4}
+
+
+def test_gauges_are_summed():
+    phases = metrics.PhasesTimer()
+    phases.gauge("changes", 2)
+    phases.gauge("changes", 3)
+    assert phases.gauges == {"changes": 5}
+
+
+def test_iteration_of_chunks_is_timed():
+    phases = metrics.PhasesTimer()
+    chunks = phases.timed_chunks("serialization", [b"abc", b"de"])
+    assert phases.durations == {}
+
+    assert b"".join(chunks) == b"abcde"
+
+    assert "serialization" in phases.durations
+    assert phases.gauges == {"payload_bytes": 5}
+
+
+def test_phases_are_reported_by_transition():
+    phases = metrics.PhasesTimer()
+    phases.add("diff", 0.5)
+    phases.gauge("changes", 3)
+    backend = metrics.StatsdMetrics(mock.MagicMock(), "localhost", 8125)
+
+    with mock.patch.object(backend, "_client") as mocked:
+        metrics.report_phases(backend, phases, "to-sign", bucket="b")
+
+    mocked.timing.assert_called_with("plugins.signer.to-sign.diff", 500)
+    mocked.gauge.assert_called_with("plugins.signer.to-sign.changes", 3)
+
+
+def test_phases_are_reported_with_tags():
+    phases = metrics.PhasesTimer()
+    phases.add("diff", 0.5)
+    backend = mock.MagicMock(tagged=True)
+
+    metrics.report_phases(backend, phases, "to-sign", bucket="b")
+
+    backend.timing.assert_called_with("diff", 500, tags={"transition": "to-sign", "bucket": "b"})
+
+
+def test_dogstatsd_metrics_are_sent_with_tags():
+    backend = metrics.DogStatsdMetrics("localhost", 8125, prefix="kinto")
+    with mock.patch.object(backend, "_socket") as mocked:
+        backend.count("approved_changes", 3, tags={"bucket": "main", "collection": "cid"})
+        backend.timing("diff", 12.5)
+    assert [c[0][0] for c in mocked.sendto.call_args_list] == [
+        b"kinto.plugins.signer.approved_changes:3|c|#bucket:main,collection:cid",
+        b"kinto.plugins.signer.diff:12.500000|ms",
+    ]
+
+
+def test_dogstatsd_errors_are_ignored():
+    backend = metrics.DogStatsdMetrics("localhost", 8125)
+    with mock.patch.object(backend, "_socket") as mocked:
+        mocked.sendto.side_effect = OSError
+        backend.gauge("changes", 1)  # Does not fail.
+
+
+def test_tagged_backend_is_loaded_from_settings():
+    settings = {"statsd_url": "udp://127.0.0.1:8125", "signer.statsd_tags_format": "dogstatsd"}
+    backend = metrics.load_from_settings(settings, statsd_client=mock.sentinel.statsd)
+    assert isinstance(backend, metrics.DogStatsdMetrics)
+    assert backend.prefix == "plugins.signer"
+
+    del settings["signer.statsd_tags_format"]
+    backend = metrics.load_from_settings(settings, statsd_client=mock.sentinel.statsd)
+    assert isinstance(backend, metrics.StatsdMetrics)
+
+    assert metrics.load_from_settings(settings, statsd_client=None) is None
+
+
+def test_statsd_backend_uses_a_dedicated_client_for_timings_and_gauges():
+    settings = {"statsd_url": "udp://127.0.0.1:8125", "project_name": "kinto"}
+    with mock.patch.object(metrics.statsd_module, "StatsClient") as mocked:
+        backend = metrics.load_from_settings(settings, statsd_client=mock.sentinel.statsd)
+        backend.timing("diff", 12.5)
+        backend.gauge("changes", 3)
+
+    mocked.assert_called_with("127.0.0.1", 8125, prefix="kinto")
+    mocked.return_value.timing.assert_called_with("plugins.signer.diff", 12.5)
+    mocked.return_value.gauge.assert_called_with("plugins.signer.changes", 3)
+
+
+def test_unknown_tags_format_raises_configuration_error():
+    with pytest.raises(ConfigurationError):
+        metrics.load_from_settings({"signer.statsd_tags_format": "influx"}, None)
+
+
+def test_phases_are_not_reported_without_statsd():
+    phases = metrics.PhasesTimer()
+    phases.add("diff", 0.5)
+    metrics.report_phases(None, phases, "to-sign")  # Does not fail.
+
+
+def test_server_timing_tween_sums_phases_of_request():
+    first, second = metrics.PhasesTimer(), metrics.PhasesTimer()
+    first.add("diff", 0.5)
+    first.gauge("changes", 3)
+    second.add("diff", 0.25)
+    second.add("signer", 1)
+    request = mock.MagicMock(spec=["bound_data", "path"], path="/v1/batch")
+    request.bound_data = {
+        metrics.TIMINGS_KEY: [
+            {"uri": "/buckets/a/collections/b", "transition": "to-review", "phases": first},
+            {"uri": "/buckets/a/collections/c", "transition": "to-sign", "phases": second},
+        ]
+    }
+    response = mock.MagicMock(headers={})
+    tween = metrics.server_timing_tween_factory(lambda r: response, registry=None)
+
+    with mock.patch.object(metrics.logger, "info") as mocked:
+        assert tween(request) is response
+
+    assert response.headers["Server-Timing"] == (
+        "signer-diff;dur=750.000, signer-signer;dur=1000.000"
+    )
+    logged = json.loads(mocked.call_args[0][0])
+    assert logged["path"] == "/v1/batch"
+    assert logged["operations"][0] == {
+        "uri": "/buckets/a/collections/b",
+        "transition": "to-review",
+        "durations": {"diff": 500},
+        "changes": 3,
+    }
+
+
+def test_server_timing_tween_ignores_subrequests():
+    request = mock.MagicMock(spec=["bound_data", "parent"])
+    request.bound_data = {metrics.TIMINGS_KEY: [{"phases": metrics.PhasesTimer()}]}
+    response = mock.MagicMock(headers={})
+    tween = metrics.server_timing_tween_factory(lambda r: response, registry=None)
+
+    tween(request)
+
+    assert "Server-Timing" not in response.headers
+    assert metrics.TIMINGS_KEY in request.bound_data
+
+
+def test_phases_summary_is_in_milliseconds():
+    phases = metrics.PhasesTimer()
+    phases.add("diff", 0.0125)
+    phases.gauge("changes", 3)
+    assert phases.summary() == {"durations": {"diff": 12.5}, "changes": 3}
+
+
+def test_recent_operations_are_bounded():
+    operations = metrics.RecentOperations(size=2)
+    for i in range(3):
+        operations.append({"id": i})
+    assert operations.list() == [{"id": 2}, {"id": 1}]
+
+
+def test_recent_operations_can_be_disabled():
+    operations = metrics.RecentOperations(size=0)
+    operations.append({"id": 0})
+    assert len(operations) == 0
@@ -1,3 +1,4 @@
+import datetime
 import unittest
 import uuid
 
@@ -5,6 +6,7 @@ import mock
 import pytest
 from kinto import main as kinto_main
 from kinto.core.events import ResourceChanged
+from kinto.core.storage.exceptions import ObjectNotFoundError
 from pyramid import testing
 from pyramid.exceptions import ConfigurationError
 from requests import exceptions as requests_exceptions
@@ -12,7 +14,7 @@ from requests import exceptions as requests_exceptions
 from kinto_signer import __version__ as signer_version
 from kinto_signer.signer.autograph import AutographSigner
 from kinto_signer import includeme
-from kinto_signer.listeners import sign_collection_data
+from kinto_signer.listeners import set_work_in_progress_status, sign_collection_data
 from kinto_signer import utils
 
 from .support import BaseWebTest, get_user_headers
@@ -81,25 +83,25 @@ class HelloViewTest(BaseWebTest, unittest.TestCase):
 
 class HeartbeatTest(BaseWebTest, unittest.TestCase):
     def setUp(self):
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         self.mock = patch.start()
         self.addCleanup(patch.stop)
         self.signature = {"signature": "", "x5u": "", "mode": "", "ref": "abc"}
-        self.mock.post.return_value.json.return_value = [self.signature]
+        self.mock.return_value.json.return_value = [self.signature]
 
     def test_heartbeat_is_exposed(self):
         resp = self.app.get("/__heartbeat__")
         assert "signer" in resp.json
 
     def test_heartbeat_fails_if_unreachable(self):
-        self.mock.post.side_effect = requests_exceptions.ConnectTimeout()
+        self.mock.side_effect = requests_exceptions.ConnectTimeout()
         resp = self.app.get("/__heartbeat__", status=503)
         assert resp.json["signer"] is False
 
     def test_heartbeat_fails_if_missing_attributes(self):
         invalid = self.signature.copy()
         invalid.pop("signature")
-        self.mock.post.return_value.json.return_value = [invalid]
+        self.mock.return_value.json.return_value = [invalid]
         resp = self.app.get("/__heartbeat__", status=503)
         assert resp.json["signer"] is False
 
@@ -210,6 +212,23 @@ class IncludeMeTest(unittest.TestCase):
         assert signer2.server_url == "http://localhost"
         assert signer2.auth.credentials["id"] == "bob"
 
+    def test_hash_mode_can_be_enabled_per_collection(self):
+        settings = {
+            "signer.resources": (
+                "/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1\n"
+                "/buckets/sb1/collections/sc2 -> /buckets/db1/collections/dc2"
+            ),
+            "signer.signer_backend": "kinto_signer.signer.autograph",
+            "signer.autograph.server_url": "http://localhost",
+            "signer.autograph.hawk_id": "alice",
+            "signer.autograph.hawk_secret": "a-secret",
+            "signer.sb1.sc2.autograph.hash_mode": "true",
+        }
+        config = self.includeme(settings)
+
+        assert not config.registry.signers["/buckets/sb1/collections/sc1"].hash_mode
+        assert config.registry.signers["/buckets/sb1/collections/sc2"].hash_mode
+
     def test_a_statsd_timer_is_used_for_signature_if_configured(self):
         settings = {
             "statsd_url": "udp://127.0.0.1:8125",
@@ -227,6 +246,59 @@ class IncludeMeTest(unittest.TestCase):
             timers = set(c[0][0] for c in mocked.call_args_list)
             assert "plugins.signer" in timers
 
+    def test_statsd_timers_are_used_for_other_listeners_if_configured(self):
+        settings = {
+            "statsd_url": "udp://127.0.0.1:8125",
+            "signer.resources": ("/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1"),
+            "signer.ecdsa.public_key": "/path/to/key",
+            "signer.ecdsa.private_key": "/path/to/private",
+        }
+        config = self.includeme(settings)
+
+        payload = dict(resource_name="collection", action="delete", bucket_id="foo")
+        event = ResourceChanged(payload=payload, impacted_objects=[], request=mock.MagicMock())
+        statsd_client = config.registry.statsd._client
+        with mock.patch.object(statsd_client, "timing") as mocked:
+            config.registry.notify(event)
+            timers = set(c[0][0] for c in mocked.call_args_list)
+            assert "plugins.signer.listeners.prevent_collection_delete" in timers
+            assert "plugins.signer.listeners.cleanup_preview_destination" in timers
+
+    def test_serializer_cache_size_can_be_configured(self):
+        settings = {
+            "signer.resources": "/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1",
+            "signer.serializer_cache_size": "42",
+            "signer.ecdsa.public_key": "/path/to/key",
+            "signer.ecdsa.private_key": "/path/to/private",
+        }
+        config = self.includeme(settings)
+        assert config.registry.signer_records_cache.max_size == 42
+
+    def test_streaming_diff_can_be_enabled(self):
+        settings = {
+            "signer.resources": "/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1",
+            "signer.streaming_diff_page_size": "500",
+            "signer.async_enabled": "true",
+            "signer.ecdsa.public_key": "/path/to/key",
+            "signer.ecdsa.private_key": "/path/to/private",
+        }
+        config = self.includeme(settings)
+        assert config.registry.signer_jobs.streaming_page_size == 500
+
+    def test_single_flight_can_be_enabled(self):
+        settings = {
+            "signer.resources": "/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1",
+            "signer.single_flight_enabled": "true",
+            "signer.single_flight_lease_seconds": "10",
+            "signer.async_enabled": "true",
+            "signer.ecdsa.public_key": "/path/to/key",
+            "signer.ecdsa.private_key": "/path/to/private",
+        }
+        config = self.includeme(settings)
+        single_flight = config.registry.signer_jobs.single_flight
+        assert single_flight.cache is config.registry.cache
+        assert single_flight.lease_seconds == 10
+
     def test_includeme_raises_value_error_if_unknown_placeholder(self):
         settings = {
             "signer.resources": "/buckets/sb1/collections/sc1 -> /buckets/db1/collections/dc1",
@@ -260,7 +332,7 @@ class OnCollectionChangedTest(unittest.TestCase):
         sign_collection_data(
             evt, resources=utils.parse_resources("a/b -> c/d"), to_review_enabled=True
         )
-        assert not self.updater_mocked.sign_and_update_destination.called
+        assert not self.updater_mocked.sign_and_update_destinations.called
 
     def test_updater_is_called_when_resource_and_status_matches(self):
         evt = mock.MagicMock(
@@ -270,6 +342,8 @@ class OnCollectionChangedTest(unittest.TestCase):
         evt.request.registry.storage = mock.sentinel.storage
         evt.request.registry.permission = mock.sentinel.permission
         evt.request.registry.signers = {"/buckets/a/collections/b": mock.sentinel.signer}
+        evt.request.registry.signer_jobs = None
+        evt.request.registry.signer_records_cache = mock.sentinel.records_cache
         evt.request.route_path.return_value = "/v1/buckets/a/collections/b"
         sign_collection_data(
             evt, resources=utils.parse_resources("a/b -> c/d"), to_review_enabled=True
@@ -280,10 +354,13 @@ class OnCollectionChangedTest(unittest.TestCase):
             permission=mock.sentinel.permission,
             source={"bucket": "a", "collection": "b"},
             destination={"bucket": "c", "collection": "d"},
+            streaming_page_size=0,
+            single_flight=None,
+            records_cache=mock.sentinel.records_cache,
         )
 
         mocked = self.updater_mocked.return_value
-        assert mocked.sign_and_update_destination.called
+        assert mocked.sign_and_update_destinations.called
 
     def test_kinto_attachment_property_is_set_to_allow_metadata_updates(self):
         evt = mock.MagicMock(
@@ -307,6 +384,63 @@ class OnCollectionChangedTest(unittest.TestCase):
         )
 
 
+class OnRecordChangedTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch("kinto_signer.listeners.LocalUpdater")
+        self.updater_mocked = patch.start()
+        self.addCleanup(patch.stop)
+        self.updater_mocked.return_value.source_collection_uri = "/buckets/a/collections/b"
+
+        self.evt = mock.MagicMock(payload={"bucket_id": "a", "collection_id": "b"})
+        self.evt.request.bound_data = {}
+        self.evt.request.prefixed_userid = "account:alice"
+        self.evt.request.registry.signers = {"/buckets/a/collections/b": mock.sentinel.signer}
+        self.evt.request.registry.signer_jobs = None
+        self.storage = self.evt.request.registry.storage
+        self.storage.get.return_value = {
+            "id": "b",
+            "status": "work-in-progress",
+            "last_edit_by": "account:alice",
+            "last_edit_date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self.resources = utils.parse_resources("a/b -> c/d")
+
+    def set_work_in_progress_status(self):
+        set_work_in_progress_status(self.evt, resources=self.resources, debounce_seconds=60)
+        return self.updater_mocked.return_value.update_source_status.called
+
+    def test_status_is_not_updated_when_edited_recently_by_same_user(self):
+        assert not self.set_work_in_progress_status()
+
+    def test_collection_fetched_in_request_is_not_read_again(self):
+        self.evt.request.bound_data["collections"] = {
+            "/buckets/a/collections/b": self.storage.get.return_value
+        }
+        self.evt.request.registry.signer_jobs = mock.sentinel.jobs
+
+        assert not self.set_work_in_progress_status()
+        assert not self.storage.get.called
+
+    def test_collection_is_kept_up_to_date_in_request(self):
+        self.storage.get.return_value = {"id": "b", "status": "signed"}
+        updated = self.updater_mocked.return_value.update_source_status.return_value
+
+        assert self.set_work_in_progress_status()
+        assert self.evt.request.bound_data["collections"]["/buckets/a/collections/b"] is updated
+
+    def test_status_is_updated_when_collection_is_missing(self):
+        self.storage.get.side_effect = ObjectNotFoundError
+        assert self.set_work_in_progress_status()
+
+    def test_status_is_updated_when_edit_date_is_missing(self):
+        del self.storage.get.return_value["last_edit_date"]
+        assert self.set_work_in_progress_status()
+
+    def test_status_is_updated_when_edit_date_cannot_be_parsed(self):
+        self.storage.get.return_value["last_edit_date"] = "yesterday"
+        assert self.set_work_in_progress_status()
+
+
 class BatchTest(BaseWebTest, unittest.TestCase):
     def setUp(self):
         super(BatchTest, self).setUp()
@@ -315,19 +449,20 @@ class BatchTest(BaseWebTest, unittest.TestCase):
         self.app.put_json("/buckets/bob", headers=self.headers)
 
         # Patch calls to Autograph.
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         self.mock = patch.start()
         self.addCleanup(patch.stop)
-        self.mock.post.return_value.json.return_value = [
-            {
-                "signature": "",
-                "hash_algorithm": "",
-                "signature_encoding": "",
-                "content-signature": "",
-                "x5u": "",
-                "ref": "",
-            }
-        ]
+        signature = {
+            "signature": "",
+            "hash_algorithm": "",
+            "signature_encoding": "",
+            "content-signature": "",
+            "x5u": "",
+            "ref": "",
+        }
+        self.mock.side_effect = lambda url, json, **kwargs: mock.MagicMock(
+            **{"json.return_value": [signature for _ in json]}
+        )
 
     def test_various_collections_can_be_signed_using_batch(self):
         self.app.put_json("/buckets/alice/collections/source", headers=self.headers)
@@ -388,9 +523,10 @@ class RecordChangedTest(BaseWebTest, unittest.TestCase):
         super().setUp()
         self.headers = get_user_headers("me")
 
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         self.mock = patch.start()
         self.addCleanup(patch.stop)
+        self.mock.return_value.json.return_value = [{"signature": "", "x5u": "", "ref": ""}]
 
         self.collection_uri = "/buckets/alice/collections/source"
         self.records_uri = self.collection_uri + "/records"
@@ -402,11 +538,50 @@ class RecordChangedTest(BaseWebTest, unittest.TestCase):
         parameters = [
             ({"a": 3.14}, "a"),
             ({"a": {"b": 41.0}}, "a.b"),
+            ({"a": [1, {"b": 2.5}]}, "a[1].b"),
+            ({"a": {"b": 1}, "c": {"d": 1e3}}, "c.d"),
         ]
         for data, path in parameters:
             body = {"data": data}
             resp = self.app.post_json(self.records_uri, body, headers=self.headers, status=400)
-            assert path in resp.json["message"]
+            assert f"'{path}'" in resp.json["message"]
+
+    def test_returns_all_float_paths_of_batch(self):
+        body = {
+            "defaults": {"method": "POST", "path": self.records_uri},
+            "requests": [
+                {"body": {"data": {"id": "a", "b": [0.5]}}},
+                {"body": {"data": {"id": "c", "d": "1.0"}}},
+            ],
+        }
+        resp = self.app.post_json("/batch", body, headers=self.headers, status=400)
+        assert resp.json["details"] == [{"id": "a", "path": "b[0]"}]
+
+    def test_returns_all_float_paths_of_record(self):
+        body = {"data": {"a": 0.5, "b": {"c": [1, 2.5]}}}
+        resp = self.app.post_json(self.records_uri, body, headers=self.headers, status=400)
+        paths = [f["path"] for f in resp.json["details"]]
+        assert sorted(paths) == ["a", "b.c[1]"]
+        assert "fields contain float values" in resp.json["message"]
+
+
+class RawBodyFloatCheckTest(RecordChangedTest):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.float_check_raw_body"] = "true"
+        return settings
+
+    def test_records_without_floats_are_not_scanned(self):
+        with mock.patch("kinto_signer.listeners.find_float_paths") as mocked:
+            self.app.post_json(self.records_uri, {"data": {"a": 1}}, headers=self.headers)
+        assert not mocked.called
+
+    def test_patched_records_are_scanned(self):
+        self.app.put_json(self.records_uri + "/r", {"data": {"a": 1}}, headers=self.headers)
+        self.app.patch_json(
+            self.records_uri + "/r", {"data": {"b": 1.5}}, headers=self.headers, status=400
+        )
 
 
 class SourceCollectionDeletion(BaseWebTest, unittest.TestCase):
@@ -421,19 +596,26 @@ class SourceCollectionDeletion(BaseWebTest, unittest.TestCase):
         super().setUp()
 
         # Patch calls to Autograph.
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         mocked = patch.start()
         self.addCleanup(patch.stop)
-        mocked.post.return_value.json.side_effect = lambda: [
-            {
-                "signature": uuid.uuid4().hex,
-                "hash_algorithm": "",
-                "signature_encoding": "",
-                "content-signature": "",
-                "x5u": "",
-                "ref": "",
-            }
-        ]
+
+        def fake_sign(url, json, **kwargs):
+            response = mock.MagicMock()
+            response.json.return_value = [
+                {
+                    "signature": uuid.uuid4().hex,
+                    "hash_algorithm": "",
+                    "signature_encoding": "",
+                    "content-signature": "",
+                    "x5u": "",
+                    "ref": "",
+                }
+                for _ in json
+            ]
+            return response
+
+        mocked.side_effect = fake_sign
 
         self.headers = get_user_headers("me")
 
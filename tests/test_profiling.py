@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from kinto_signer import profiling
+
+
+class TransitionsProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.request = mock.MagicMock()
+        self.request.headers = {}
+        self.request.prefixed_principals = ["system.Everyone", "account:admin"]
+
+    def test_transitions_are_not_profiled_by_default(self):
+        profiler = profiling.TransitionsProfiler(self.directory)
+        assert profiler.start(self.request) is None
+
+    def test_sampled_transitions_are_written_in_directory(self):
+        profiler = profiling.TransitionsProfiler(self.directory, sample_rate=1)
+        session = profiler.start(self.request)
+        path = profiler.stop(session, "main-workspace", "cfr", "to-sign")
+
+        assert os.path.dirname(path) == self.directory
+        assert os.path.basename(path).startswith("main-workspace-cfr-to-sign-")
+        assert os.path.exists(path)
+
+    def test_sampled_transitions_faster_than_threshold_are_not_written(self):
+        profiler = profiling.TransitionsProfiler(
+            self.directory, sample_rate=1, threshold_seconds=60
+        )
+        session = profiler.start(self.request)
+        assert profiler.stop(session, "main-workspace", "cfr", "to-sign") is None
+        assert os.listdir(self.directory) == []
+
+    def test_transition_is_not_profiled_if_another_profiler_is_active(self):
+        profiler = profiling.TransitionsProfiler(self.directory, sample_rate=1)
+        with mock.patch.object(profiling.cProfile.Profile, "enable", side_effect=ValueError):
+            assert profiler.start(self.request) is None
+
+    def test_profile_is_not_kept_if_it_cannot_be_written(self):
+        profiler = profiling.TransitionsProfiler(self.directory, sample_rate=1)
+        session = profiler.start(self.request)
+        with mock.patch.object(session.profile, "dump_stats", side_effect=OSError):
+            assert profiler.stop(session, "main-workspace", "cfr", "to-sign") is None
+
+    def test_header_is_ignored_if_principal_is_not_allowed(self):
+        self.request.headers = {profiling.PROFILE_HEADER: "1"}
+        profiler = profiling.TransitionsProfiler(self.directory, principals=["account:ops"])
+        assert profiler.start(self.request) is None
+
+    def test_header_forces_profile_regardless_of_threshold(self):
+        self.request.headers = {profiling.PROFILE_HEADER: "1"}
+        profiler = profiling.TransitionsProfiler(
+            self.directory, threshold_seconds=60, principals=["account:admin"]
+        )
+        session = profiler.start(self.request)
+        assert profiler.stop(session, "main-workspace", "cfr", "to-sign") is not None
+
+
+class LoadFromSettingsTest(unittest.TestCase):
+    def test_profiler_is_disabled_without_directory(self):
+        assert profiling.load_from_settings({}) is None
+
+    def test_directory_is_created(self):
+        directory = os.path.join(tempfile.mkdtemp(), "profiles")
+        self.addCleanup(shutil.rmtree, os.path.dirname(directory))
+        profiler = profiling.load_from_settings(
+            {
+                "signer.profiling_dir": directory,
+                "signer.profiling_sample_rate": "0.1",
+                "signer.profiling_principals": "account:admin account:ops",
+            }
+        )
+        assert os.path.isdir(directory)
+        assert profiler.sample_rate == 0.1
+        assert profiler.principals == {"account:admin", "account:ops"}
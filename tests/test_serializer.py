@@ -1,6 +1,9 @@
 import json
 
-from kinto_signer.serializer import canonical_json
+import canonicaljson
+import mock
+
+from kinto_signer.serializer import RecordsCache, canonical_json, canonical_json_chunks
 
 #
 # Kinto specific
@@ -38,6 +41,90 @@ def test_removes_deleted_items():
     assert [record] == json.loads(serialized)["data"]
 
 
+def test_chunks_are_bytes():
+    records = [{"bar": "baz", "last_modified": "45678", "id": "1"}]
+    assert all(isinstance(c, bytes) for c in canonical_json_chunks(records, "45678"))
+
+
+def test_chunks_are_equal_to_whole_payload():
+    records = [
+        {"id": "2", "last_modified": 2, "nested": {"z": [1, None, True], "a": "é\u2028"}},
+        {"id": "1", "last_modified": 1, "unicode": "\U0001f600", "empty": {}},
+        {"id": "3", "last_modified": 3, "deleted": True},
+    ]
+    chunks = canonical_json_chunks(records, 1234)
+
+    expected = canonicaljson.dumps({"data": records[1::-1], "last_modified": "1234"})
+    assert b"".join(chunks).decode("utf-8") == expected
+
+
+def test_chunks_of_empty_collection():
+    chunks = canonical_json_chunks([], 42)
+    assert b"".join(chunks) == b'{"data":[],"last_modified":"42"}'
+
+
+#
+# Cache
+#
+
+
+def test_cached_records_are_not_serialized_again():
+    cache = RecordsCache(max_size=10)
+    records = [{"id": str(i), "last_modified": i} for i in range(5)]
+    first = canonical_json(records, 42, cache=cache, namespace="/buckets/b/collections/c")
+
+    records.append({"id": "5", "last_modified": 5})
+    with mock.patch("kinto_signer.serializer.canonicaljson.dumps", wraps=canonicaljson.dumps) as m:
+        second = canonical_json(records, 43, cache=cache, namespace="/buckets/b/collections/c")
+    # Only the new record and the timestamp were serialized.
+    assert m.call_count == 2
+    assert second == canonical_json(records, 43)
+    assert first == canonical_json(records[:-1], 42)
+
+
+def test_cache_is_indexed_by_namespace_and_timestamp():
+    cache = RecordsCache(max_size=10)
+    canonical_json([{"id": "a", "last_modified": 1, "v": 1}], 1, cache=cache, namespace="/a")
+
+    changed = [{"id": "a", "last_modified": 2, "v": 2}]
+    assert canonical_json(changed, 2, cache=cache, namespace="/a") == canonical_json(changed, 2)
+    other = [{"id": "a", "last_modified": 1, "v": 3}]
+    assert canonical_json(other, 1, cache=cache, namespace="/b") == canonical_json(other, 1)
+
+
+def test_cache_evicts_least_recently_used_fragments():
+    cache = RecordsCache(max_size=2)
+    cache.set("a", b"a")
+    cache.set("b", b"b")
+    cache.get("a")
+    cache.set("c", b"c")
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a"
+
+
+def test_cache_can_be_disabled():
+    cache = RecordsCache(max_size=0)
+    cache.set("a", b"a")
+    assert len(cache) == 0
+
+
+def test_records_are_not_cached_if_they_do_not_fit():
+    cache = RecordsCache(max_size=2)
+    records = [{"id": str(i), "last_modified": i} for i in range(3)]
+    with mock.patch.object(cache, "get") as mocked:
+        payload = canonical_json(records, 42, cache=cache, namespace="/a")
+    assert payload == canonical_json(records, 42)
+    assert not mocked.called
+    assert len(cache) == 0
+
+
+def test_records_without_timestamp_are_not_cached():
+    cache = RecordsCache()
+    canonical_json([{"id": "1"}], 42, cache=cache, namespace="/a")
+    assert len(cache) == 0
+
+
 #
 # Standard
 #
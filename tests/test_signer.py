@@ -5,12 +5,15 @@ import unittest
 
 import mock
 import pytest
+from requests import exceptions as requests_exceptions
 
 from kinto_signer.signer import base
 from kinto_signer.signer import exceptions
 from kinto_signer.signer import autograph
 from kinto_signer.signer import local_ecdsa
 
+from .support import FakeAutograph
+
 
 SIGNATURE = (
     "ikfq6qOV85vR7QaNCTldVvvtcNpPIICqqMp3tfyiT7fHCgFNq410SFnIfjAPgSa"
@@ -31,6 +34,19 @@ class BaseSignerTest(unittest.TestCase):
         with pytest.raises(NotImplementedError):
             signer.sign("TEST")
 
+    def test_base_sign_stream_joins_chunks(self):
+        signer = base.SignerBase()
+        with mock.patch.object(signer, "sign") as mocked:
+            signer.sign_stream([b"TE", b"ST"])
+        mocked.assert_called_with(b"TEST")
+
+    def test_base_sign_many_signs_each_payload(self):
+        signer = base.SignerBase()
+        with mock.patch.object(signer, "sign", side_effect=lambda p: p) as mocked:
+            result = signer.sign_many(["a", [b"b", b"c"]])
+        assert result == ["a", b"bc"]
+        assert mocked.call_count == 2
+
 
 class ECDSASignerTest(unittest.TestCase):
     @classmethod
@@ -62,6 +78,10 @@ class ECDSASignerTest(unittest.TestCase):
         signature = self.signer.sign("this is some text")
         self.signer.verify("this is some text", signature)
 
+    def test_signer_stream_roundtrip(self):
+        signature = self.signer.sign_stream([b"this is ", b"some", b" text"])
+        self.signer.verify("this is some text", signature)
+
     def test_base64url_encoding(self):
         signature_bundle = self.signer.sign("this is some text")
         b64signature = signature_bundle["signature"]
@@ -87,10 +107,45 @@ class ECDSASignerTest(unittest.TestCase):
         with pytest.raises(ValueError):
             self.get_backend().load_private_key()
 
+    def test_keys_are_parsed_only_once(self):
+        signer = self.get_backend(private_key=self.sk_location)
+        with mock.patch.object(
+            local_ecdsa.SigningKey, "from_pem", wraps=local_ecdsa.SigningKey.from_pem
+        ) as mocked:
+            signature = signer.sign("this is some text")
+            signer.sign("this is some text")
+            signer.verify("this is some text", signature)
+        assert mocked.call_count == 1
+
+    def test_keys_are_reloaded_when_file_changes(self):
+        location = save_key(open(self.sk_location, "rb").read(), "signing-key")
+        self.addCleanup(os.remove, location)
+        signer = self.get_backend(private_key=location)
+        before = signer.load_private_key()
+
+        sk, _ = local_ecdsa.ECDSASigner.generate_keypair()
+        with open(location, "wb") as f:
+            f.write(sk)
+        stat = os.stat(location)
+        os.utime(location, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+        after = signer.load_private_key()
+        assert after.to_pem() == sk
+        assert after.to_pem() != before.to_pem()
+        signature = signer.sign("this is some text")
+        signer.verify("this is some text", signature)
+
     def test_public_key_can_be_loaded_from_public_key_pem(self):
         signer = self.get_backend(public_key=self.vk_location)
         signer.load_public_key()
 
+    def test_signature_can_be_verified_with_public_key_pem(self):
+        signature = self.signer.sign("this is some text")
+        verifier = self.get_backend(public_key=self.vk_location)
+        verifier.verify("this is some text", signature)
+        with pytest.raises(exceptions.BadSignatureError):
+            verifier.verify("this is another text", signature)
+
     def test_public_key_can_be_loaded_from_private_key_pem(self):
         signer = self.get_backend(private_key=self.sk_location)
         signer.load_public_key()
@@ -132,20 +187,54 @@ class AutographSignerTest(unittest.TestCase):
             hawk_secret="fs5wgcer9qj819kfptdlp8gm227ewxnzvsuj9ztycsx08hfhzu",
             server_url="http://localhost:8000",
         )
-
-    @mock.patch("kinto_signer.signer.autograph.requests")
-    def test_request_is_being_crafted_with_payload_as_input(self, requests):
-        response = mock.MagicMock()
-        response.json.return_value = [{"signature": SIGNATURE, "x5u": "", "ref": ""}]
-        requests.post.return_value = response
+        patch = mock.patch.object(self.signer.session, "post")
+        self.addCleanup(patch.stop)
+        self.post = patch.start()
+        self.post.return_value.status_code = 200
+        self.post.return_value.json.return_value = [
+            {"signature": SIGNATURE, "x5u": "", "ref": ""}
+        ]
+
+    def test_request_is_being_crafted_with_payload_as_input(self):
         signature_bundle = self.signer.sign("test data")
-        requests.post.assert_called_with(
+        self.post.assert_called_with(
             "http://localhost:8000/sign/data",
             auth=self.signer.auth,
             json=[{"input": "dGVzdCBkYXRh"}],
+            timeout=(5, 30),
         )
         assert signature_bundle["signature"] == SIGNATURE
 
+    def test_connections_are_pooled(self):
+        adapter = self.signer.session.get_adapter("https://autograph.example.com")
+        assert adapter._pool_maxsize == autograph.DEFAULT_POOL_SIZE
+        assert self.signer.session.get_adapter("http://localhost:8000") is adapter
+
+    @mock.patch("kinto_signer.signer.autograph.time.sleep")
+    def test_throttled_requests_are_retried_with_backoff(self, sleep):
+        throttled = mock.MagicMock(status_code=429)
+        self.post.side_effect = [throttled, throttled, self.post.return_value]
+
+        signature_bundle = self.signer.sign("test data")
+
+        assert signature_bundle["signature"] == SIGNATURE
+        assert self.post.call_count == 3
+        first_delay, second_delay = [c[0][0] for c in sleep.call_args_list]
+        assert 0 <= first_delay <= autograph.DEFAULT_RETRY_BACKOFF
+        assert 0 <= second_delay <= autograph.DEFAULT_RETRY_BACKOFF * 2
+
+    @mock.patch("kinto_signer.signer.autograph.time.sleep")
+    def test_error_is_raised_when_retries_are_exhausted(self, sleep):
+        unavailable = mock.MagicMock(status_code=503)
+        unavailable.raise_for_status.side_effect = requests_exceptions.HTTPError()
+        self.post.side_effect = None
+        self.post.return_value = unavailable
+
+        with pytest.raises(requests_exceptions.HTTPError):
+            self.signer.sign("test data")
+        assert self.post.call_count == autograph.DEFAULT_MAX_RETRIES + 1
+        assert sleep.call_count == autograph.DEFAULT_MAX_RETRIES
+
     @mock.patch("kinto_signer.signer.autograph.AutographSigner")
     def test_load_from_settings(self, mocked_signer):
         autograph.load_from_settings(
@@ -161,4 +250,106 @@ class AutographSignerTest(unittest.TestCase):
             server_url=mock.sentinel.server_url,
             hawk_id=mock.sentinel.hawk_id,
             hawk_secret=mock.sentinel.hawk_secret,
+            pool_size=autograph.DEFAULT_POOL_SIZE,
+            connect_timeout=autograph.DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=autograph.DEFAULT_READ_TIMEOUT,
+            max_retries=autograph.DEFAULT_MAX_RETRIES,
+            retry_backoff=autograph.DEFAULT_RETRY_BACKOFF,
+            hash_mode=False,
         )
+
+    @mock.patch("kinto_signer.signer.autograph.AutographSigner")
+    def test_load_from_settings_reads_connection_settings(self, mocked_signer):
+        autograph.load_from_settings(
+            {
+                "signer.autograph.server_url": mock.sentinel.server_url,
+                "signer.autograph.pool_size": "3",
+                "signer.autograph.connect_timeout": "1.5",
+                "signer.autograph.read_timeout": "10",
+                "signer.autograph.max_retries": "0",
+                "signer.autograph.retry_backoff": "2",
+                "signer.autograph.hash_mode": "true",
+            },
+            prefixes=["signer."],
+        )
+
+        _, kwargs = mocked_signer.call_args
+        assert kwargs["pool_size"] == 3
+        assert kwargs["connect_timeout"] == 1.5
+        assert kwargs["read_timeout"] == 10.0
+        assert kwargs["max_retries"] == 0
+        assert kwargs["retry_backoff"] == 2.0
+        assert kwargs["hash_mode"] is True
+
+    def test_error_is_raised_if_signatures_count_differs(self):
+        with pytest.raises(ValueError):
+            self.signer.sign_many(["a", "b"])
+
+
+class AutographServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeAutograph()
+        cls.server.start()
+        cls.vk_location = save_key(cls.server.public_key, "verifying-key")
+        cls.verifier = local_ecdsa.ECDSASigner(public_key=cls.vk_location)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        os.remove(cls.vk_location)
+
+    def setUp(self):
+        del self.server.requests[:]
+
+    def get_backend(self, **options):
+        return autograph.AutographSigner(
+            server_url=self.server.url, hawk_id="alice", hawk_secret="a-secret", **options
+        )
+
+    def test_payload_is_uploaded_by_default(self):
+        signer = self.get_backend()
+        signature_bundle = signer.sign_stream([b"this is ", b"some text"])
+
+        self.verifier.verify("this is some text", signature_bundle)
+        ((path, _, _),) = self.server.requests
+        assert path == "/sign/data"
+
+    def test_hash_is_signed_in_hash_mode(self):
+        signer = self.get_backend(hash_mode=True)
+        signature_bundle = signer.sign_stream([b"this is ", b"some text"])
+
+        self.verifier.verify("this is some text", signature_bundle)
+        ((path, _, _),) = self.server.requests
+        assert path == "/sign/hash"
+
+    def test_sign_uses_hash_in_hash_mode(self):
+        signer = self.get_backend(hash_mode=True)
+        signature_bundle = signer.sign("this is some text")
+
+        self.verifier.verify("this is some text", signature_bundle)
+
+    def test_request_size_does_not_depend_on_payload_in_hash_mode(self):
+        signer = self.get_backend(hash_mode=True)
+        signer.sign_stream([b"a"])
+        signer.sign_stream([b"a" * 1024 * 1024])
+
+        sizes = [len(body) for (_, _, body) in self.server.requests]
+        assert sizes[0] == sizes[1]
+
+    def test_payloads_are_signed_in_one_request(self):
+        signer = self.get_backend()
+        bundles = signer.sign_many(["first", [b"sec", b"ond"], b"third"])
+
+        assert len(self.server.requests) == 1
+        for payload, bundle in zip(("first", "second", "third"), bundles):
+            self.verifier.verify(payload, bundle)
+
+    def test_hashes_are_signed_in_one_request_in_hash_mode(self):
+        signer = self.get_backend(hash_mode=True)
+        bundles = signer.sign_many(["first", "second"])
+
+        ((path, _, _),) = self.server.requests
+        assert path == "/sign/hash"
+        self.verifier.verify("first", bundles[0])
+        self.verifier.verify("second", bundles[1])
@@ -15,24 +15,26 @@ class SignerAttachmentsTest(BaseWebTest, unittest.TestCase):
     def setUp(self):
         super().setUp()
         # Patch calls to Autograph.
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         self.addCleanup(patch.stop)
         self.mocked_autograph = patch.start()
 
-        def fake_sign():
-            fake_signature = "".join(random.sample(string.ascii_lowercase, 10))
-            return [
+        def fake_sign(url, json, **kwargs):
+            response = mock.MagicMock()
+            response.json.return_value = [
                 {
                     "signature": "",
                     "hash_algorithm": "",
                     "signature_encoding": "",
-                    "content-signature": fake_signature,
+                    "content-signature": "".join(random.sample(string.ascii_lowercase, 10)),
                     "x5u": "",
                     "ref": "",
                 }
+                for _ in json
             ]
+            return response
 
-        self.mocked_autograph.post.return_value.json.side_effect = fake_sign
+        self.mocked_autograph.side_effect = fake_sign
 
         self.headers = get_user_headers("tarte:en-pion")
         resp = self.app.get("/", headers=self.headers)
@@ -1,12 +1,21 @@
+import os
 import random
 import re
+import shutil
 import string
+import sys
+import tempfile
 import unittest
 
 import mock
+import transaction
 
 from kinto.core.testing import FormattedErrorMixin
 from kinto.core.errors import ERRORS
+from kinto_signer import metrics
+from kinto_signer.singleflight import SingleFlight
+from kinto_signer.updater import LocalUpdater
+
 from .support import BaseWebTest, get_user_headers
 
 
@@ -22,23 +31,25 @@ class PostgresWebTest(BaseWebTest):
     def setUp(self):
         super(PostgresWebTest, self).setUp()
         # Patch calls to Autograph.
-        patch = mock.patch("kinto_signer.signer.autograph.requests")
+        patch = mock.patch("kinto_signer.signer.autograph.requests.Session.post")
         self.addCleanup(patch.stop)
         self.mocked_autograph = patch.start()
 
-        def fake_sign():
-            fake_signature = "".join(random.sample(string.ascii_lowercase, 10))
-            return [
+        def fake_sign(url, json, **kwargs):
+            response = mock.MagicMock()
+            response.json.return_value = [
                 {
-                    "signature": fake_signature,
+                    "signature": "".join(random.sample(string.ascii_lowercase, 10)),
                     "hash_algorithm": "",
                     "signature_encoding": "",
                     "x5u": "",
                     "ref": "",
                 }
+                for _ in json
             ]
+            return response
 
-        self.mocked_autograph.post.return_value.json.side_effect = fake_sign
+        self.mocked_autograph.side_effect = fake_sign
 
     @classmethod
     def get_app_settings(cls, extras=None):
@@ -119,6 +130,24 @@ class CollectionStatusTest(SignoffWebTest, FormattedErrorMixin, unittest.TestCas
         assert "last_review_date" not in resp.json["data"]
         assert "last_review_request_date" not in resp.json["data"]
 
+    def test_signing_status_is_ignored_if_async_is_disabled(self):
+        # Eg. jobs left pending after the async mode was disabled.
+        storage = self.app.app.registry.storage
+        with transaction.manager:
+            collection = storage.get(
+                resource_name="collection", parent_id=self.source_bucket, object_id="scid"
+            )
+            storage.update(
+                resource_name="collection",
+                parent_id=self.source_bucket,
+                object_id="scid",
+                obj={**collection, "status": "signing"},
+            )
+
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "work-in-progress"}}, headers=self.headers
+        )
+
     def test_status_cannot_be_set_to_unknown_value(self):
         resp = self.app.patch_json(
             self.source_collection,
@@ -230,6 +259,237 @@ class CollectionStatusTest(SignoffWebTest, FormattedErrorMixin, unittest.TestCas
         # One creation and one deletion.
         assert call_args == ("plugins.signer.approved_changes", 2)
 
+    def test_statsd_reports_duration_of_each_phase(self):
+        statsd_client = self.app.app.registry.signer_metrics._client
+        with mock.patch.object(statsd_client, "timing") as mocked:
+            self.app.patch_json(
+                self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+            )
+        timers = set(c[0][0] for c in mocked.call_args_list)
+
+        for phase in ("source_listing", "diff", "push", "serialization", "signer", "metadata"):
+            assert f"plugins.signer.to-sign.{phase}" in timers
+
+    def test_duration_of_each_phase_is_returned_in_server_timing_header(self):
+        resp = self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        timings = resp.headers["Server-Timing"].split(", ")
+        names = [t.split(";")[0] for t in timings]
+        assert "signer-diff" in names
+        assert "signer-signer" in names
+
+    def test_server_timing_header_is_not_returned_without_signer_operations(self):
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert "Server-Timing" not in resp.headers
+
+
+class TaggedMetricsTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.statsd_tags_format"] = "dogstatsd"
+        return settings
+
+    def test_collection_is_a_tag_of_approved_changes(self):
+        metrics = self.app.app.registry.signer_metrics
+        with mock.patch.object(metrics, "_socket") as mocked:
+            self.app.patch_json(
+                self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+            )
+        sent = [c[0][0].decode() for c in mocked.sendto.call_args_list]
+
+        approved = [s for s in sent if ".plugins.signer.approved_changes:" in s]
+        assert len(approved) == 1
+        assert approved[0].endswith("|c|#bucket:alice,collection:dcid")
+        diff = [s for s in sent if ".plugins.signer.diff:" in s][0]
+        assert "transition:to-sign" in diff
+        assert "collection:scid" in diff
+
+
+class ProfilingTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        cls.profiling_dir = tempfile.mkdtemp()
+        settings["signer.profiling_dir"] = cls.profiling_dir
+        settings["signer.profiling_principals"] = "system.Authenticated"
+        return settings
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.profiling_dir)
+
+    def test_transition_is_profiled_with_header(self):
+        self.app.patch_json(
+            self.source_collection,
+            {"data": {"status": "to-sign"}},
+            headers={**self.headers, "X-Signer-Profile": "1"},
+        )
+        profiles = [f for f in os.listdir(self.profiling_dir) if "-to-sign-" in f]
+        assert len(profiles) == 1
+        assert profiles[0].startswith("alice-scid-to-sign-")
+
+    def test_failed_transition_is_profiled_and_profiler_is_stopped(self):
+        self.mocked_autograph.side_effect = ValueError("Boom!")
+
+        self.app.patch_json(
+            self.source_collection,
+            {"data": {"status": "to-resign"}},
+            headers={**self.headers, "X-Signer-Profile": "1"},
+            status=500,
+        )
+
+        assert sys.getprofile() is None
+        profiles = [f for f in os.listdir(self.profiling_dir) if "-to-resign-" in f]
+        assert len(profiles) == 1
+
+
+class SignerOperationsTest(SignoffWebTest, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        registry = self.app.app.registry
+        registry.signer_operations = metrics.RecentOperations(size=2)
+        patch = mock.patch.object(registry, "signer_operations_principals", {self.userid})
+        self.addCleanup(patch.stop)
+        patch.start()
+
+    def test_last_operations_are_listed(self):
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        resp = self.app.get("/__signer_operations__", headers=self.headers)
+        (operation,) = resp.json["data"]
+        assert operation["uri"] == self.source_collection
+        assert operation["transition"] == "to-sign"
+        assert operation["signer"] == "autograph"
+        assert operation["refs"] == [""]
+        assert operation["changes"] == 2
+        assert "signer" in operation["durations"]
+
+    def test_operations_are_not_listed_to_other_users(self):
+        self.app.get("/__signer_operations__", headers=self.other_headers, status=403)
+
+
+class AsyncSigningTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.async_enabled"] = "true"
+        return settings
+
+    def setUp(self):
+        super().setUp()
+        self.jobs = self.app.app.registry.signer_jobs
+
+    def hold_jobs(self):
+        """Keep the jobs out of the workers, in order to apply them explicitly."""
+        job_ids = []
+        patch = mock.patch.object(
+            self.jobs, "_on_commit", side_effect=lambda s, job_id: job_ids.append(job_id)
+        )
+        self.addCleanup(patch.stop)
+        patch.start()
+        return job_ids
+
+    def get_status(self):
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        return resp.json["data"]["status"]
+
+    def test_collection_is_signed_by_worker(self):
+        job_ids = self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        assert self.get_status() == "signing"
+
+        (job_id,) = job_ids
+        self.jobs.run(job_id)
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "signed"
+        assert resp.json["data"]["last_signature_by"] == self.userid
+        resp = self.app.get(self.destination_collection + "/records", headers=self.headers)
+        assert len(resp.json["data"]) == 2
+
+    def test_jobs_are_applied_by_workers_once_committed(self):
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.jobs.join()
+        assert self.get_status() == "signed"
+
+    def test_signature_can_be_refreshed_by_worker(self):
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.jobs.join()
+        job_ids = self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-resign"}}, headers=self.headers
+        )
+        assert self.get_status() == "signing"
+
+        (job_id,) = job_ids
+        self.jobs.run(job_id)
+        assert self.get_status() == "signed"
+
+    def test_status_cannot_be_changed_while_signing(self):
+        self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        resp = self.app.patch_json(
+            self.source_collection,
+            {"data": {"status": "work-in-progress"}},
+            headers=self.headers,
+            status=400,
+        )
+        assert resp.json["message"] == "Collection is being signed"
+
+    def test_changes_can_be_rolled_back_while_signing(self):
+        job_ids = self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-rollback"}}, headers=self.headers
+        )
+        assert self.get_status() == "signed"
+
+        # The pending job is ignored.
+        (job_id,) = job_ids
+        self.jobs.run(job_id)
+        resp = self.app.get(self.destination_collection + "/records", headers=self.headers)
+        assert len(resp.json["data"]) == 0
+
+    def test_records_cannot_be_changed_while_signing(self):
+        self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.app.post_json(
+            self.source_collection + "/records",
+            {"data": {"title": "hi"}},
+            headers=self.headers,
+            status=400,
+        )
+
+    def test_failures_are_recorded_in_collection_metadata(self):
+        job_ids = self.hold_jobs()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.mocked_autograph.side_effect = ValueError("Boom")
+
+        (job_id,) = job_ids
+        self.jobs.run(job_id)
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "work-in-progress"
+        assert resp.json["data"]["last_signing_error"]["message"] == "Boom"
+
 
 class ForceReviewTest(SignoffWebTest, unittest.TestCase):
     @classmethod
@@ -353,7 +613,7 @@ class RefreshSignatureTest(SignoffWebTest, unittest.TestCase):
         assert resp.json["data"]["status"] == "signed"
 
     def test_if_resign_fails_signature_is_rolledback(self):
-        self.mocked_autograph.post.side_effect = ValueError("Boom!")
+        self.mocked_autograph.side_effect = ValueError("Boom!")
 
         self.app.patch_json(
             self.source_collection,
@@ -495,6 +755,202 @@ class TrackingFieldsTest(SignoffWebTest, unittest.TestCase):
             )
 
 
+class WorkInProgressDebounceTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.work_in_progress_debounce_seconds"] = "3600"
+        return settings
+
+    def test_collection_is_not_updated_when_edited_again_by_same_user(self):
+        before = self.app.get(self.source_collection, headers=self.headers).json["data"]
+
+        self.app.post_json(
+            self.source_collection + "/records", {"data": {"title": "Hallo"}}, headers=self.headers
+        )
+
+        after = self.app.get(self.source_collection, headers=self.headers).json["data"]
+        assert after["last_modified"] == before["last_modified"]
+        assert after["last_edit_date"] == before["last_edit_date"]
+
+    def test_collection_is_updated_when_edited_by_another_user(self):
+        self.app.post_json(
+            self.source_collection + "/records",
+            {"data": {"title": "Hallo"}},
+            headers=self.other_headers,
+        )
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["last_edit_by"] == self.other_userid
+
+    def test_collection_is_updated_when_status_is_not_work_in_progress(self):
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-review"}}, headers=self.headers
+        )
+
+        self.app.post_json(
+            self.source_collection + "/records", {"data": {"title": "Hallo"}}, headers=self.headers
+        )
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "work-in-progress"
+
+
+class BulkImportTest(SignoffWebTest, FormattedErrorMixin, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.to_review_enabled"] = "false"
+        return settings
+
+    def setUp(self):
+        super().setUp()
+        self.app.patch_json(
+            self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+        )
+        self.app.patch_json(
+            self.source_collection, {"data": {"bulk_import": True}}, headers=self.headers
+        )
+        self.records_uri = self.source_collection + "/records"
+
+    def end_import(self, **kwargs):
+        return self.app.patch_json(
+            self.source_collection,
+            {"data": {"bulk_import": False}},
+            headers=self.headers,
+            **kwargs,
+        )
+
+    def test_collection_metadata_is_not_updated_during_import(self):
+        before = self.app.get(self.source_collection, headers=self.headers).json["data"]
+
+        for i in range(3):
+            self.app.post_json(self.records_uri, {"data": {"i": i}}, headers=self.headers)
+
+        after = self.app.get(self.source_collection, headers=self.headers).json["data"]
+        assert after["last_modified"] == before["last_modified"]
+        assert after["status"] == "signed"
+
+    def test_status_is_set_to_work_in_progress_at_the_end_of_import(self):
+        self.app.post_json(self.records_uri, {"data": {"title": "Hallo"}}, headers=self.headers)
+
+        self.end_import()
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "work-in-progress"
+        assert resp.json["data"]["last_edit_by"] == self.userid
+
+    def test_status_is_unchanged_at_the_end_of_import_without_changes(self):
+        self.end_import()
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "signed"
+
+    def test_status_is_left_if_changed_at_the_end_of_import(self):
+        self.app.post_json(self.records_uri, {"data": {"title": "Hallo"}}, headers=self.headers)
+
+        self.app.patch_json(
+            self.source_collection,
+            {"data": {"bulk_import": False, "status": "to-review"}},
+            headers=self.headers,
+        )
+
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["status"] == "to-review"
+
+    def test_changes_count_is_reported_once_at_the_end_of_import(self):
+        for i in range(3):
+            self.app.post_json(self.records_uri, {"data": {"i": i}}, headers=self.headers)
+
+        self.end_import()
+
+        (operation, *_) = self.app.app.registry.signer_operations.list()
+        assert operation["transition"] == "bulk-import"
+        assert operation["changes"] == 3
+
+    def test_import_in_collections_not_configured_is_ignored(self):
+        other_collection = self.source_bucket + "/collections/other"
+        self.app.put_json(other_collection, {"data": {"bulk_import": True}}, headers=self.headers)
+        self.app.post_json(
+            other_collection + "/records", {"data": {"v": 1.5}}, headers=self.headers
+        )
+
+        self.app.patch_json(
+            other_collection, {"data": {"bulk_import": False}}, headers=self.headers
+        )
+
+    def test_floats_are_rejected_at_the_end_of_import(self):
+        self.app.post_json(
+            self.records_uri, {"data": {"id": "a", "v": [1.5]}}, headers=self.headers
+        )
+
+        resp = self.end_import(status=400)
+
+        assert resp.json["details"] == [{"id": "a", "path": "v[0]"}]
+        resp = self.app.get(self.source_collection, headers=self.headers)
+        assert resp.json["data"]["bulk_import"] is True
+
+    def test_review_cannot_be_requested_during_import(self):
+        resp = self.app.patch_json(
+            self.source_collection,
+            {"data": {"status": "to-review"}},
+            headers=self.headers,
+            status=400,
+        )
+        self.assertFormattedError(
+            response=resp,
+            code=400,
+            errno=ERRORS.INVALID_POSTED_DATA,
+            error="Bad Request",
+            message="Collection is in bulk import mode",
+        )
+
+
+class StreamingDiffTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.streaming_diff_page_size"] = "1"
+        return settings
+
+    def test_changes_are_rolled_back_page_by_page(self):
+        with mock.patch.object(
+            LocalUpdater,
+            "_rollback_streamed_records",
+            autospec=True,
+            side_effect=LocalUpdater._rollback_streamed_records,
+        ) as mocked:
+            self.app.patch_json(
+                self.source_collection, {"data": {"status": "to-rollback"}}, headers=self.headers
+            )
+
+        (updater, _), _ = mocked.call_args
+        assert updater.streaming_page_size == 1
+        resp = self.app.get(self.source_collection + "/records", headers=self.headers)
+        assert len(resp.json["data"]) == 0
+
+
+class SingleFlightTest(SignoffWebTest, unittest.TestCase):
+    @classmethod
+    def get_app_settings(cls, extras=None):
+        settings = super().get_app_settings(extras)
+        settings["signer.single_flight_enabled"] = "true"
+        return settings
+
+    def test_signatures_are_coalesced(self):
+        with mock.patch.object(
+            SingleFlight, "do", autospec=True, side_effect=SingleFlight.do
+        ) as mocked:
+            self.app.patch_json(
+                self.source_collection, {"data": {"status": "to-sign"}}, headers=self.headers
+            )
+
+        (single_flight, *_), _ = mocked.call_args
+        assert single_flight.cache is self.app.app.registry.cache
+        resp = self.app.get(self.destination_collection + "/records", headers=self.headers)
+        assert len(resp.json["data"]) == 2
+
+
 class RollbackChangesTest(SignoffWebTest, unittest.TestCase):
     @classmethod
     def get_app_settings(cls, extras=None):
@@ -1276,14 +1732,14 @@ class PerBucketTest(SignoffWebTest, unittest.TestCase):
         )
 
     def test_signer_can_be_specified_per_collection(self):
-        self.mocked_autograph.post.reset_mock()
+        self.mocked_autograph.reset_mock()
         self.app.put_json(
             self.source_bucket + "/collections/specific",
             {"data": {"status": "to-sign"}},
             headers=self.headers,
         )
 
-        args, kwargs = self.mocked_autograph.post.call_args_list[0]
+        args, kwargs = self.mocked_autograph.call_args_list[0]
         assert args[0].startswith("http://localhost:8000")  # global.
         assert kwargs["auth"].credentials["id"] == "for-specific"
         assert kwargs["auth"].credentials["key"].startswith("fs5w")  # global in signer.ini
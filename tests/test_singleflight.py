@@ -0,0 +1,94 @@
+import threading
+import unittest
+
+import mock
+import pytest
+from kinto.core.cache.memory import Cache
+
+from kinto_signer.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+    def call_concurrently(self, key, func):
+        """Run ``func`` for ``key``, while another thread calls it for the same key."""
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def in_flight():
+            started.set()
+            release.wait()
+            return func()
+
+        def first_caller():
+            try:
+                results.append(self.single_flight.do(key, in_flight))
+            except Exception as e:
+                results.append(e)
+
+        thread = threading.Thread(target=first_caller)
+        thread.start()
+        started.wait()
+        # Release the call in flight once the second caller is waiting.
+        threading.Timer(0.1, release.set).start()
+        try:
+            results.append(self.single_flight.do(key, func))
+        finally:
+            thread.join()
+        return results
+
+    def test_concurrent_callers_of_same_key_share_the_result(self):
+        func = mock.MagicMock(return_value="signature")
+        assert self.call_concurrently("a", func) == ["signature", "signature"]
+        assert func.call_count == 1
+
+    def test_errors_are_raised_to_concurrent_callers(self):
+        func = mock.MagicMock(side_effect=ValueError("boom"))
+        with pytest.raises(ValueError):
+            self.call_concurrently("a", func)
+        assert func.call_count == 1
+
+    def test_later_callers_run_the_function_again(self):
+        func = mock.MagicMock(return_value="signature")
+        self.single_flight.do("a", func)
+        self.single_flight.do("a", func)
+        assert func.call_count == 2
+
+
+class SharedSingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache(cache_prefix="", cache_max_size_bytes=10000)
+        self.single_flight = SingleFlight(cache=self.cache, lease_seconds=1, poll_interval=0.01)
+        # Another process sharing the same cache.
+        self.other = SingleFlight(cache=self.cache, lease_seconds=1, poll_interval=0.01)
+
+    def test_result_of_call_in_flight_in_other_process_is_used(self):
+        started = threading.Event()
+
+        def in_flight():
+            started.set()
+            threading.Event().wait(0.1)
+            return ["signature"]
+
+        thread = threading.Thread(target=self.other.do, args=("a", in_flight))
+        thread.start()
+        started.wait()
+        func = mock.MagicMock()
+        result = self.single_flight.do("a", func)
+        thread.join()
+
+        assert result == ["signature"]
+        assert not func.called
+
+    def test_lease_is_released_after_call(self):
+        self.other.do("a", lambda: ["signature"])
+        func = mock.MagicMock(return_value=["new"])
+        assert self.single_flight.do("a", func) == ["new"]
+
+    def test_expired_lease_is_ignored(self):
+        self.single_flight.lease_seconds = 0
+        with mock.patch.object(self.cache, "get", return_value=True):
+            assert self.single_flight.do("a", lambda: ["signature"]) == ["signature"]
@@ -3,8 +3,7 @@ import mock
 import pytest
 import unittest
 
-from kinto.core.storage.exceptions import RecordNotFoundError
-
+from kinto.core.utils import COMPARISON
 from kinto_signer.updater import LocalUpdater
 from kinto_signer.utils import STATUS
 
@@ -16,6 +15,9 @@ class LocalUpdaterTest(unittest.TestCase):
         self.storage = mock.MagicMock()
         self.permission = mock.MagicMock()
         self.signer_instance = mock.MagicMock()
+        self.signer_instance.sign_many.side_effect = lambda payloads: [
+            mock.sentinel.signature for _ in payloads
+        ]
         self.updater = LocalUpdater(
             source={"bucket": "sourcebucket", "collection": "sourcecollection"},
             destination={"bucket": "destbucket", "collection": "destcollection"},
@@ -69,8 +71,117 @@ class LocalUpdaterTest(unittest.TestCase):
             parent_id="/buckets/destbucket/collections/destcollection",
         )
 
+    def test_collections_are_listed_once_per_timestamp(self):
+        self.storage.resource_timestamp.return_value = 42
+        self.updater.get_source_records()
+        self.updater.get_source_records()
+        assert self.storage.list_all.call_count == 1
+
+        self.storage.resource_timestamp.return_value = 43
+        self.updater.get_source_records()
+        assert self.storage.list_all.call_count == 2
+
+    def _set_streaming(self, source_records, dest_records, page_size=2, collation=str):
+        self.patch(self.updater, "streaming_page_size", page_size)
+        self.patch(self.updater, "get_destination_records")
+        self.patch(self.updater, "get_source_records")
+        self.storage.resource_timestamp.return_value = 42
+        records = {
+            "/buckets/sourcebucket/collections/sourcecollection": source_records,
+            "/buckets/destbucket/collections/destcollection": dest_records,
+        }
+
+        def list_all(parent_id, filters, pagination_rules, limit, **kwargs):
+            # Apply the ids filters with the specified storage collation.
+            conditions = filters + [f for rule in pagination_rules or [] for f in rule]
+            result = sorted(records[parent_id], key=lambda r: collation(r["id"]))
+            for f in conditions:
+                if f.field == "id" and f.operator == COMPARISON.GT:
+                    result = [r for r in result if collation(r["id"]) > collation(f.value)]
+                elif f.field == "id" and f.operator == COMPARISON.MAX:
+                    result = [r for r in result if collation(r["id"]) <= collation(f.value)]
+            return result[:limit]
+
+        self.storage.list_all.side_effect = list_all
+
+    def test_push_records_compares_records_page_by_page(self):
+        self._set_streaming(
+            source_records=[
+                {"id": "a", "n": 1, "last_modified": 1},
+                {"id": "b", "n": 2, "last_modified": 2},
+                {"id": "d", "n": 1, "last_modified": 3},
+            ],
+            dest_records=[
+                {"id": "a", "n": 1, "last_modified": 1},
+                {"id": "b", "n": 1, "last_modified": 2},
+                {"id": "c", "n": 1, "last_modified": 3},
+            ],
+        )
+
+        changes_count, dest_records, _ = self.updater.push_records_to_destination(DummyRequest())
+
+        assert changes_count == 3
+        assert dest_records is None
+        assert not self.updater.get_source_records.called
+        for _, kwargs in self.storage.list_all.call_args_list:
+            assert kwargs["limit"] == 2
+        assert self.storage.update.call_count == 1
+        assert self.storage.create.call_count == 1
+        assert self.storage.delete_all.call_count == 1
+
+    def test_push_records_does_not_depend_on_python_ordering_of_ids(self):
+        # Storage collation ignores punctuation: "ab" comes before "a_c".
+        records = [
+            {"id": "ab", "last_modified": 1},
+            {"id": "a_c", "last_modified": 2},
+            {"id": "b", "last_modified": 3},
+        ]
+        self._set_streaming(
+            records, records, page_size=1, collation=lambda rid: rid.replace("_", "")
+        )
+
+        changes_count, _, _ = self.updater.push_records_to_destination(DummyRequest())
+
+        assert changes_count == 0
+        assert not self.storage.create.called
+        assert not self.storage.delete_all.called
+
+    def test_rollback_compares_records_page_by_page(self):
+        self._set_streaming(
+            source_records=[{"id": "a", "n": 2, "last_modified": 1}],
+            dest_records=[
+                {"id": "a", "n": 1, "last_modified": 1},
+                {"id": "b", "last_modified": 2},
+            ],
+        )
+
+        changed_count = self.updater.rollback_changes(DummyRequest(), refresh_last_edit=False)
+
+        assert changed_count == 2
+        assert not self.updater.get_source_records.called
+        self.storage.update.assert_called_with(
+            object_id="a",
+            obj={"id": "a", "n": 1, "last_modified": 1},
+            parent_id="/buckets/sourcebucket/collections/sourcecollection",
+            resource_name="record",
+        )
+        assert self.storage.create.call_count == 1
+
+    def test_rollback_does_not_depend_on_python_ordering_of_ids(self):
+        records = [{"id": "ab", "last_modified": 1}, {"id": "a_c", "last_modified": 2}]
+        self._set_streaming(
+            records, records, page_size=1, collation=lambda rid: rid.replace("_", "")
+        )
+
+        changed_count = self.updater.rollback_changes(DummyRequest(), refresh_last_edit=False)
+
+        assert changed_count == 0
+        assert not self.storage.create.called
+        assert not self.storage.delete_all.called
+
     def test_push_records_to_destination(self):
-        self.patch(self.updater, "get_destination_records", return_value=([], 1324))
+        dest_records = [{"id": idx, "foo": "baz", "last_modified": 1} for idx in range(1, 4)]
+        self.patch(self.updater, "get_destination_records", return_value=(dest_records, 1324))
         records = [
             {"id": idx, "foo": "bar %s" % idx, "last_modified": 42 - idx} for idx in range(1, 4)
         ]
@@ -84,8 +195,44 @@ class LocalUpdaterTest(unittest.TestCase):
             "resource_name": "record",
         }
 
+    def test_push_records_does_not_fetch_destination_records_one_by_one(self):
+        dest_records = [{"id": 1, "foo": "baz", "last_modified": 1}]
+        self.patch(self.updater, "get_destination_records", return_value=(dest_records, 1324))
+        records = [
+            {"id": idx, "foo": "bar %s" % idx, "last_modified": 42 - idx} for idx in range(1, 4)
+        ]
+        self.patch(self.updater, "get_source_records", return_value=(records, 1325))
+        self.updater.push_records_to_destination(DummyRequest())
+        assert not any(c[1]["resource_name"] == "record" for c in self.storage.get.call_args_list)
+        assert self.storage.update.call_count == 1
+        assert self.storage.create.call_count == 2
+
+    def test_push_records_returns_resulting_destination_records(self):
+        dest_records = [{"id": idx, "foo": "baz", "last_modified": 1} for idx in (1, 2, 3)]
+        self.patch(self.updater, "get_destination_records", return_value=(dest_records, 1324))
+        records = [
+            {"id": 1, "foo": "baz", "last_modified": 1},
+            {"id": 2, "foo": "bar", "last_modified": 2},
+            {"id": 3, "deleted": True, "last_modified": 3},
+            {"id": 4, "foo": "new", "last_modified": 4},
+        ]
+        self.patch(self.updater, "get_source_records", return_value=(records, 1325))
+        self.storage.update.side_effect = lambda obj, **kw: {**obj, "last_modified": 1326}
+        self.storage.create.side_effect = lambda obj, **kw: {**obj, "last_modified": 1327}
+        self.storage.resource_timestamp.return_value = 1328
+
+        _, dest_records, dest_timestamp = self.updater.push_records_to_destination(DummyRequest())
+
+        assert sorted(dest_records, key=lambda r: r["id"]) == [
+            {"id": 1, "foo": "baz", "last_modified": 1},
+            {"id": 2, "foo": "bar", "last_modified": 1326},
+            {"id": 4, "foo": "new", "last_modified": 1327},
+        ]
+        assert dest_timestamp == 1328
+
     def test_push_records_removes_deleted_records(self):
-        self.patch(self.updater, "get_destination_records", return_value=([], 1324))
+        dest_records = [{"id": idx, "foo": "baz", "last_modified": 1} for idx in (0, 1, 3, 4)]
+        self.patch(self.updater, "get_destination_records", return_value=(dest_records, 1324))
         records = [
             {"id": idx, "foo": "bar %s" % idx, "last_modified": 42 - idx} for idx in range(0, 2)
         ]
@@ -94,20 +241,111 @@ class LocalUpdaterTest(unittest.TestCase):
         self.updater.push_records_to_destination(DummyRequest())
         assert self.updater.get_source_records.call_count == 1
         assert self.storage.update.call_count == 2
-        assert self.storage.delete.call_count == 2
+        assert self.storage.delete_all.call_count == 1
+        _, kwargs = self.storage.delete_all.call_args
+        assert kwargs["filters"][0].value == [3, 4]
 
     def test_push_records_skip_already_deleted_records(self):
-        # In case the record doesn't exists in the destination
-        # a RecordNotFoundError is raised.
-        self.storage.delete.side_effect = RecordNotFoundError()
         self.patch(self.updater, "get_destination_records", return_value=([], 1324))
         records = [
             {"id": idx, "foo": "bar %s" % idx, "last_modified": 42 - idx} for idx in range(0, 2)
         ]
         records.extend([{"id": idx, "deleted": True, "last_modified": 42} for idx in range(3, 5)])
         self.patch(self.updater, "get_source_records", return_value=(records, 1325))
-        # Calling the updater should not raise the RecordNotFoundError.
         self.updater.push_records_to_destination(DummyRequest())
+        assert not self.storage.delete_all.called
+
+    def test_push_records_skip_records_deleted_concurrently(self):
+        # In case the record doesn't exists anymore in the destination
+        # no tombstone is returned.
+        self.storage.delete_all.return_value = []
+        dest_records = [{"id": 3, "foo": "baz", "last_modified": 1}]
+        self.patch(self.updater, "get_destination_records", return_value=(dest_records, 1324))
+        records = [{"id": 3, "deleted": True, "last_modified": 42}]
+        self.patch(self.updater, "get_source_records", return_value=(records, 1325))
+        with mock.patch("kinto_signer.updater.notify_resource_events") as mocked:
+            self.updater.push_records_to_destination(DummyRequest())
+        _, kwargs = mocked.call_args
+        assert kwargs["changes"] == []
+
+    def _set_watermark(self, source_timestamp, records_timestamp):
+        self.storage.get.return_value = {
+            "id": "destcollection",
+            "signer_watermark": {
+                "source_timestamp": source_timestamp,
+                "records_timestamp": records_timestamp,
+            },
+        }
+        self.storage.resource_timestamp.return_value = records_timestamp
+        self.patch(self.updater, "get_destination_records")
+        self.patch(self.updater, "get_source_records")
+
+    def test_push_records_only_fetches_source_changes_since_watermark(self):
+        self._set_watermark(source_timestamp=10, records_timestamp=20)
+        self.storage.list_all.side_effect = [
+            [
+                {"id": "a", "foo": "new", "last_modified": 11},
+                {"id": "b", "deleted": True, "last_modified": 12},
+                {"id": "c", "foo": "same", "last_modified": 13},
+            ],
+            [
+                {"id": "a", "foo": "old", "last_modified": 5},
+                {"id": "b", "foo": "old", "last_modified": 5},
+                {"id": "c", "foo": "same", "last_modified": 5},
+            ],
+        ]
+        self.storage.count_all.return_value = 42
+
+        changes_count, dest_records, _ = self.updater.push_records_to_destination(DummyRequest())
+
+        assert changes_count == 2
+        assert dest_records is None
+        assert not self.updater.get_source_records.called
+        assert not self.updater.get_destination_records.called
+        _, kwargs = self.storage.list_all.call_args_list[0]
+        assert kwargs["parent_id"] == "/buckets/sourcebucket/collections/sourcecollection"
+        assert kwargs["filters"][0].field == "last_modified"
+        assert kwargs["filters"][0].value == 10
+        assert kwargs["include_deleted"]
+        assert self.storage.update.call_count == 1
+        assert self.storage.delete_all.call_count == 1
+
+    def test_push_records_compares_all_records_if_destination_was_changed(self):
+        self._set_watermark(source_timestamp=10, records_timestamp=20)
+        self.storage.resource_timestamp.return_value = 21
+        self.updater.get_destination_records.return_value = ([], 21)
+        self.updater.get_source_records.return_value = ([], 21)
+
+        self.updater.push_records_to_destination(DummyRequest())
+
+        assert not self.storage.list_all.called
+        assert self.updater.get_source_records.called
+
+    def test_push_records_compares_all_records_if_counts_differ(self):
+        self._set_watermark(source_timestamp=10, records_timestamp=20)
+        self.storage.list_all.return_value = []
+        self.storage.count_all.side_effect = [3, 4]
+        self.updater.get_destination_records.return_value = ([], 20)
+        self.updater.get_source_records.return_value = ([], 20)
+
+        self.updater.push_records_to_destination(DummyRequest())
+
+        assert self.updater.get_source_records.called
+
+    def test_watermark_is_saved_with_signature(self):
+        self.storage.resource_timestamp.return_value = 42
+        self.patch(self.updater, "get_destination_records", return_value=([], 42))
+        self.patch(self.updater, "get_source_records", return_value=([], 42))
+        self.storage.get.return_value = {"id": "destcollection"}
+
+        self.updater.push_records_to_destination(DummyRequest())
+        self.updater.set_destination_signature(mock.sentinel.signature, {}, DummyRequest())
+
+        _, kwargs = self.storage.update.call_args
+        assert kwargs["obj"]["signer_watermark"] == {
+            "source_timestamp": 42,
+            "records_timestamp": 42,
+        }
 
     def test_push_records_to_destination_with_no_destination_changes(self):
         self.patch(self.updater, "get_destination_records", return_value=([], None))
@@ -117,7 +355,7 @@ class LocalUpdaterTest(unittest.TestCase):
         self.patch(self.updater, "get_source_records", return_value=(records, 1325))
         self.updater.push_records_to_destination(DummyRequest())
         assert self.updater.get_source_records.call_count == 1
-        assert self.storage.update.call_count == 3
+        assert self.storage.create.call_count == 3
 
     def test_set_destination_signature_modifies_the_destination_collection(self):
         self.storage.get.return_value = {"id": 1234, "last_modified": 1234}
@@ -199,7 +437,7 @@ class LocalUpdaterTest(unittest.TestCase):
 
         self.patch(self.storage, "update_records")
         self.patch(self.updater, "get_destination_records", return_value=([], "0"))
-        self.patch(self.updater, "push_records_to_destination")
+        self.patch(self.updater, "push_records_to_destination", return_value=(0, None, None))
         self.patch(self.updater, "set_destination_signature")
 
         self.updater.sign_and_update_destination(DummyRequest(), {"id": "source"})
@@ -208,6 +446,74 @@ class LocalUpdaterTest(unittest.TestCase):
         assert self.updater.push_records_to_destination.call_count == 1
         assert self.updater.set_destination_signature.call_count == 1
 
+    def test_sign_and_update_destination_reuses_pushed_records(self):
+        records = [{"id": "a", "last_modified": 42}]
+        self.patch(self.updater, "get_destination_records")
+        self.patch(self.updater, "push_records_to_destination", return_value=(1, records, 42))
+        self.patch(self.updater, "set_destination_signature")
+        serialize = self.patch(self.updater, "serialize_records")
+
+        self.updater.sign_and_update_destination(DummyRequest(), {"id": "source"})
+
+        assert not self.updater.get_destination_records.called
+        serialize.assert_called_with(records, 42)
+
+    def test_sign_and_update_destinations_signs_all_destinations_at_once(self):
+        self.storage.list_all.return_value = []
+        self.patch(self.updater, "get_destination_records", return_value=([], "0"))
+        self.patch(self.updater, "push_records_to_destination", return_value=(0, None, None))
+        self.patch(self.updater, "set_destination_signature")
+        preview = {"bucket": "previewbucket", "collection": "previewcollection"}
+
+        counts = self.updater.sign_and_update_destinations(
+            DummyRequest(), [preview, self.updater.destination], {"id": "source"}
+        )
+
+        assert len(counts) == 2
+        assert self.signer_instance.sign_many.call_count == 1
+        assert self.updater.set_destination_signature.call_count == 2
+        assert self.updater.destination == {
+            "bucket": "destbucket",
+            "collection": "destcollection",
+        }
+
+    def test_phases_of_signature_are_timed(self):
+        self.storage.list_all.return_value = [{"id": "a", "last_modified": 1}]
+        self.storage.resource_timestamp.return_value = 42
+        self.signer_instance.sign_many.side_effect = lambda payloads: [
+            b"".join(p) and mock.sentinel.signature for p in payloads
+        ]
+
+        self.updater.sign_and_update_destination(DummyRequest(), {"id": "source"})
+
+        assert list(self.updater.phases.durations.keys()) == [
+            "destination_listing",
+            "source_listing",
+            "diff",
+            "serialization",
+            "signer",
+            "metadata",
+            "events",
+        ]
+        assert self.updater.phases.gauges["payload_bytes"] > 0
+
+    def test_signatures_of_same_content_are_coalesced(self):
+        self.storage.list_all.return_value = []
+        self.storage.resource_timestamp.return_value = 1234
+        single_flight = mock.MagicMock()
+        single_flight.do.return_value = [mock.sentinel.shared]
+        self.patch(self.updater, "single_flight", single_flight)
+        self.patch(self.updater, "set_destination_signature")
+
+        self.updater.refresh_signature(DummyRequest(), "signed")
+
+        key = single_flight.do.call_args[0][0]
+        assert key == "/buckets/destbucket/collections/destcollection@1234"
+        self.updater.set_destination_signature.assert_called_with(
+            mock.sentinel.shared, request=mock.ANY, source_attributes={}
+        )
+        assert not self.signer_instance.sign_many.called
+
     def test_refresh_signature_does_not_push_records(self):
         self.storage.list_all.return_value = []
         self.patch(self.updater, "set_destination_signature")
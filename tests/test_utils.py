@@ -1,6 +1,8 @@
 import unittest
 
+import mock
 import pytest
+from kinto.core.events import ACTIONS
 from pyramid.exceptions import ConfigurationError
 
 from kinto_signer import utils
@@ -220,3 +222,92 @@ class ParseResourcesTest(unittest.TestCase):
         """
         with self.assertRaises(ConfigurationError):
             utils.parse_resources(raw_resources)
+
+
+class ResourcesIndexTest(unittest.TestCase):
+    def setUp(self):
+        resources = utils.parse_resources(
+            """
+            /buckets/stage -> /buckets/preview -> /buckets/prod
+            /buckets/b/collections/c -> /buckets/b/collections/c2
+            """
+        )
+        self.signers = {"/buckets/stage": mock.sentinel.stage, "/buckets/b/collections/c": None}
+        self.index = utils.ResourcesIndex(resources, self.signers)
+
+    def test_collections_configured_explicitly_are_resolved(self):
+        resource, signer = self.index.resolve("b", "c")
+        assert resource is self.index["/buckets/b/collections/c"]
+        assert signer is None
+
+    def test_collections_configured_per_bucket_are_expanded(self):
+        resource, signer = self.index.resolve("stage", "cid")
+        assert resource["source"] == {"bucket": "stage", "collection": "cid"}
+        assert resource["preview"] == {"bucket": "preview", "collection": "cid"}
+        assert resource["destination"] == {"bucket": "prod", "collection": "cid"}
+        assert signer is mock.sentinel.stage
+        assert self.index["/buckets/stage"]["source"]["collection"] is None
+
+    def test_expansions_are_memoized(self):
+        resource, _ = self.index.resolve("stage", "cid")
+        assert self.index.resolve("stage", "cid")[0] is resource
+
+    def test_collection_specific_signers_are_used(self):
+        self.signers["/buckets/stage/collections/cid"] = mock.sentinel.specific
+        _, signer = self.index.resolve("stage", "cid")
+        assert signer is mock.sentinel.specific
+
+    def test_unknown_collections_are_not_resolved(self):
+        assert self.index.resolve("b", "unknown") == (None, None)
+        assert self.index.resolve("unknown", "c") == (None, None)
+        assert ("unknown", "c") not in self.index._resolved
+
+
+class FindFloatPathsTest(unittest.TestCase):
+    def test_floats_are_found_in_nested_dicts_and_lists(self):
+        obj = {"a": 1, "b": {"c": 1.5, "d": [1, [2.0], {"e": 3.0}]}, "f": [0.5]}
+        paths = utils.find_float_paths(obj)
+        assert sorted(paths) == ["b.c", "b.d[1][0]", "b.d[2].e", "f[0]"]
+
+    def test_sibling_keys_do_not_leak_in_paths(self):
+        obj = {"a": {"x": 1}, "b": {"y": 1.0}, "c": 2.0}
+        assert sorted(utils.find_float_paths(obj)) == ["b.y", "c"]
+
+    def test_booleans_and_integers_are_not_floats(self):
+        assert utils.find_float_paths({"a": True, "b": [1, None, "1.0"]}) == []
+
+    def test_raw_json_without_float_tokens_is_detected(self):
+        assert not utils.may_contain_float(b'{"data": {"a": 1, "b": "title"}}')
+        assert utils.may_contain_float(b'{"data": {"a": 1.0}}')
+        assert utils.may_contain_float(b'{"data": {"a": 1E5}}')
+        assert utils.may_contain_float(b'{"data": {"a": "v1.0"}}')
+
+
+class RecordsEqualTest(unittest.TestCase):
+    def test_timestamp_and_schema_are_ignored(self):
+        a = {"id": "a", "title": "x", "last_modified": 1, "schema": 1}
+        assert utils.records_equal(a, {"id": "a", "title": "x", "last_modified": 2})
+        assert not utils.records_equal(a, {**a, "title": "y"})
+
+    def test_records_with_different_fields_are_not_equal(self):
+        a = {"id": "a", "last_modified": 1}
+        assert not utils.records_equal(a, {**a, "title": None})
+
+
+class NotifyResourceEventsTest(unittest.TestCase):
+    def test_one_request_is_built_per_action(self):
+        changes = [
+            (ACTIONS.CREATE, {"path": "/a"}, {"id": "a"}, {"last_modified": 1}, None),
+            (ACTIONS.UPDATE, {"path": "/b"}, {"id": "b"}, {"last_modified": 2}, {}),
+            (ACTIONS.CREATE, {"path": "/c"}, {"id": "c"}, {"last_modified": 3}, None),
+        ]
+        with mock.patch("kinto_signer.utils.build_request") as mocked:
+            utils.notify_resource_events(
+                mock.MagicMock(), "record", parent_id="/buckets/b/collections/c", changes=changes
+            )
+
+        assert mocked.call_count == 2
+        fakerequest = mocked.return_value
+        assert fakerequest.notify_resource_event.call_count == 3
+        actions = [c[1]["action"] for c in fakerequest.notify_resource_event.call_args_list]
+        assert actions == [ACTIONS.CREATE, ACTIONS.CREATE, ACTIONS.UPDATE]